@@ -0,0 +1,95 @@
+"""
+Ammissione delle prenotazioni serializzata per veicolo.
+
+Il controllo di disponibilità e l'inserimento della prenotazione devono
+avvenire sotto lo stesso lock, altrimenti due richieste concorrenti per la
+stessa moto superano entrambe il controllo. Il lock riguarda solo i veicoli
+coinvolti: prenotazioni di moto diverse procedono in parallelo.
+
+- Nel processo: un array di lock (striping) indicizzato da bike_id % stripes.
+- Tra processi: SELECT ... FOR UPDATE sulle righe di `vehicles` (MySQL,
+  PostgreSQL). SQLite non ha lock di riga: si usa BEGIN IMMEDIATE, che prende
+  il lock di scrittura dell'intero database (SQLite ha comunque un solo writer).
+
+Il commit deve avvenire dentro il blocco `with`: i lock di riga vengono
+rilasciati dal commit, quelli di processo all'uscita dal blocco.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from sqlalchemy import select, text
+
+from models import db, Vehicle
+
+logger = logging.getLogger(__name__)
+
+
+class BookingAdmission:
+    def __init__(self, stripes=64):
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self.timeout = 10.0
+
+    def configure(self, app):
+        stripes = app.config.get("BOOKING_LOCK_STRIPES", 64)
+        if stripes != len(self._stripes):
+            self._stripes = [threading.Lock() for _ in range(stripes)]
+        self.timeout = app.config.get("BOOKING_LOCK_TIMEOUT", 10.0)
+
+    def _stripe_indexes(self, bike_ids):
+        # Ordine crescente: due richieste su più veicoli non possono andare in deadlock
+        return sorted({int(bike_id) % len(self._stripes) for bike_id in bike_ids})
+
+    @staticmethod
+    def _lock_rows(bike_ids):
+        session = db.session
+        if session.get_bind().dialect.name == "sqlite":
+            # pysqlite apre la transazione solo alla prima scrittura: se non ce n'è una
+            # aperta, BEGIN IMMEDIATE parte subito senza perdere gli oggetti già caricati
+            if session.connection().connection.dbapi_connection.in_transaction:
+                session.rollback()
+            session.execute(text("BEGIN IMMEDIATE"))
+            return
+
+        # La transazione deve iniziare dal lock: con REPEATABLE READ uno snapshot preso
+        # prima non vedrebbe le prenotazioni committate da chi teneva il lock
+        session.rollback()
+        session.execute(
+            select(Vehicle.id).where(Vehicle.id.in_(sorted(set(bike_ids)))).order_by(Vehicle.id).with_for_update()
+        ).all()
+
+    @contextmanager
+    def lock_vehicles(self, bike_ids):
+        """
+        Serializza le prenotazioni dei veicoli indicati. Solleva TimeoutError
+        se il lock di processo non si ottiene entro BOOKING_LOCK_TIMEOUT.
+        """
+        acquired = []
+        started = perf_counter()
+        try:
+            for index in self._stripe_indexes(bike_ids):
+                remaining = max(self.timeout - (perf_counter() - started), 0)
+                if not self._stripes[index].acquire(timeout=remaining):
+                    raise TimeoutError("Troppe prenotazioni concorrenti per questo veicolo, riprova.")
+                acquired.append(index)
+
+            self._lock_rows(bike_ids)
+            wait_ms = (perf_counter() - started) * 1000
+            if wait_ms > 100:
+                logger.info("Attesa lock prenotazione", extra={"event": "booking.lock_wait", "wait_ms": round(wait_ms, 1)})
+
+            yield
+        finally:
+            # Dopo il commit del chiamante è un no-op; altrimenti (errore, uscita anticipata)
+            # chiude la transazione e rilascia i lock di riga prima dei lock di processo
+            db.session.rollback()
+            for index in reversed(acquired):
+                self._stripes[index].release()
+
+
+admission = BookingAdmission()
+
+
+def init_admission(app):
+    admission.configure(app)
@@ -0,0 +1,334 @@
+"""
+Analisi di utilizzo della flotta su aggregati materializzati.
+
+vehicle_daily_stats contiene, per veicolo e giorno, le ore prenotate, i
+ricavi (totale e pagato, ripartiti sui giorni in proporzione alle ore) e le
+prenotazioni iniziate quel giorno. Contano solo le prenotazioni attive.
+
+- Incrementale: un listener after_flush confronta lo stato precedente e
+  quello nuovo di ogni Booking inserita, modificata o cancellata (create,
+  submit del carrello, cancellazione, toggle del pagamento, aggiornamenti) e
+  applica i delta nella stessa transazione.
+- Ricostruzione completa (backfill, import massivi via Core): la ripartizione
+  per giorno è vettorizzata con NumPy su tutte le prenotazioni, archivio
+  incluso.
+
+Le prenotazioni archiviate (archive.py) restano negli aggregati: lo
+spostamento usa Core e non passa dal listener.
+"""
+import logging
+from datetime import date
+from time import perf_counter
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, func, inspect, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import db, Booking, BookingArchive, Vehicle, VehicleDailyStats
+
+logger = logging.getLogger(__name__)
+
+_stats = VehicleDailyStats.__table__
+_DAY = 86400
+_EPOCH = date(1970, 1, 1)
+
+TRACKED_FIELDS = ("bike_id", "start_date", "end_date", "total_price", "status", "payment_status")
+
+
+def split_by_day(bike_ids, starts, ends, prices, paid, weights=None):
+    """
+    Ripartisce N prenotazioni sui giorni che attraversano. Restituisce array
+    paralleli (bike_id, giorno dall'epoch, ore, ricavo, ricavo pagato,
+    iniziate) con una riga per coppia prenotazione/giorno. weights (+1/-1)
+    permette di sottrarre il contributo di uno stato precedente.
+    """
+    bike_ids = np.asarray(bike_ids, dtype=np.int64)
+    start_s = np.asarray(starts, dtype="datetime64[s]").astype(np.int64)
+    end_s = np.asarray(ends, dtype="datetime64[s]").astype(np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    paid = np.asarray(paid, dtype=bool)
+    weights = np.ones(bike_ids.size) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    valid = end_s > start_s
+    bike_ids, start_s, end_s = bike_ids[valid], start_s[valid], end_s[valid]
+    prices, paid, weights = prices[valid], paid[valid], weights[valid]
+
+    first_day = start_s // _DAY
+    last_day = (end_s - 1) // _DAY
+    day_counts = last_day - first_day + 1
+    rows = np.repeat(np.arange(bike_ids.size), day_counts)
+    offsets = np.arange(rows.size) - np.repeat(np.cumsum(day_counts) - day_counts, day_counts)
+    days = first_day[rows] + offsets
+
+    day_start = days * _DAY
+    seconds = np.minimum(end_s[rows], day_start + _DAY) - np.maximum(start_s[rows], day_start)
+    revenue = weights[rows] * prices[rows] * seconds / (end_s - start_s)[rows]
+    return (
+        bike_ids[rows],
+        days,
+        weights[rows] * seconds / 3600.0,
+        revenue,
+        np.where(paid[rows], revenue, 0.0),
+        np.where(offsets == 0, weights[rows], 0.0),
+    )
+
+
+def aggregate(bike_ids, days, hours, revenue, paid_revenue, started):
+    """
+    Somma le righe con la stessa coppia (veicolo, giorno).
+    """
+    if not bike_ids.size:
+        return []
+    order = np.lexsort((days, bike_ids))
+    bike_ids, days = bike_ids[order], days[order]
+    boundaries = np.flatnonzero((np.diff(bike_ids) != 0) | (np.diff(days) != 0)) + 1
+    firsts = np.concatenate(([0], boundaries))
+    sums = [np.add.reduceat(values[order], firsts) for values in (hours, revenue, paid_revenue, started)]
+    return [
+        {
+            "bike_id": int(bike_ids[i]),
+            "day": date.fromordinal(_EPOCH.toordinal() + int(days[i])),
+            "booked_hours": round(float(sums[0][k]), 4),
+            "revenue": round(float(sums[1][k]), 4),
+            "paid_revenue": round(float(sums[2][k]), 4),
+            "bookings_started": int(round(sums[3][k])),
+        }
+        for k, i in enumerate(firsts)
+    ]
+
+
+# 🔄 Manutenzione incrementale
+def _upsert(conn, rows):
+    dialect = conn.dialect.name
+    increments = ("booked_hours", "revenue", "paid_revenue", "bookings_started")
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(_stats)
+        statement = statement.on_conflict_do_update(
+            index_elements=[_stats.c.bike_id, _stats.c.day],
+            set_={name: _stats.c[name] + statement.excluded[name] for name in increments}
+        )
+        conn.execute(statement, rows)
+    elif dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(_stats)
+        statement = statement.on_duplicate_key_update(
+            {name: _stats.c[name] + statement.inserted[name] for name in increments}
+        )
+        conn.execute(statement, rows)
+    else:
+        for row in rows:
+            updated = conn.execute(
+                update(_stats)
+                .where(_stats.c.bike_id == row["bike_id"], _stats.c.day == row["day"])
+                .values({name: _stats.c[name] + row[name] for name in increments})
+            ).rowcount
+            if not updated:
+                conn.execute(insert(_stats).values(**row))
+
+
+def _values(booking, previous=False):
+    """
+    Campi rilevanti della prenotazione, nello stato attuale o in quello
+    precedente al flush (dalla history degli attributi).
+    """
+    state = inspect(booking)
+    values = {}
+    for name in TRACKED_FIELDS:
+        if previous:
+            history = state.attrs[name].history
+            if history.deleted:
+                values[name] = history.deleted[0]
+                continue
+        values[name] = getattr(booking, name)
+    return values
+
+
+def _changed(booking):
+    state = inspect(booking)
+    return any(state.attrs[name].history.has_changes() for name in TRACKED_FIELDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_booking_writes(session, flush_context):
+    if not has_app_context() or not current_app.config.get("ANALYTICS_ENABLED", True):
+        return
+
+    contributions = []  # (valori, peso)
+    for booking in session.new:
+        if isinstance(booking, Booking):
+            contributions.append((_values(booking), 1))
+    for booking in session.dirty:
+        if isinstance(booking, Booking) and _changed(booking):
+            contributions.append((_values(booking, previous=True), -1))
+            contributions.append((_values(booking), 1))
+    for booking in session.deleted:
+        if isinstance(booking, Booking):
+            contributions.append((_values(booking, previous=True), -1))
+
+    # Solo le prenotazioni attive contano
+    contributions = [
+        (values, weight) for values, weight in contributions
+        if values["status"] and values["start_date"] is not None and values["end_date"] is not None
+    ]
+    if not contributions:
+        return
+
+    rows = aggregate(*split_by_day(
+        [values["bike_id"] for values, _ in contributions],
+        [values["start_date"] for values, _ in contributions],
+        [values["end_date"] for values, _ in contributions],
+        [float(values["total_price"] or 0) for values, _ in contributions],
+        [bool(values["payment_status"]) for values, _ in contributions],
+        [weight for _, weight in contributions],
+    ))
+    if rows:
+        _upsert(session.connection(), rows)
+
+
+# 🧮 Ricostruzione completa
+def rebuild_stats(chunk_size=5000):
+    """
+    Ricalcola da zero vehicle_daily_stats da bookings e bookings_archive.
+    Restituisce il numero di righe aggregate scritte.
+    """
+    started = perf_counter()
+    columns = []
+    for model in (Booking, BookingArchive):
+        columns.extend(db.session.execute(
+            select(model.bike_id, model.start_date, model.end_date, model.total_price, model.payment_status)
+            .where(model.status == True)
+        ).all())
+
+    rows = []
+    if columns:
+        bike_ids, starts, ends, prices, paid = zip(*columns)
+        rows = aggregate(*split_by_day(
+            bike_ids, starts, ends, [float(price) for price in prices], [bool(value) for value in paid]
+        ))
+
+    db.session.execute(delete(_stats))
+    for i in range(0, len(rows), chunk_size):
+        db.session.execute(insert(_stats), rows[i:i + chunk_size])
+    db.session.commit()
+
+    logger.info("Aggregati di utilizzo ricostruiti", extra={
+        "event": "analytics.rebuild", "bookings": len(columns), "rows": len(rows),
+        "duration_ms": round((perf_counter() - started) * 1000, 1)
+    })
+    return len(rows)
+
+
+# 📊 Interrogazioni sugli aggregati
+def _range_filter(start_day, end_day, vehicle_id=None):
+    conditions = [_stats.c.day >= start_day, _stats.c.day <= end_day]
+    if vehicle_id is not None:
+        conditions.append(_stats.c.bike_id == vehicle_id)
+    return conditions
+
+
+def utilization(start_day, end_day, vehicle_id=None):
+    """
+    Ore prenotate e tasso di utilizzo per veicolo sull'intervallo di giorni
+    (estremi inclusi). Le ore disponibili sono 24 per giorno per veicolo attivo.
+    """
+    days = (end_day - start_day).days + 1
+    booked = dict(db.session.execute(
+        select(_stats.c.bike_id, func.sum(_stats.c.booked_hours))
+        .where(*_range_filter(start_day, end_day, vehicle_id))
+        .group_by(_stats.c.bike_id)
+    ).all())
+
+    vehicles_query = select(Vehicle.id, Vehicle.brand, Vehicle.model).where(Vehicle.is_active == True)
+    if vehicle_id is not None:
+        vehicles_query = select(Vehicle.id, Vehicle.brand, Vehicle.model).where(Vehicle.id == vehicle_id)
+    vehicles = db.session.execute(vehicles_query.order_by(Vehicle.id)).all()
+
+    available = days * 24
+    per_vehicle = [
+        {
+            "vehicle_id": vehicle.id,
+            "vehicle": f"{vehicle.brand} {vehicle.model}",
+            "booked_hours": round(float(booked.get(vehicle.id) or 0), 2),
+            "available_hours": available,
+            "utilization": round(float(booked.get(vehicle.id) or 0) / available, 4),
+        }
+        for vehicle in vehicles
+    ]
+    total_booked = sum(row["booked_hours"] for row in per_vehicle)
+    total_available = available * len(per_vehicle)
+    return {
+        "start_date": start_day.isoformat(),
+        "end_date": end_day.isoformat(),
+        "fleet_utilization": round(total_booked / total_available, 4) if total_available else 0.0,
+        "vehicles": per_vehicle,
+    }
+
+
+def _month(column):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m", column)
+    if dialect in ("mysql", "mariadb"):
+        return func.date_format(column, "%Y-%m")
+    return func.to_char(column, "YYYY-MM")
+
+
+def revenue(start_day, end_day, group="day", vehicle_id=None):
+    """
+    Ricavi (totale e pagato) raggruppati per giorno, mese o veicolo.
+    """
+    if group == "vehicle":
+        key = _stats.c.bike_id
+    elif group == "month":
+        key = _month(_stats.c.day)
+    else:
+        key = _stats.c.day
+
+    rows = db.session.execute(
+        select(key.label("key"), func.sum(_stats.c.revenue), func.sum(_stats.c.paid_revenue),
+               func.sum(_stats.c.bookings_started))
+        .where(*_range_filter(start_day, end_day, vehicle_id))
+        .group_by(key)
+        .order_by(key)
+    ).all()
+    series = [
+        {
+            group: row[0].isoformat() if isinstance(row[0], date) else row[0],
+            "revenue": round(float(row[1] or 0), 2),
+            "paid_revenue": round(float(row[2] or 0), 2),
+            "bookings_started": int(row[3] or 0),
+        }
+        for row in rows
+    ]
+    return {
+        "start_date": start_day.isoformat(),
+        "end_date": end_day.isoformat(),
+        "total_revenue": round(sum(item["revenue"] for item in series), 2),
+        "total_paid_revenue": round(sum(item["paid_revenue"] for item in series), 2),
+        "series": series,
+    }
+
+
+def top_vehicles(start_day, end_day, by="revenue", limit=10):
+    metric = func.sum(_stats.c.revenue if by == "revenue" else _stats.c.booked_hours)
+    rows = db.session.execute(
+        select(_stats.c.bike_id, metric.label("value"), Vehicle.brand, Vehicle.model)
+        .join(Vehicle, Vehicle.id == _stats.c.bike_id, isouter=True)
+        .where(*_range_filter(start_day, end_day))
+        .group_by(_stats.c.bike_id, Vehicle.brand, Vehicle.model)
+        .order_by(metric.desc())
+        .limit(limit)
+    ).all()
+    return [
+        {
+            "vehicle_id": row.bike_id,
+            "vehicle": f"{row.brand} {row.model}" if row.brand else "Non trovato",
+            by: round(float(row.value or 0), 2),
+        }
+        for row in rows
+    ]
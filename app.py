@@ -1,18 +1,46 @@
-from flask import Flask, send_from_directory,jsonify
+from flask import Flask, jsonify
 from config import Config
 from models import db, TokenBlacklist
-from routes import api, refresh_access_token
+from extensions import mail
+from routes import api
 from flask import request
-from flask_jwt_extended import create_access_token, get_jwt_identity
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from swagger_confing import init_swagger
-import os
+from werkzeug.exceptions import HTTPException
+from swagger_confing import init_swagger, init_spec
+from logging_config import init_logging
+from metrics import init_metrics
+from profiler import init_profiler
+from token_refresh import init_token_refresh
+from hashing import init_hashing
+from ratelimit import init_rate_limit
+from admission import init_admission
+from booking_guard import init_booking_guard
+from pricing import init_pricing
+from booking_search import init_booking_search
+from booking_lookup import init_booking_lookup
+from cache_bus import init_cache_bus
+from availability_cache import init_availability_cache
+import logging
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Logging strutturato non bloccante
+init_logging(app)
+logger = logging.getLogger(__name__)
+
 db.init_app(app)
+mail.init_app(app)
+init_hashing(app)
+init_rate_limit(app)
+init_admission(app)
+init_booking_guard(app)
+init_pricing(app)
+init_booking_search(app)
+init_booking_lookup(app)
+init_cache_bus(app)
+init_availability_cache(app)
 
 jwt = JWTManager(app)
 
@@ -23,36 +51,39 @@ def check_if_token_is_blacklisted(jwt_header, jwt_payload):
 
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):
-
-    # ✅ Ottieni il refresh token dai cookie
-    refresh_token = request.cookies.get("refresh_token")
-
-    if not refresh_token:
-        print("❌ Nessun refresh token trovato nei cookie!")
+    # Il rinnovo silenzioso (token_refresh.py) è già stato tentato in before_request:
+    # se l'access token risulta ancora scaduto, il refresh token manca o non è valido.
+    if not request.cookies.get("refresh_token"):
+        logger.info("Access token scaduto senza refresh token", extra={"event": "auth.no_refresh_token"})
         return jsonify({"error": "no_refresh_token", "message": "Nessun refresh token presente, fai il login"}), 401
 
-    try:
-        # ✅ Chiama direttamente refresh_access_token() e passa il token
-        with app.test_request_context('/api/refresh', method="POST", headers={"Cookie": f"refresh_token={refresh_token}"}):
-            response = refresh_access_token()
+    logger.warning("Refresh token non valido o scaduto", extra={"event": "auth.refresh_failed"})
+    return jsonify({"error": "invalid_refresh_token", "message": "Refresh token non valido o scaduto"}), 401
 
-        print("✅ Access token rinnovato con successo!")
-        return response
+# 🧯 Errori imprevisti delle view: un'unica risposta 500, senza il testo dell'eccezione
+@app.errorhandler(Exception)
+def unexpected_error_callback(e):
+    if isinstance(e, HTTPException):
+        return e  # 404, 405...: risposta standard di werkzeug
+    db.session.rollback()
+    logger.exception("Errore non gestito", extra={"event": "app.unhandled_error", "path": request.path})
+    return jsonify({"error": "internal_error", "message": "Errore interno del server, riprova più tardi."}), 500
 
-    except Exception as e:
-        print("❌ Errore nel refresh token:", str(e))
-        return jsonify({"error": "invalid_refresh_token", "message": "Refresh token non valido o scaduto"}), 401
+# Rinnovo silenzioso dell'access token scaduto
+init_token_refresh(app)
 
 # CORS configuration
 CORS(app, supports_credentials=True, resources={r"/*": {"origins": ["https://localhost:5173", "http://127.0.0.1:5000", "https://localhost:5176", "https://127.0.0.1:5000", "https://vivirent-react-web-production.up.railway.app"]}})
 
-# Inizializzazione Swagger
+# Inizializzazione metriche
+init_metrics(app)
+init_profiler(app)
+
+# Inizializzazione Swagger (UI opzionale)
 init_swagger(app)
 
-# Servire il file swagger.yaml
-@app.route("/swagger.yaml")
-def serve_swagger():
-    return send_from_directory(os.path.dirname(os.path.abspath(__file__)), "swagger.yaml")
+# Servire la specifica swagger.yaml / swagger.json da memoria
+init_spec(app)
 
 # Registrazione Blueprint
 app.register_blueprint(api, url_prefix='/api')
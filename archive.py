@@ -0,0 +1,76 @@
+"""
+Archiviazione delle prenotazioni chiuse (partizionamento hot/cold).
+
+Le prenotazioni restituite o cancellate, terminate da più di
+BOOKING_ARCHIVE_AFTER_DAYS giorni, vengono spostate insieme ai loro
+booking_codes in bookings_archive / booking_codes_archive. Così la tabella
+`bookings` e i suoi indici contengono solo il lavoro corrente e le letture
+di default restano piccole; lo storico si legge con include_archived.
+
+Ogni blocco copia e cancella nella stessa transazione: una riga è sempre in
+una sola delle due tabelle.
+"""
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, literal, or_, select
+
+from models import db, Booking, BookingArchive, BookingCode, BookingCodeArchive
+
+_bookings = Booking.__table__
+_codes = BookingCode.__table__
+_bookings_archive = BookingArchive.__table__
+_codes_archive = BookingCodeArchive.__table__
+
+BOOKING_COLUMNS = [column.name for column in _bookings.columns]
+CODE_COLUMNS = [column.name for column in _codes.columns]
+
+
+def closed_bookings_before(cutoff):
+    """
+    Condizione delle prenotazioni archiviabili: cancellate o restituite e
+    terminate prima di cutoff.
+    """
+    return (_bookings.c.end_date < cutoff) & or_(_bookings.c.status == False, _bookings.c.return_ == True)
+
+
+def archive_chunk(conn, cutoff, chunk_size):
+    """
+    Sposta fino a chunk_size prenotazioni chiuse (con i loro codici) nelle
+    tabelle di archivio. Restituisce il numero di prenotazioni spostate.
+    """
+    ids = conn.execute(
+        select(_bookings.c.id).where(closed_bookings_before(cutoff)).order_by(_bookings.c.id).limit(chunk_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    archived_at = datetime.utcnow()
+    conn.execute(insert(_bookings_archive).from_select(
+        BOOKING_COLUMNS + ["archived_at"],
+        select(*[_bookings.c[name] for name in BOOKING_COLUMNS], literal(archived_at)).where(_bookings.c.id.in_(ids))
+    ))
+    conn.execute(insert(_codes_archive).from_select(
+        CODE_COLUMNS,
+        select(*[_codes.c[name] for name in CODE_COLUMNS]).where(_codes.c.booking_id.in_(ids))
+    ))
+    conn.execute(delete(_codes).where(_codes.c.booking_id.in_(ids)))
+    conn.execute(delete(_bookings).where(_bookings.c.id.in_(ids)))
+    return len(ids)
+
+
+def archive_closed_bookings(after_days, chunk_size=500, pause=0.1, max_chunks=200):
+    """
+    Archivia a blocchi le prenotazioni chiuse più vecchie di after_days giorni.
+    Restituisce il numero di prenotazioni archiviate.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    archived = 0
+    for _ in range(max_chunks):
+        with db.engine.begin() as conn:
+            moved = archive_chunk(conn, cutoff, chunk_size)
+        archived += moved
+        if moved < chunk_size:
+            break
+        time.sleep(pause)  # ⏳ Lascia spazio al traffico delle richieste
+    return archived
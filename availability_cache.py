@@ -0,0 +1,175 @@
+"""
+Disponibilità della flotta per intervallo (GET /vehicles/available-range)
+con single-flight e stale-while-revalidate.
+
+Quando scade la voce di un intervallo molto richiesto, o una promozione
+porta un picco di richieste identiche, la query pesante viene eseguita una
+sola volta per worker: la prima richiesta la calcola, quelle concorrenti
+sulla stessa chiave (date già normalizzate da schemas.DateRangeQuery)
+aspettano e condividono il risultato, o l'eccezione.
+
+Ogni risultato resta fresco per AVAILABILITY_CACHE_TTL secondi, poi per
+altri AVAILABILITY_CACHE_STALE secondi viene restituito subito mentre un
+thread in background lo ricalcola (uno solo per chiave): i client non
+aspettano mai un aggiornamento. Oltre la finestra stale la voce è scaduta
+e si torna al calcolo single-flight.
+
+Una prenotazione o un veicolo modificati (cache_bus.py) scartano invece
+tutte le voci e staccano i calcoli in corso: un dato noto come sbagliato
+non viene mai servito, e la richiesta successiva passa dal calcolo
+single-flight. Nel worker che ha scritto succede al commit, negli altri al
+controllo successivo del bus.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from cache_bus import cache_bus
+from models import Vehicle
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """
+    Un calcolo in corso: chi arriva dopo aspetta l'evento e ne legge l'esito.
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlightCache:
+    """
+    LRU thread-safe chiave -> (valore, fresco fino a, stale fino a) con un solo
+    calcolo in corso per chiave. I valori sono condivisi: non vanno modificati.
+    """
+
+    def __init__(self, max_size=256, ttl=5.0, stale=60.0, wait_timeout=10.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale = stale
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()  # chiave -> [valore, fresco fino a, stale fino a]
+        self._flights = {}             # chiave -> _Flight
+        self._generation = 0           # Incrementata a ogni invalidazione
+        self._lock = threading.Lock()
+        self._app = None
+        self.stats = {"fresh": 0, "stale": 0, "miss": 0, "shared": 0, "refresh": 0}
+
+    def configure(self, app):
+        self.max_size = app.config.get("AVAILABILITY_CACHE_SIZE", 256)
+        self.ttl = app.config.get("AVAILABILITY_CACHE_TTL", 5.0)
+        self.stale = app.config.get("AVAILABILITY_CACHE_STALE", 60.0)
+        self.wait_timeout = app.config.get("AVAILABILITY_CACHE_WAIT_TIMEOUT", 10.0)
+        self._app = app
+        self.clear()
+
+    def get(self, key, compute):
+        """
+        Restituisce il valore per key, chiamando compute() al più una volta
+        alla volta per chiave in questo processo.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                if entry[1] > now:
+                    self.stats["fresh"] += 1
+                    return entry[0]
+                # ♻️ Stale: risposta immediata, ricalcolo in background se non è già in corso
+                self.stats["stale"] += 1
+                if key not in self._flights and self._app is not None:
+                    flight = self._flights[key] = _Flight(self._generation)
+                    self.stats["refresh"] += 1
+                    threading.Thread(
+                        target=self._refresh, args=(key, compute, flight),
+                        name="availability-refresh", daemon=True
+                    ).start()
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(self._generation)
+                self.stats["miss"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if leader:
+            self._run(key, compute, flight)
+        elif not flight.done.wait(self.wait_timeout):
+            # Calcolo bloccato oltre il timeout: meglio una query in più che una richiesta appesa
+            return compute()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _run(self, key, compute, flight):
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if flight.error is None:
+                    self._store(key, flight)
+            flight.done.set()
+
+    def _refresh(self, key, compute, flight):
+        with self._app.app_context():
+            self._run(key, compute, flight)
+        if flight.error is not None:
+            # La voce stale resta servita fino alla fine della sua finestra
+            logger.warning("Ricalcolo della disponibilità fallito: %s", str(flight.error),
+                           extra={"event": "availability_cache.refresh_failed"})
+
+    def _store(self, key, flight):
+        # Chiamata con il lock acquisito
+        if self.max_size <= 0 or flight.generation != self._generation:
+            return  # Invalidata durante il calcolo: il risultato può precedere la scrittura
+        now = time.monotonic()
+        self._entries[key] = [flight.value, now + self.ttl, now + self.ttl + self.stale]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Scarta tutte le voci e stacca i calcoli in corso: chi li aspetta già
+        riceve il loro esito, le richieste successive ne avviano uno nuovo.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._flights.clear()
+
+
+availability_cache = SingleFlightCache()
+
+
+def available_vehicles_in_range(start_date, end_date):
+    """
+    Veicoli disponibili nell'intervallo (lista condivisa, da non modificare).
+    """
+    return availability_cache.get(
+        (start_date, end_date),
+        lambda: Vehicle.get_available_vehicles_in_range(start_date, end_date)
+    )
+
+
+# 📣 Nuove prenotazioni, cancellazioni e modifiche alla flotta cambiano la disponibilità
+cache_bus.subscribe("booking", lambda keys: availability_cache.clear())
+cache_bus.subscribe("vehicle", lambda keys: availability_cache.clear())
+
+
+def init_availability_cache(app):
+    availability_cache.configure(app)
@@ -0,0 +1,102 @@
+"""
+Loader a livello di richiesta per le entità collegate.
+
+Le viste di dettaglio (prenotazioni dell'utente, carrello, elenchi admin)
+leggevano veicoli e clienti uno alla volta. Il loader raccoglie gli id
+richiesti (prime), li risolve con una sola query IN (...) per tipo di entità
+e memorizza il risultato, anche negativo, fino alla fine della richiesta:
+il numero di query di una vista non dipende più dal numero di righe.
+
+    loader = request_loader()
+    loader.prime(Vehicle, [item.moto_id for item in items])
+    vehicle = loader.get(Vehicle, item.moto_id)   # nessuna query aggiuntiva
+
+Le entità restituite sono quelle della sessione corrente (stessa identity
+map di Model.query.get). Fuori da una richiesta si ottiene un loader nuovo a
+ogni chiamata, senza memorizzazione condivisa.
+"""
+from flask import g, has_request_context
+
+IN_CHUNK_SIZE = 500  # Id per singola clausola IN
+
+
+class EntityLoader:
+    def __init__(self):
+        self._loaded = {}   # (modello, colonna) -> {valore: entità o None}
+        self._pending = {}  # (modello, colonna) -> set di valori da caricare
+
+    @staticmethod
+    def _normalize(value):
+        # Gli id dal JWT arrivano come stringhe
+        return int(value) if isinstance(value, str) and value.isdigit() else value
+
+    def prime(self, model, values, by="id"):
+        """
+        Registra gli id da caricare alla prossima get/get_many di quel modello.
+        """
+        key = (model, by)
+        loaded = self._loaded.setdefault(key, {})
+        pending = self._pending.setdefault(key, set())
+        for value in values:
+            value = self._normalize(value)
+            if value is not None and value not in loaded:
+                pending.add(value)
+
+    def _resolve(self, key):
+        pending = self._pending.get(key)
+        if not pending:
+            return
+        model, by = key
+        column = getattr(model, by)
+        loaded = self._loaded[key]
+        values = list(pending)
+        pending.clear()
+        for i in range(0, len(values), IN_CHUNK_SIZE):
+            chunk = values[i:i + IN_CHUNK_SIZE]
+            for entity in model.query.filter(column.in_(chunk)).all():
+                # Su colonne non univoche vale la prima riga, come con .first()
+                loaded.setdefault(getattr(entity, by), entity)
+            for value in chunk:
+                loaded.setdefault(value, None)
+
+    def get(self, model, value, by="id"):
+        value = self._normalize(value)
+        if value is None:
+            return None
+        self.prime(model, [value], by)
+        self._resolve((model, by))
+        return self._loaded[(model, by)].get(value)
+
+    def get_many(self, model, values, by="id"):
+        """
+        Entità nello stesso ordine dei valori (None per quelli inesistenti).
+        """
+        values = [self._normalize(value) for value in values]
+        self.prime(model, values, by)
+        self._resolve((model, by))
+        loaded = self._loaded[(model, by)]
+        return [loaded.get(value) for value in values]
+
+    def forget(self, model, value=None, by="id"):
+        """
+        Scarta i risultati memorizzati (dopo una cancellazione o creazione).
+        """
+        loaded = self._loaded.get((model, by))
+        if loaded is None:
+            return
+        if value is None:
+            loaded.clear()
+        else:
+            loaded.pop(self._normalize(value), None)
+
+
+def request_loader():
+    """
+    Loader della richiesta corrente (creato al primo utilizzo).
+    """
+    if not has_request_context():
+        return EntityLoader()
+    loader = g.get("_entity_loader")
+    if loader is None:
+        loader = g._entity_loader = EntityLoader()
+    return loader
@@ -0,0 +1,132 @@
+"""
+Richieste identiche concorrenti su GET /vehicles/available-range: query
+eseguita da ogni richiesta (implementazione precedente) contro il
+single-flight con stale-while-revalidate di availability_cache.py.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.availability_stampede --threads 32 --waves 20
+
+Ogni ondata fa partire insieme (barriera) --threads richieste sullo stesso
+intervallo, come alla scadenza di una voce molto richiesta. Prima di ogni
+ondata la cache viene svuotata, così la versione nuova non risponde mai
+solo dalla memoria. Si riportano le query di disponibilità
+eseguite e la latenza delle richieste; alla fine si misura una richiesta su
+una voce stale, che non deve aspettare il ricalcolo, e si controlla che i
+thread terminati non lascino frammenti di metriche (esce con codice 1).
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from time import perf_counter
+
+
+def run_waves(app, fn, threads, waves, before_wave):
+    latencies = []
+    lock = threading.Lock()
+    for wave in range(waves):
+        before_wave(wave)
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            with app.app_context():
+                barrier.wait()
+                started = perf_counter()
+                fn()
+                elapsed = perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+    latencies.sort()
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Richieste identiche concorrenti sulla disponibilità per intervallo.")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--waves", type=int, default=20)
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="vivirent-stampede-"), "stampede.db")
+    os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("RATELIMIT_ENABLED", "false")
+
+    from sqlalchemy import event
+
+    from app import app
+    from availability_cache import availability_cache, available_vehicles_in_range
+    from benchmarks.seed import build_dataset
+    from metrics import registry
+    from models import db, Vehicle, AVAILABLE_VEHICLES_STMT
+
+    start = datetime(2030, 6, 1, 9, 0, 0)
+    end = start + timedelta(days=3)
+    queries = [0]
+
+    with app.app_context():
+        build_dataset(users=50, vehicles=40, bookings=args.bookings, cart_items=0, seed=args.seed)
+        engine = db.engine
+        marker = str(AVAILABLE_VEHICLES_STMT.compile(dialect=engine.dialect)).split("\n")[0]
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith(marker):
+                queries[0] += 1
+
+    def invalidate(wave):
+        # Voce oltre la finestra stale: ogni ondata parte da un miss
+        availability_cache.clear()
+
+    cases = [
+        ("query per richiesta", lambda: Vehicle.get_available_vehicles_in_range(start, end)),
+        ("single-flight", lambda: available_vehicles_in_range(start, end)),
+    ]
+    total = args.threads * args.waves
+    print(f"{args.waves} ondate × {args.threads} richieste identiche ({total} richieste)\n")
+    print(f"{'versione':<22}{'query':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, fn in cases:
+        queries[0] = 0
+        latencies = run_waves(app, fn, args.threads, args.waves, invalidate)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{name:<22}{queries[0]:>8}{statistics.median(latencies) * 1e3:>10.2f}"
+              f"{p95 * 1e3:>10.2f}{latencies[-1] * 1e3:>10.2f}")
+
+    # ♻️ Stale-while-revalidate: la voce scaduta risponde subito, il ricalcolo va in background
+    with app.app_context():
+        availability_cache.clear()
+        ttl, availability_cache.ttl = availability_cache.ttl, 0.0  # Voce che nasce già scaduta (ma nella finestra stale)
+        available_vehicles_in_range(start, end)
+        availability_cache.ttl = ttl
+        started = perf_counter()
+        available_vehicles_in_range(start, end)
+        stale_ms = (perf_counter() - started) * 1e3
+        started = perf_counter()
+        Vehicle.get_available_vehicles_in_range(start, end)
+        query_ms = (perf_counter() - started) * 1e3
+    deadline = time.monotonic() + 5
+    while availability_cache._flights and time.monotonic() < deadline:
+        time.sleep(0.01)
+    print(f"\nRichiesta su voce stale: {stale_ms:.2f} ms (query diretta: {query_ms:.2f} ms)")
+    print(f"Esiti della cache: {availability_cache.stats}")
+
+    # 🧹 Ogni thread delle ondate ha eseguito SQL: i suoi contatori devono essere già ritirati
+    shards = len(registry._shards)
+    print(f"Frammenti di metriche vivi: {shards} (thread attivi: {threading.active_count()})")
+    if shards > threading.active_count():
+        print("❌ I thread terminati lasciano frammenti di metriche.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
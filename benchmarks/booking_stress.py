@@ -0,0 +1,115 @@
+"""
+Stress test dell'ammissione delle prenotazioni (POST /api/booking).
+
+Uso (dalla root del progetto):
+    python -m benchmarks.booking_stress --threads 16 --attempts 40 --vehicles 4
+
+Molti thread, ognuno con un utente diverso, prenotano a caso finestre che si
+sovrappongono sugli stessi pochi veicoli. Al termine si verifica con una
+self-join SQL che non esista alcuna coppia di prenotazioni attive
+sovrapposte sulla stessa moto, e si riporta il throughput.
+Esce con codice 1 se trova sovrapposizioni.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from time import perf_counter
+
+OVERLAP_SQL = """
+SELECT COUNT(*) FROM bookings a JOIN bookings b
+  ON a.bike_id = b.bike_id AND a.id < b.id
+ AND a.status = 1 AND b.status = 1
+ AND a.start_date <= b.end_date AND b.start_date <= a.end_date
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress test delle prenotazioni concorrenti.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--attempts", type=int, default=40, help="Tentativi di prenotazione per thread")
+    parser.add_argument("--vehicles", type=int, default=4, help="Veicoli contesi (pochi = più conflitti)")
+    parser.add_argument("--slots", type=int, default=30, help="Giorni su cui distribuire le finestre")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="vivirent-stress-"), "stress.db")
+    os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("RATELIMIT_ENABLED", "false")
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+    from sqlalchemy import text
+    from app import app
+    from models import db
+    from benchmarks.seed import build_dataset, BENCH_PASSWORD
+    from benchmarks.load_test import _login
+
+    with app.app_context():
+        build_dataset(users=args.threads + 2, vehicles=args.vehicles, bookings=0, cart_items=0, seed=args.seed)
+
+    with app.app_context():
+        from models import Vehicle
+        rates = {vehicle.id: float(vehicle.price_per_hour) for vehicle in Vehicle.query.all()}
+
+    base = datetime(2040, 1, 1, 8, 0, 0)
+    outcomes = Counter()
+    outcomes_lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        client = app.test_client()
+        # Un utente per thread: il controllo sui conflitti dello stesso cliente non maschera la corsa
+        _login(client, f"user{index + 3}@vivirent.test", BENCH_PASSWORD)
+        local = Counter()
+        barrier.wait()
+        for _ in range(args.attempts):
+            start = base + timedelta(days=rng.randint(0, args.slots), hours=rng.randint(0, 10))
+            hours = rng.randint(2, 72)
+            end = start + timedelta(hours=hours)
+            bike_id = rng.randint(1, args.vehicles)
+            response = client.post("/api/booking", json={
+                "bike_id": bike_id,
+                "start_date": start.strftime("%Y-%m-%d %H:%M:%S"),
+                "end_date": end.strftime("%Y-%m-%d %H:%M:%S"),
+                "total_price": round(rates[bike_id] * hours, 2),
+                "dl_type": "A",
+                "dl_expiration": "2045-01-01",
+                "dl_number": f"DL{index:06d}"
+            })
+            local[response.status_code] += 1
+        with outcomes_lock:
+            outcomes.update(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    with app.app_context():
+        overlaps = db.session.execute(text(OVERLAP_SQL)).scalar()
+        created = db.session.execute(text("SELECT COUNT(*) FROM bookings")).scalar()
+
+    total = sum(outcomes.values())
+    print(f"richieste      {total}")
+    print(f"esiti          {dict(sorted(outcomes.items()))}")
+    print(f"prenotazioni   {created}")
+    print(f"secondi        {elapsed:.2f}")
+    print(f"throughput     {total / elapsed:.1f} req/s")
+    print(f"sovrapposizioni {overlaps}")
+    if overlaps:
+        print("❌ Trovate prenotazioni sovrapposte sulla stessa moto.")
+        return 1
+    print("✅ Nessuna sovrapposizione.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+Generatore di dati sintetici realistici per lo schema di models.py.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.generate_data --db sqlite:////tmp/vivirent.db \\
+        --vehicles 500 --customers 200000 --history-days 1095
+
+Il campionamento è vettoriale (NumPy) e le righe vengono caricate a blocchi
+con insert() di SQLAlchemy Core (executemany), senza creare oggetti ORM.
+Le distribuzioni imitano la produzione:
+- popolarità dei veicoli asimmetrica (Zipf),
+- densità stagionale delle prenotazioni (picco estivo e weekend),
+- prenotazioni cancellate (status=False), pagate e non pagate,
+  senza sovrapposizioni tra prenotazioni attive dello stesso veicolo,
+- carrelli con più prodotti,
+- token revocati distribuiti negli ultimi 60 giorni.
+"""
+import argparse
+import json
+import sys
+import uuid
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+from sqlalchemy import create_engine, event
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Vehicle, Cart, CartItem, Booking, BookingCode, BookingCodeIndex, TokenBlacklist
+
+NAMES = np.array(["Mario", "Luigi", "Giulia", "Anna", "Marco", "Sara", "Paolo", "Elena", "Luca", "Chiara",
+                  "Francesco", "Martina", "Alessandro", "Sofia", "Andrea", "Aurora"])
+SURNAMES = np.array(["Rossi", "Bianchi", "Verdi", "Russo", "Ferrari", "Esposito", "Romano", "Colombo",
+                     "Ricci", "Marino", "Greco", "Bruno", "Gallo", "Conti", "De Luca", "Costa"])
+PLACES = np.array(["Roma", "Milano", "Napoli", "Torino", "Firenze", "Bologna", "Bari", "Palermo"])
+BRANDS = np.array(["Ducati", "Honda", "Yamaha", "BMW", "Kawasaki", "Triumph", "KTM", "Aprilia"])
+MODELS = np.array(["Monster", "CB500F", "MT-07", "R1250GS", "Z900", "Trident", "Duke 390", "Tuareg"])
+LICENSES = np.array(["A", "A1", "A2"])
+SIZES = np.array(["S", "M", "L", "XL"])
+
+# ⏱️ Durate tipiche dei noleggi (ore) e relative probabilità
+DURATIONS = np.array([4, 8, 24, 48, 72, 168])
+DURATION_WEIGHTS = np.array([0.20, 0.25, 0.25, 0.15, 0.10, 0.05])
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+
+
+def _affine_codes(indices, salt):
+    """
+    Codici a 8 cifre univoci senza campionare senza reinserimento:
+    (a * i + b) mod 10^8 è una biiezione quando a è coprimo con 10^8.
+    """
+    a = 48271 + 2 * salt  # dispari e non multiplo di 5
+    if a % 5 == 0:
+        a += 2
+    return (a * indices.astype(np.int64) + 7919 * (salt + 1)) % 10**8
+
+
+def _seasonal_day_weights(start, days):
+    day_index = np.arange(days)
+    dates = np.datetime64(start, "D") + day_index
+    day_of_year = (dates - dates.astype("datetime64[Y]")).astype(np.int64)
+    weekday = (dates.astype(np.int64) + 3) % 7  # 0 = lunedì
+
+    # 🌞 Picco a metà luglio, minimo in inverno; weekend più richiesti
+    seasonal = 1.0 + 0.8 * np.cos(2 * np.pi * (day_of_year - 196) / 365.25)
+    weekend = np.where(weekday >= 5, 1.4, 1.0)
+    weights = seasonal * weekend
+    return weights / weights.sum()
+
+
+def _to_rows(columns):
+    keys = list(columns)
+    values = [columns[key].tolist() if isinstance(columns[key], np.ndarray) else columns[key] for key in keys]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+class BulkLoader:
+    def __init__(self, engine, batch_size):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.counts = {}
+
+    def load(self, model, columns, total):
+        table = model.__table__
+        with self.engine.begin() as conn:
+            for offset in range(0, total, self.batch_size):
+                chunk = {
+                    key: value[offset:offset + self.batch_size]
+                    for key, value in columns.items()
+                }
+                conn.execute(table.insert(), _to_rows(chunk))
+        self.counts[table.name] = self.counts.get(table.name, 0) + total
+
+
+def generate(engine, vehicles=200, customers=50000, history_days=730, future_days=120,
+             bookings_per_vehicle_day=0.25, cart_fraction=0.15, revoked_tokens=20000,
+             cancel_rate=0.08, batch_size=10000, seed=42, now=None):
+    """
+    Popola il database indicato da `engine` e restituisce il numero di righe per tabella.
+    """
+    rng = np.random.default_rng(seed)
+    now = np.datetime64(now or datetime.utcnow().replace(microsecond=0), "s")
+    history_start = (now.astype("datetime64[D]") - np.timedelta64(history_days, "D")).astype("datetime64[s]")
+    loader = BulkLoader(engine, batch_size)
+
+    db.metadata.create_all(engine)
+
+    # 👥 Utenti: id 1 è l'amministratore
+    user_ids = np.arange(1, customers + 2)
+    password_hash = generate_password_hash("password123")
+    register_offsets = rng.integers(0, history_days * SECONDS_PER_DAY, size=user_ids.size)
+    loader.load(User, {
+        "id": user_ids,
+        "name": rng.choice(NAMES, size=user_ids.size),
+        "surname": rng.choice(SURNAMES, size=user_ids.size),
+        "password": [password_hash] * user_ids.size,
+        "email": [f"cliente{i}@example.com" for i in user_ids.tolist()],
+        "role": np.where(user_ids == 1, "admin", "user"),
+        "bday": np.datetime64("1960-01-01") + rng.integers(0, 40 * 365, size=user_ids.size).astype("timedelta64[D]"),
+        "place": rng.choice(PLACES, size=user_ids.size),
+        "register_ts": history_start + register_offsets.astype("timedelta64[s]")
+    }, user_ids.size)
+
+    # 🏍️ Flotta
+    vehicle_ids = np.arange(1, vehicles + 1)
+    model_index = rng.integers(0, BRANDS.size, size=vehicles)
+    price_per_hour = np.round(rng.gamma(4.0, 3.5, size=vehicles) + 5, 2)
+    loader.load(Vehicle, {
+        "id": vehicle_ids,
+        "vehicle_type": ["motorbike"] * vehicles,
+        "brand": BRANDS[model_index],
+        "model": MODELS[model_index],
+        "year": rng.integers(2012, 2026, size=vehicles),
+        "price_per_hour": price_per_hour,
+        "license_plate": [f"GX{i:06d}" for i in vehicle_ids.tolist()],
+        "driving_license": rng.choice(LICENSES, size=vehicles, p=[0.6, 0.15, 0.25]),
+        "power": [f"{p} CV" for p in rng.integers(15, 200, size=vehicles).tolist()],
+        "engine_size": np.round(rng.uniform(0.1, 1.3, size=vehicles), 1),
+        "fuel_type": ["Benzina"] * vehicles,
+        "is_active": rng.random(vehicles) > 0.03,
+        "description": [None] * vehicles,
+        "image_url": [None] * vehicles,
+        "deposit": rng.choice(np.array([50.0, 100.0, 150.0, 200.0, 300.0]), size=vehicles)
+    }, vehicles)
+
+    # 📅 Prenotazioni: giorno stagionale, veicolo con popolarità Zipf
+    total_days = history_days + future_days
+    n_bookings = int(vehicles * total_days * bookings_per_vehicle_day)
+    day_weights = _seasonal_day_weights(history_start, total_days)
+    popularity = 1.0 / np.arange(1, vehicles + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+
+    bike_ids = rng.choice(vehicle_ids, size=n_bookings, p=popularity)
+    start_days = rng.choice(total_days, size=n_bookings, p=day_weights)
+    start_hours = rng.integers(8, 19, size=n_bookings)
+    durations = rng.choice(DURATIONS, size=n_bookings, p=DURATION_WEIGHTS)
+
+    start_ts = (history_start.astype(np.int64) + start_days * SECONDS_PER_DAY
+                + start_hours * SECONDS_PER_HOUR)
+    end_ts = start_ts + durations * SECONDS_PER_HOUR
+
+    # 🔄 Ordina per (veicolo, inizio) e scarta le richieste che si sovrappongono a una precedente
+    order = np.lexsort((start_ts, bike_ids))
+    bike_ids, start_ts, end_ts, durations = bike_ids[order], start_ts[order], end_ts[order], durations[order]
+
+    # Massimo cumulativo delle fine precedenti, separato per veicolo con un offset per gruppo
+    base = start_ts.min()
+    span = int(end_ts.max() - base) + 1
+    shifted_start = start_ts - base + bike_ids.astype(np.int64) * span
+    shifted_end = end_ts - base + bike_ids.astype(np.int64) * span
+    previous_end = np.empty_like(shifted_end)
+    previous_end[0] = -1
+    previous_end[1:] = np.maximum.accumulate(shifted_end)[:-1]
+    # Sovrapposizione inclusiva come nel vincolo del database (booking_guard.py): anche gli estremi coincidenti
+    keep = shifted_start > previous_end
+
+    bike_ids, start_ts, end_ts, durations = bike_ids[keep], start_ts[keep], end_ts[keep], durations[keep]
+    n_bookings = bike_ids.size
+
+    status = rng.random(n_bookings) > cancel_rate
+    now_ts = now.astype(np.int64)
+    is_past = end_ts < now_ts
+    payment_status = np.where(is_past, rng.random(n_bookings) < 0.95, rng.random(n_bookings) < 0.4) & status
+    pickup = status & (start_ts < now_ts)
+    return_ = status & is_past
+
+    booking_ids = np.arange(1, n_bookings + 1)
+    rates = price_per_hour[bike_ids - 1]
+    total_price = np.round(rates * durations, 2)
+    created_ts = start_ts - rng.integers(1, 45, size=n_bookings) * SECONDS_PER_DAY
+    # Le due forme di codice condividono lo spazio a 8 cifre: indici distinti della stessa biiezione
+    booking_codes = _affine_codes(booking_ids, 0)
+    generated_codes = _affine_codes(booking_ids + n_bookings, 0)
+
+    loader.load(Booking, {
+        "id": booking_ids,
+        "bike_id": bike_ids,
+        "customer_id": rng.integers(2, customers + 2, size=n_bookings),
+        "start_date": start_ts.astype("datetime64[s]"),
+        "end_date": end_ts.astype("datetime64[s]"),
+        "total_price": total_price,
+        "status": status,
+        "payment_status": payment_status,
+        "created_at": created_ts.astype("datetime64[s]"),
+        "last_update": np.minimum(start_ts, now_ts).astype("datetime64[s]"),
+        "accessories": ["[]"] * n_bookings,
+        "dl_type": rng.choice(LICENSES, size=n_bookings),
+        "dl_expiration": (now + np.timedelta64(365, "D")).astype("datetime64[D]").repeat(n_bookings),
+        "dl_number": [f"DL{i:08d}" for i in booking_ids.tolist()],
+        "helmet_size": rng.choice(SIZES, size=n_bookings),
+        "gloves_size": rng.choice(SIZES, size=n_bookings),
+        "pickup": pickup,
+        "return_": return_,
+        "booking_code": np.char.zfill(booking_codes.astype(str), 8)
+    }, n_bookings)
+
+    loader.load(BookingCode, {
+        "booking_id": booking_ids,
+        "generated_code": generated_codes
+    }, n_bookings)
+
+    # 🗂️ Indice unico dei codici (booking_lookup.py): Core non passa dagli eventi ORM che lo mantengono
+    loader.load(BookingCodeIndex, {
+        "code": np.concatenate([generated_codes, booking_codes]),
+        "booking_id": np.concatenate([booking_ids, booking_ids]),
+        "source": ["generated"] * n_bookings + ["booking"] * n_bookings
+    }, 2 * n_bookings)
+
+    # 🛒 Un carrello per utente (come alla registrazione), alcuni con più prodotti
+    cart_ids = user_ids
+    loader.load(Cart, {
+        "cart_id": cart_ids,
+        "user_id": user_ids,
+        "items_id_list": ["[]"] * cart_ids.size,
+        "final_price": np.zeros(cart_ids.size),
+        "status": ["active"] * cart_ids.size,
+        "created_at": history_start + register_offsets.astype("timedelta64[s]"),
+        "updated_at": history_start + register_offsets.astype("timedelta64[s]")
+    }, cart_ids.size)
+
+    with_items = cart_ids[rng.random(cart_ids.size) < cart_fraction]
+    items_per_cart = rng.poisson(1.2, size=with_items.size) + 1
+    item_cart_ids = np.repeat(with_items, items_per_cart)
+    n_items = item_cart_ids.size
+    item_bikes = rng.choice(vehicle_ids, size=n_items, p=popularity)
+    item_start = now_ts + rng.integers(1, future_days + 1, size=n_items) * SECONDS_PER_DAY + 9 * SECONDS_PER_HOUR
+    item_hours = rng.choice(DURATIONS, size=n_items, p=DURATION_WEIGHTS)
+    loader.load(CartItem, {
+        "cart_id": item_cart_ids,
+        "moto_id": item_bikes,
+        "start_date": item_start.astype("datetime64[s]"),
+        "end_date": (item_start + item_hours * SECONDS_PER_HOUR).astype("datetime64[s]"),
+        "price": np.round(price_per_hour[item_bikes - 1] * item_hours, 2),
+        "accessories": [json.dumps([])] * n_items,
+        "created_at": (now_ts - rng.integers(0, 30 * SECONDS_PER_DAY, size=n_items)).astype("datetime64[s]")
+    }, n_items)
+
+    # 🔒 Token revocati negli ultimi 60 giorni (una parte oltre la soglia di pulizia)
+    loader.load(TokenBlacklist, {
+        "id": np.arange(1, revoked_tokens + 1),
+        "jti": [str(uuid.UUID(int=int(x))) for x in rng.integers(0, 2**63, size=revoked_tokens, dtype=np.int64)],
+        "created_at": (now_ts - rng.integers(0, 60 * SECONDS_PER_DAY, size=revoked_tokens)).astype("datetime64[s]")
+    }, revoked_tokens)
+
+    return loader.counts
+
+
+def _sqlite_fast_pragmas(engine):
+    # ⚡ Solo per il caricamento: niente fsync e journal in memoria
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA journal_mode=MEMORY")
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera dati sintetici per ViviRent.")
+    parser.add_argument("--db", required=True, help="URI SQLAlchemy del database di destinazione")
+    parser.add_argument("--vehicles", type=int, default=200, help="Dimensione della flotta")
+    parser.add_argument("--customers", type=int, default=50000, help="Numero di clienti")
+    parser.add_argument("--history-days", type=int, default=730, help="Giorni di storico delle prenotazioni")
+    parser.add_argument("--future-days", type=int, default=120)
+    parser.add_argument("--bookings-per-vehicle-day", type=float, default=0.25,
+                        help="Richieste di prenotazione per veicolo al giorno (le sovrapposte vengono scartate)")
+    parser.add_argument("--cart-fraction", type=float, default=0.15)
+    parser.add_argument("--revoked-tokens", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="Elimina e ricrea le tabelle prima del caricamento")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.db)
+    if engine.dialect.name == "sqlite":
+        _sqlite_fast_pragmas(engine)
+    if args.drop:
+        db.metadata.drop_all(engine)
+
+    started = perf_counter()
+    counts = generate(
+        engine,
+        vehicles=args.vehicles,
+        customers=args.customers,
+        history_days=args.history_days,
+        future_days=args.future_days,
+        bookings_per_vehicle_day=args.bookings_per_vehicle_day,
+        cart_fraction=args.cart_fraction,
+        revoked_tokens=args.revoked_tokens,
+        batch_size=args.batch_size,
+        seed=args.seed
+    )
+    elapsed = perf_counter() - started
+
+    total = sum(counts.values())
+    for table, count in counts.items():
+        print(f"{table:<16}{count:>12}")
+    print(f"✅ {total} righe caricate in {elapsed:.1f}s ({total / elapsed:.0f} righe/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Benchmark dei flussi critici di ViviRent contro l'app WSGI reale.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.load_test --iterations 200
+    python -m benchmarks.load_test --update-baseline
+
+Per ogni flusso vengono registrati throughput e latenze p50/p95/p99.
+Il risultato viene confrontato con benchmarks/baseline.json: se un flusso
+peggiora oltre la tolleranza il processo esce con codice 1.
+I tempi dipendono dalla macchina: la baseline va rigenerata con
+--update-baseline sulla stessa macchina (o runner CI) che esegue il confronto.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3)
+    }
+
+
+def _login(client, email, password):
+    response = client.post("/api/login", json={"email": email, "password": password})
+    if response.status_code != 200:
+        raise RuntimeError(f"Login fallito per {email}: {response.status_code}")
+
+
+def _expect(name, response, status):
+    # Un 4xx (prezzo rifiutato, overlap, validazione) non è una risposta veloce: il flusso è rotto
+    if response.status_code != status:
+        raise RuntimeError(f"Il flusso '{name}' ha restituito {response.status_code} invece di {status}")
+
+
+def run_flows(app, iterations, warmup=5):
+    from benchmarks.seed import ADMIN_EMAIL, CUSTOMER_EMAIL, BENCH_PASSWORD
+
+    customer = app.test_client()
+    admin = app.test_client()
+    _login(customer, CUSTOMER_EMAIL, BENCH_PASSWORD)
+    _login(admin, ADMIN_EMAIL, BENCH_PASSWORD)
+
+    far_future = datetime(2040, 1, 1, 9, 0, 0)
+
+    # 💶 Prezzi coerenti con il listino: il server verifica quelli inviati dal client
+    with app.app_context():
+        from models import Vehicle
+        rates = {vehicle.id: float(vehicle.price_per_hour) for vehicle in Vehicle.query.all()}
+
+    def slot(i):
+        start = far_future + timedelta(days=3 * i)
+        return start, start + timedelta(hours=24)
+
+    def login(i):
+        return app.test_client().post("/api/login", json={"email": CUSTOMER_EMAIL, "password": BENCH_PASSWORD})
+
+    def catalog(i):
+        return customer.get("/api/vehicles")
+
+    def availability(i):
+        start, end = slot(i)
+        return customer.post("/api/check-moto-availability", json={
+            "moto_id": 1 + i % 10,
+            "start_date": start.strftime("%Y-%m-%d %H:%M:%S"),
+            "end_date": end.strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+    def availability_range(i):
+        start, end = slot(i % 20)
+        return customer.get(
+            f"/api/vehicles/available-range?start_date={start.isoformat()}&end_date={end.isoformat()}"
+        )
+
+    def add_to_cart(i):
+        start, end = slot(i)
+        return customer.post("/api/cart", json={
+            "moto_id": 1 + i % 10,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "price": round(rates[1 + i % 10] * (end - start).total_seconds() / 3600, 2)
+        })
+
+    def admin_all_bookings(i):
+        return admin.get("/api/all-bookings")
+
+    def admin_users(i):
+        return admin.get("/api/users")
+
+    # 🐢 I listing admin restituiscono l'intera tabella: meno iterazioni
+    admin_iterations = max(5, iterations // 10)
+    # (nome, richiesta, iterazioni, status atteso)
+    flows = [
+        ("login", login, iterations, 200),
+        ("catalog", catalog, iterations, 200),
+        ("availability", availability, iterations, 200),
+        ("availability_range", availability_range, iterations, 200),
+        ("add_to_cart", add_to_cart, iterations, 200),
+        ("admin_all_bookings", admin_all_bookings, admin_iterations, 200),
+        ("admin_users", admin_users, admin_iterations, 200),
+    ]
+
+    results = {}
+    for name, request_fn, count, status in flows:
+        # 🧹 Parte sempre da un carrello vuoto, così ogni run è confrontabile
+        customer.delete("/api/cart/clear")
+        for i in range(warmup):
+            _expect(name, request_fn(count + i), status)  # 🔥 Riscaldamento: cache, pool e import lazy
+        latencies = []
+        started = perf_counter()
+        for i in range(count):
+            t0 = perf_counter()
+            response = request_fn(i)
+            latencies.append(perf_counter() - t0)
+            _expect(name, response, status)
+        results[name] = summarize(latencies, perf_counter() - started)
+
+    # 🛒 Checkout: aggiunta + submit, si cronometra solo il submit
+    customer.delete("/api/cart/clear")
+    latencies = []
+    started = perf_counter()
+    for i in range(iterations):
+        _expect("checkout", add_to_cart(iterations + i), 200)
+        t0 = perf_counter()
+        response = customer.post("/api/cart/submit", json={})
+        latencies.append(perf_counter() - t0)
+        _expect("checkout", response, 200)
+        customer.delete("/api/cart/clear")
+    results["checkout"] = summarize(latencies, perf_counter() - started)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Restituisce la lista delle regressioni: p95 più alto o throughput più basso
+    della baseline oltre la tolleranza relativa.
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get("flows", {}).get(name)
+        if not reference:
+            continue
+        if current["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms > baseline {reference['p95_ms']}ms")
+        if current["throughput_rps"] < reference["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput_rps']} rps < baseline {reference['throughput_rps']} rps"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dei flussi critici di ViviRent.")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--vehicles", type=int, default=50)
+    parser.add_argument("--bookings", type=int, default=2000)
+    parser.add_argument("--cart-items", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Peggioramento relativo ammesso (0.5 = 50%%)")
+    parser.add_argument("--warmup", type=int, default=5, help="Richieste non cronometrate prima di ogni flusso")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    parser.add_argument("--output", help="File JSON in cui salvare i risultati")
+    args = parser.parse_args(argv)
+
+    # 🗄️ Il database va impostato prima di importare l'app (Config legge l'env all'import)
+    db_path = os.path.join(tempfile.mkdtemp(prefix="vivirent-bench-"), "bench.db")
+    os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    # Il flusso di login ripete lo stesso utente dallo stesso IP: misuriamo l'app, non il limiter
+    os.environ.setdefault("RATELIMIT_ENABLED", "false")
+
+    from app import app
+    from benchmarks.seed import build_dataset
+
+    with app.app_context():
+        build_dataset(
+            users=args.users, vehicles=args.vehicles, bookings=args.bookings,
+            cart_items=args.cart_items, seed=args.seed
+        )
+
+    results = run_flows(app, args.iterations, args.warmup)
+    report = {
+        "dataset": {
+            "users": args.users, "vehicles": args.vehicles, "bookings": args.bookings,
+            "cart_items": args.cart_items, "seed": args.seed, "iterations": args.iterations
+        },
+        "flows": results
+    }
+
+    print(f"{'flusso':<22}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in results.items():
+        print(f"{name:<22}{stats['throughput_rps']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Baseline aggiornata: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("⚠️ Nessuna baseline trovata, esegui con --update-baseline.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    if baseline.get("dataset") != report["dataset"]:
+        print("⚠️ Il dataset è diverso da quello della baseline, il confronto potrebbe non essere significativo.")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("❌ Regressioni di performance:")
+        for line in regressions:
+            print(f" - {line}")
+        return 1
+
+    print("✅ Nessuna regressione rispetto alla baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Costo per chiamata delle query calde dei modelli: Query costruita a ogni
+chiamata (implementazione precedente) contro statement precompilati.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.query_overhead --calls 5000
+
+Per ogni query si misura il tempo medio per chiamata (esecuzione su SQLite
+compresa) nelle due versioni, sugli stessi parametri. Alla fine si riporta
+l'esito della cache di compilazione di SQLAlchemy durante la versione
+precompilata (contatori di metrics.py).
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+
+
+def legacy_queries():
+    """
+    Le query come erano scritte prima degli statement precompilati.
+    """
+    from sqlalchemy import or_
+    from models import db, Booking, CartItem, TokenBlacklist, Vehicle
+
+    def overlaps(model, start_date, end_date):
+        return or_(
+            (model.start_date <= start_date) & (model.end_date >= start_date),
+            (model.start_date <= end_date) & (model.end_date >= end_date),
+            (model.start_date >= start_date) & (model.end_date <= end_date)
+        )
+
+    def check_availability(bike_id, start_date, end_date):
+        return db.session.query(Booking.id).filter(
+            Booking.bike_id == bike_id, Booking.status == True, overlaps(Booking, start_date, end_date)
+        ).first() is None
+
+    def is_bike_booked(moto_id, start_date, end_date):
+        return len(Booking.query.filter(
+            Booking.bike_id == moto_id, Booking.status == True, overlaps(Booking, start_date, end_date)
+        ).all()) > 0
+
+    def has_conflicting_booking(user_id, start_date, end_date):
+        return len(Booking.query.filter(
+            Booking.customer_id == user_id, Booking.status == True, overlaps(Booking, start_date, end_date)
+        ).all()) > 0
+
+    def check_date_conflict(cart_id, start_date, end_date):
+        return len(CartItem.query.filter(
+            CartItem.cart_id == cart_id, overlaps(CartItem, start_date, end_date)
+        ).all()) > 0
+
+    def is_token_blacklisted(jti):
+        return TokenBlacklist.query.filter_by(jti=jti).first() is not None
+
+    def available_vehicles(start_date, end_date):
+        conflicting = db.session.query(Booking.bike_id).filter(
+            Booking.status == True, overlaps(Booking, start_date, end_date)
+        ).subquery()
+        return Vehicle.query.filter(Vehicle.id.notin_(conflicting.select()), Vehicle.is_active == True).all()
+
+    return {
+        "check_availability": lambda i, s, e: check_availability(1 + i % 20, s, e),
+        "is_bike_booked": lambda i, s, e: is_bike_booked(1 + i % 20, s, e),
+        "has_conflicting_booking": lambda i, s, e: has_conflicting_booking(1 + i % 50, s, e),
+        "check_date_conflict": lambda i, s, e: check_date_conflict(1 + i % 50, s, e),
+        "is_token_blacklisted": lambda i, s, e: is_token_blacklisted(f"jti-{i % 100}"),
+        "available_vehicles": lambda i, s, e: available_vehicles(s, e),
+    }
+
+
+def current_queries():
+    from models import Booking, Cart, TokenBlacklist, Vehicle
+
+    carts = {}
+
+    def check_date_conflict(cart_id, start_date, end_date):
+        cart = carts.get(cart_id)
+        if cart is None:
+            cart = carts[cart_id] = Cart(cart_id=cart_id)  # Oggetto transiente: serve solo cart_id
+        return cart.check_date_conflict(start_date, end_date) is not None
+
+    return {
+        "check_availability": lambda i, s, e: Booking.check_availability(1 + i % 20, s, e),
+        "is_bike_booked": lambda i, s, e: Cart.is_bike_booked(1 + i % 20, s, e),
+        "has_conflicting_booking": lambda i, s, e: Booking.has_conflicting_booking(1 + i % 50, s, e),
+        "check_date_conflict": lambda i, s, e: check_date_conflict(1 + i % 50, s, e),
+        "is_token_blacklisted": lambda i, s, e: TokenBlacklist.is_token_blacklisted(f"jti-{i % 100}"),
+        "available_vehicles": lambda i, s, e: Vehicle.get_available_vehicles_in_range(s, e),
+    }
+
+
+def measure(fn, calls, warmup=100):
+    base = datetime(2030, 1, 1, 9, 0, 0)
+    windows = [(base + timedelta(days=i % 60), base + timedelta(days=i % 60, hours=26)) for i in range(calls)]
+    for i in range(warmup):
+        fn(i, *windows[i % calls])
+    started = perf_counter()
+    for i in range(calls):
+        fn(i, *windows[i])
+    return (perf_counter() - started) / calls * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Costo per chiamata delle query calde dei modelli.")
+    parser.add_argument("--calls", type=int, default=3000)
+    parser.add_argument("--bookings", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="vivirent-queries-"), "queries.db")
+    os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("RATELIMIT_ENABLED", "false")
+
+    from app import app
+    from benchmarks.seed import build_dataset
+    from metrics import registry
+
+    with app.app_context():
+        build_dataset(users=50, vehicles=20, bookings=args.bookings, cart_items=500, seed=args.seed)
+
+        legacy = legacy_queries()
+        current = current_queries()
+        print(f"{'query':<26}{'prima µs':>12}{'dopo µs':>12}{'risparmio':>12}")
+        hits = misses = 0
+        for name in legacy:
+            before = measure(legacy[name], args.calls)
+            cache_before = dict(registry.snapshot()["sql_cache"])
+            after = measure(current[name], args.calls)
+            cache_after = registry.snapshot()["sql_cache"]
+            hits += cache_after.get(("hit",), 0) - cache_before.get(("hit",), 0)
+            misses += cache_after.get(("miss",), 0) - cache_before.get(("miss",), 0)
+            print(f"{name:<26}{before:>12.1f}{after:>12.1f}{(1 - after / before) * 100:>11.1f}%")
+
+    print(f"\nCache di compilazione: {hits} hit, {misses} miss "
+          f"({hits / (hits + misses) * 100 if hits + misses else 0:.2f}% hit)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+"""
+Costo per richiesta della decodifica e validazione degli input: parsing a
+mano delle view (implementazione precedente) contro gli schemi di schemas.py.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.request_validation --calls 20000
+
+Per ogni payload si misura il tempo medio da body grezzo (bytes) o query
+string a valori convertiti, nelle due versioni. Non serve un database: si
+misura solo lo strato di input, fuori da Flask.
+"""
+import argparse
+import json
+from datetime import datetime
+from time import perf_counter
+
+from dateutil import parser
+from werkzeug.datastructures import MultiDict
+
+import schemas
+
+BOOKING = json.dumps({
+    "bike_id": 7,
+    "start_date": "2031-05-01 09:00:00",
+    "end_date": "2031-05-03 18:00:00",
+    "total_price": 412.5,
+    "accessories": ["casco", "bauletto"],
+    "dl_type": "A",
+    "dl_expiration": "2034-01-01",
+    "dl_number": "RM1234567",
+    "helmet_size": "M",
+}).encode()
+
+CART_ITEM = json.dumps({
+    "moto_id": 3,
+    "start_date": "2031-05-01T07:00:00.000Z",
+    "end_date": "2031-05-02T07:00:00.000Z",
+    "price": 180.0,
+    "accessories": [],
+}).encode()
+
+QUOTES = json.dumps({"items": [
+    {"vehicle_id": 1 + i % 20, "start_date": f"2031-05-{1 + i % 28:02d}T09:00:00",
+     "end_date": f"2031-05-{1 + i % 28:02d}T18:00:00", "accessories": ["casco"]}
+    for i in range(50)
+]}).encode()
+
+SEARCH = MultiDict({
+    "start_date": "2031-05-01T00:00:00", "end_date": "2031-05-31T23:59:59",
+    "status": "active", "payment": "unpaid", "pickup": "false",
+    "customer": "rossi", "sort": "start_date", "order": "desc", "page": "2", "per_page": "50",
+})
+
+
+def legacy_booking(raw):
+    data = json.loads(raw)
+    required_fields = ["bike_id", "start_date", "end_date", "total_price", "dl_type", "dl_expiration", "dl_number"]
+    missing_fields = [field for field in required_fields if field not in data]
+    if missing_fields:
+        raise ValueError(missing_fields)
+    return (
+        data["bike_id"],
+        datetime.strptime(data["start_date"], "%Y-%m-%d %H:%M:%S"),
+        datetime.strptime(data["end_date"], "%Y-%m-%d %H:%M:%S"),
+        datetime.strptime(data["dl_expiration"], "%Y-%m-%d"),
+        data["total_price"], data.get("accessories", []),
+    )
+
+
+def legacy_cart_item(raw):
+    data = json.loads(raw)
+    start_date = parser.isoparse(data["start_date"])
+    end_date = parser.isoparse(data["end_date"])
+    return data["moto_id"], start_date, end_date, data["price"], data.get("accessories", [])
+
+
+def legacy_quotes(raw):
+    items = json.loads(raw).get("items")
+    if not isinstance(items, list) or not items:
+        raise ValueError("items")
+    return [{
+        "vehicle_id": int(item["vehicle_id"]),
+        "start_date": parser.parse(item["start_date"]),
+        "end_date": parser.parse(item["end_date"]),
+        "accessories": item.get("accessories", []),
+    } for item in items]
+
+
+def legacy_search(args):
+    values = {}
+    if args.get("start_date"):
+        values["start_date"] = parser.parse(args["start_date"])
+    if args.get("end_date"):
+        values["end_date"] = parser.parse(args["end_date"])
+    for name, allowed in (("status", ("active", "cancelled")), ("payment", ("paid", "unpaid"))):
+        if args.get(name):
+            if args[name].lower() not in allowed:
+                raise ValueError(name)
+            values[name] = args[name].lower()
+    if args.get("pickup"):
+        values["pickup"] = args["pickup"].lower() in ("true", "1", "yes")
+    values["customer"] = (args.get("customer") or "").strip()
+    values["sort"] = args.get("sort", "start_date")
+    values["order"] = args.get("order", "desc").lower()
+    values["page"] = max(int(args.get("page", 1)), 1)
+    values["per_page"] = min(max(int(args.get("per_page", 25)), 1), 100)
+    return values
+
+
+CASES = [
+    # nome, input, prima, dopo
+    ("POST /booking", BOOKING, legacy_booking, lambda raw: schemas.BookingBody.decode(json.loads(raw))),
+    ("POST /cart", CART_ITEM, legacy_cart_item, lambda raw: schemas.CartItemBody.decode(json.loads(raw))),
+    ("POST /quotes (50 voci)", QUOTES, legacy_quotes, lambda raw: schemas.QuotesBody.decode(json.loads(raw))),
+    ("GET /admin/bookings/search", SEARCH, legacy_search,
+     lambda args: schemas.BookingSearchQuery.decode(args, strings=True)),
+]
+
+
+def measure(fn, payload, calls, warmup=200):
+    for _ in range(warmup):
+        fn(payload)
+    started = perf_counter()
+    for _ in range(calls):
+        fn(payload)
+    return (perf_counter() - started) / calls * 1e6
+
+
+def main(argv=None):
+    parser_ = argparse.ArgumentParser(description="Costo per richiesta della validazione degli input.")
+    parser_.add_argument("--calls", type=int, default=20000)
+    args = parser_.parse_args(argv)
+
+    print(f"{'richiesta':<30}{'prima µs':>12}{'dopo µs':>12}{'differenza':>12}")
+    for name, payload, legacy, current in CASES:
+        calls = max(args.calls // 25, 200) if "quotes" in name else args.calls
+        before = measure(legacy, payload, calls)
+        after = measure(current, payload, calls)
+        print(f"{name:<30}{before:>12.1f}{after:>12.1f}{(after / before - 1) * 100:>+11.1f}%")
+
+    # ❌ Il costo di un rifiuto: tutti gli errori raccolti in un solo passaggio
+    invalid = json.dumps({"bike_id": "x", "start_date": "ieri", "total_price": -1}).encode()
+
+    def rejected(raw):
+        try:
+            schemas.BookingBody.decode(json.loads(raw))
+        except schemas.ValidationError as e:
+            return e.fields
+
+    print(f"\nBody non valido (7 errori): {measure(rejected, invalid, args.calls):.1f} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
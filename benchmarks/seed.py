@@ -0,0 +1,160 @@
+"""
+Costruzione di un dataset SQLite riproducibile per i benchmark.
+Le righe vengono inserite in blocco con insert() di SQLAlchemy Core,
+senza passare dagli oggetti ORM.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Vehicle, Cart, CartItem, Booking, BookingCode, BookingCodeIndex
+
+BENCH_PASSWORD = "benchpass1"
+ADMIN_EMAIL = "admin@vivirent.test"
+CUSTOMER_EMAIL = "customer@vivirent.test"
+
+BRANDS = [
+    ("Ducati", "Monster"), ("Honda", "CB500F"), ("Yamaha", "MT-07"), ("BMW", "R1250GS"),
+    ("Kawasaki", "Z900"), ("Triumph", "Trident"), ("KTM", "Duke 390"), ("Aprilia", "Tuareg")
+]
+NAMES = ["Mario", "Luigi", "Giulia", "Anna", "Marco", "Sara", "Paolo", "Elena", "Luca", "Chiara"]
+SURNAMES = ["Rossi", "Bianchi", "Verdi", "Russo", "Ferrari", "Esposito", "Romano", "Colombo"]
+
+
+def _chunks(rows, size=5000):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _bulk_insert(model, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(insert(model), chunk)
+
+
+def build_dataset(users=500, vehicles=50, bookings=2000, cart_items=1000, seed=42):
+    """
+    Crea lo schema e lo popola con un dataset deterministico.
+    L'utente 1 è l'amministratore e l'utente 2 è il cliente usato dai flussi.
+    Deve essere chiamata dentro un app context.
+    """
+    rng = random.Random(seed)
+    now = datetime(2025, 6, 1, 9, 0, 0)
+
+    db.drop_all()
+    db.create_all()
+
+    # 🔒 Un solo hash condiviso: calcolarne uno per utente renderebbe il seed lentissimo
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    user_rows = []
+    for i in range(1, users + 1):
+        if i == 1:
+            email, role = ADMIN_EMAIL, "admin"
+        elif i == 2:
+            email, role = CUSTOMER_EMAIL, "user"
+        else:
+            email, role = f"user{i}@vivirent.test", "user"
+        user_rows.append({
+            "id": i,
+            "name": rng.choice(NAMES),
+            "surname": rng.choice(SURNAMES),
+            "password": password_hash,
+            "email": email,
+            "role": role,
+            "bday": datetime(1970, 1, 1).date() + timedelta(days=rng.randint(0, 12000)),
+            "place": "Roma",
+            "register_ts": now - timedelta(days=rng.randint(0, 900))
+        })
+    _bulk_insert(User, user_rows)
+
+    vehicle_rows = []
+    for i in range(1, vehicles + 1):
+        brand, model = rng.choice(BRANDS)
+        vehicle_rows.append({
+            "id": i,
+            "vehicle_type": "motorbike",
+            "brand": brand,
+            "model": model,
+            "year": rng.randint(2015, 2025),
+            "price_per_hour": round(rng.uniform(5, 30), 2),
+            "license_plate": f"BX{i:06d}",
+            "driving_license": rng.choice(["A", "A1", "A2"]),
+            "power": f"{rng.randint(30, 150)} CV",
+            "engine_size": round(rng.uniform(0.3, 1.3), 1),
+            "fuel_type": "Benzina",
+            "is_active": rng.random() > 0.05,
+            "description": f"{brand} {model}",
+            "image_url": None,
+            "deposit": rng.choice([50, 100, 150, 200])
+        })
+    _bulk_insert(Vehicle, vehicle_rows)
+
+    codes = rng.sample(range(10**7, 10**8), bookings * 2)
+    booking_rows, code_rows = [], []
+    active_by_bike = {}
+    for i in range(1, bookings + 1):
+        start = now + timedelta(days=rng.randint(-720, 180), hours=rng.randint(0, 12))
+        end = start + timedelta(hours=rng.randint(4, 96))
+        bike_id = rng.randint(1, vehicles)
+        # 🛡️ Il vincolo del database vieta prenotazioni attive sovrapposte: quelle in conflitto nascono cancellate
+        active = rng.random() > 0.1 and not any(
+            s <= end and e >= start for s, e in active_by_bike.get(bike_id, ())
+        )
+        if active:
+            active_by_bike.setdefault(bike_id, []).append((start, end))
+        booking_rows.append({
+            "id": i,
+            "bike_id": bike_id,
+            "customer_id": rng.randint(3, max(users, 3)),
+            "start_date": start,
+            "end_date": end,
+            "total_price": round(rng.uniform(40, 900), 2),
+            "status": active,
+            "payment_status": rng.random() > 0.3,
+            "created_at": start - timedelta(days=rng.randint(1, 30)),
+            "last_update": start,
+            "accessories": json.dumps([]),
+            "dl_type": "A",
+            "dl_expiration": (now + timedelta(days=365)).date(),
+            "dl_number": f"DL{i:06d}",
+            "helmet_size": "M",
+            "gloves_size": "M",
+            "pickup": start < now,
+            "return_": end < now,
+            "booking_code": str(codes[i - 1])
+        })
+        code_rows.append({"booking_id": i, "generated_code": codes[bookings + i - 1]})
+    _bulk_insert(Booking, booking_rows)
+    _bulk_insert(BookingCode, code_rows)
+    # 🗂️ Indice unico dei codici (booking_lookup.py), mantenuto dagli eventi ORM che Core salta
+    _bulk_insert(BookingCodeIndex, [
+        {"code": row["generated_code"], "booking_id": row["booking_id"], "source": "generated"} for row in code_rows
+    ] + [
+        {"code": int(row["booking_code"]), "booking_id": row["id"], "source": "booking"} for row in booking_rows
+    ])
+
+    cart_rows = [
+        {"cart_id": i, "user_id": i, "items_id_list": "[]", "final_price": 0.0,
+         "status": "active", "created_at": now, "updated_at": now}
+        for i in range(1, users + 1)
+    ]
+    _bulk_insert(Cart, cart_rows)
+
+    item_rows = []
+    for _ in range(cart_items):
+        start = now + timedelta(days=rng.randint(1, 365))
+        item_rows.append({
+            "cart_id": rng.randint(3, max(users, 3)),
+            "moto_id": rng.randint(1, vehicles),
+            "start_date": start,
+            "end_date": start + timedelta(hours=rng.randint(4, 48)),
+            "price": round(rng.uniform(40, 500), 2),
+            "accessories": "[]",
+            "created_at": now
+        })
+    _bulk_insert(CartItem, item_rows)
+
+    db.session.commit()
@@ -0,0 +1,184 @@
+"""
+Capacità di connessioni concorrenti per worker: sync vs gthread vs gevent.
+
+Uso (dalla root del progetto):
+    python -m benchmarks.worker_capacity --clients 50 --smtp-delay 0.2
+
+Avvia gunicorn con un solo worker per ogni modalità e invia richieste
+concorrenti a POST /api/user/<id>/send-email. Un finto server SMTP locale
+risponde con un ritardo fisso, simulando un provider lento: la concorrenza
+effettiva del worker è throughput × ritardo.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EMAIL = "bench@vivirent.test"
+PASSWORD = "benchpass1"
+
+
+class SlowSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    SMTP minimale: accetta qualsiasi messaggio e attende `delay` secondi
+    prima di confermare il DATA.
+    """
+
+    delay = 0.2
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+        self.wfile.flush()
+
+    def handle(self):
+        self._reply("220 bench ESMTP")
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    time.sleep(self.delay)
+                    self._reply("250 OK")
+                continue
+            command = line[:4].upper()
+            if command in ("EHLO", "HELO"):
+                self._reply("250 bench")
+            elif command == "DATA":
+                in_data = True
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, process, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn è terminato durante l'avvio.")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn non ha risposto in tempo.")
+
+
+def _login(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("POST", "/api/login", body=json.dumps({"email": EMAIL, "password": PASSWORD}),
+                 headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read()
+    cookies = [header.split(";", 1)[0] for name, header in response.getheaders() if name.lower() == "set-cookie"]
+    conn.close()
+    return "; ".join(cookies)
+
+
+def run_mode(mode, env, clients, requests_per_client):
+    port = _free_port()
+    process_env = dict(env, WORKER_MODE=mode, PORT=str(port), WEB_CONCURRENCY="1")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=ROOT, env=process_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_for_port(port, process)
+        cookie = _login(port)
+        body = json.dumps({"subject": "Benchmark", "body": "Test di capacità"})
+        errors = []
+
+        def client():
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            for _ in range(requests_per_client):
+                conn.request("POST", "/api/user/1/send-email", body=body,
+                             headers={"Content-Type": "application/json", "Cookie": cookie})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+            conn.close()
+
+        started = perf_counter()
+        workers = [threading.Thread(target=client) for _ in range(clients)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = perf_counter() - started
+
+        total = clients * requests_per_client
+        return {"requests": total, "errors": len(errors), "elapsed_s": round(elapsed, 2),
+                "throughput_rps": round(total / elapsed, 2)}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capacità di concorrenza per worker gunicorn.")
+    parser.add_argument("--modes", default="sync,gthread,gevent")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--smtp-delay", type=float, default=0.2, help="Ritardo del finto SMTP in secondi")
+    args = parser.parse_args(argv)
+
+    SlowSMTPHandler.delay = args.smtp_delay
+    smtp = ThreadingSMTPServer(("127.0.0.1", 0), SlowSMTPHandler)
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="vivirent-workers-"), "bench.db")
+    env = dict(
+        os.environ,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}",
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=str(smtp.server_address[1]),
+        GUNICORN_WORKER_CONNECTIONS=str(max(args.clients, 100)),
+        METRICS_ENABLED="false"
+    )
+
+    # 🗄️ Schema e utente di test, creati prima di avviare gunicorn
+    os.environ["SQLALCHEMY_DATABASE_URI"] = env["SQLALCHEMY_DATABASE_URI"]
+    from datetime import date
+    from app import app
+    from models import db, User
+    with app.app_context():
+        db.create_all()
+        User.add_user("Bench", "Mark", PASSWORD, EMAIL, date(1990, 1, 1), "Roma")
+
+    print(f"{'modalità':<10}{'richieste':>10}{'errori':>8}{'secondi':>10}{'rps':>10}{'concorrenza':>13}")
+    for mode in args.modes.split(","):
+        result = run_mode(mode.strip(), env, args.clients, args.requests_per_client)
+        concurrency = round(result["throughput_rps"] * args.smtp_delay, 1)
+        print(f"{mode:<10}{result['requests']:>10}{result['errors']:>8}{result['elapsed_s']:>10}"
+              f"{result['throughput_rps']:>10}{concurrency:>13}")
+
+    smtp.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Vincolo di non sovrapposizione delle prenotazioni a livello di database.
+
+Una prenotazione attiva non può sovrapporsi (estremi inclusi) a un'altra
+prenotazione attiva della stessa moto. Il vincolo vive nel database, quindi
+l'INSERT/UPDATE riesce oppure fallisce in un solo statement, e i controlli
+Python (check_availability & co.) diventano suggerimenti opzionali.
+
+- SQLite:     trigger BEFORE INSERT/UPDATE con RAISE(ABORT);
+- MySQL:      trigger BEFORE INSERT/UPDATE con SIGNAL; il lock sulla riga del
+              veicolo e la lettura FOR UPDATE rendono il controllo sicuro anche
+              con transazioni concorrenti (REPEATABLE READ);
+- PostgreSQL: exclusion constraint GiST su (bike_id, tsrange).
+
+In tutti i casi l'errore contiene BOOKING_OVERLAP_MARKER e viene tradotto in
+BookingConflictError da models.py.
+"""
+import logging
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Booking, BOOKING_OVERLAP_MARKER
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "ix_bookings_bike_dates"
+
+SQLITE_DDL = [
+    f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON bookings (bike_id, start_date, end_date)",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bookings_overlap_guard_insert
+    BEFORE INSERT ON bookings
+    WHEN NEW.status = 1
+    BEGIN
+        SELECT RAISE(ABORT, '{BOOKING_OVERLAP_MARKER}')
+        WHERE EXISTS (
+            SELECT 1 FROM bookings
+            WHERE bike_id = NEW.bike_id AND status = 1
+              AND start_date <= NEW.end_date AND end_date >= NEW.start_date
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bookings_overlap_guard_update
+    BEFORE UPDATE OF bike_id, start_date, end_date, status ON bookings
+    WHEN NEW.status = 1
+    BEGIN
+        SELECT RAISE(ABORT, '{BOOKING_OVERLAP_MARKER}')
+        WHERE EXISTS (
+            SELECT 1 FROM bookings
+            WHERE bike_id = NEW.bike_id AND status = 1 AND id <> NEW.id
+              AND start_date <= NEW.end_date AND end_date >= NEW.start_date
+        );
+    END
+    """,
+]
+
+
+def _mysql_trigger(name, timing, exclude_self):
+    self_filter = "AND id <> NEW.id" if exclude_self else ""
+    return f"""
+    CREATE TRIGGER {name} BEFORE {timing} ON bookings
+    FOR EACH ROW
+    BEGIN
+        DECLARE locked_vehicle INT;
+        DECLARE conflicts INT DEFAULT 0;
+        IF NEW.status = 1 THEN
+            SELECT id INTO locked_vehicle FROM vehicles WHERE id = NEW.bike_id FOR UPDATE;
+            SELECT COUNT(*) INTO conflicts FROM bookings
+             WHERE bike_id = NEW.bike_id AND status = 1 {self_filter}
+               AND start_date <= NEW.end_date AND end_date >= NEW.start_date
+             FOR UPDATE;
+            IF conflicts > 0 THEN
+                SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '{BOOKING_OVERLAP_MARKER}';
+            END IF;
+        END IF;
+    END
+    """
+
+
+MYSQL_TRIGGERS = {
+    "bookings_overlap_guard_insert": _mysql_trigger("bookings_overlap_guard_insert", "INSERT", False),
+    "bookings_overlap_guard_update": _mysql_trigger("bookings_overlap_guard_update", "UPDATE", True),
+}
+
+POSTGRESQL_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    f"""
+    ALTER TABLE bookings ADD CONSTRAINT {BOOKING_OVERLAP_MARKER}
+    EXCLUDE USING gist (bike_id WITH =, tsrange(start_date, end_date, '[]') WITH &&)
+    WHERE (status)
+    """,
+]
+
+
+def _install_sqlite(conn):
+    for statement in SQLITE_DDL:
+        conn.execute(text(statement))
+
+
+def _install_mysql(conn):
+    existing = set(conn.execute(text(
+        "SELECT TRIGGER_NAME FROM information_schema.TRIGGERS "
+        "WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = 'bookings'"
+    )).scalars())
+    indexes = set(conn.execute(text(
+        "SELECT INDEX_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bookings'"
+    )).scalars())
+    if INDEX_NAME not in indexes:
+        conn.execute(text(f"CREATE INDEX {INDEX_NAME} ON bookings (bike_id, start_date, end_date)"))
+    for name, statement in MYSQL_TRIGGERS.items():
+        if name not in existing:
+            conn.execute(text(statement))
+
+
+def _install_postgresql(conn):
+    exists = conn.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE conname = :name"
+    ), {"name": BOOKING_OVERLAP_MARKER}).first()
+    if not exists:
+        for statement in POSTGRESQL_DDL:
+            conn.execute(text(statement))
+
+
+INSTALLERS = {"sqlite": _install_sqlite, "mysql": _install_mysql, "mariadb": _install_mysql, "postgresql": _install_postgresql}
+
+
+def install_overlap_guard(conn):
+    """
+    Installa indice e vincolo sulla tabella bookings. Idempotente.
+    Restituisce False se il dialetto non è supportato.
+    """
+    installer = INSTALLERS.get(conn.dialect.name)
+    if installer is None:
+        return False
+    installer(conn)
+    return True
+
+
+@event.listens_for(Booking.__table__, "after_create")
+def _install_after_create(target, connection, **kw):
+    # Database nuovi (db.create_all): il vincolo nasce insieme alla tabella
+    install_overlap_guard(connection)
+
+
+def init_booking_guard(app):
+    """
+    Installa il vincolo sui database esistenti all'avvio (BOOKING_OVERLAP_GUARD).
+    Se la tabella non esiste ancora ci penserà l'hook after_create.
+    """
+    if not app.config.get("BOOKING_OVERLAP_GUARD", True):
+        return
+
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                if not inspect(conn).has_table(Booking.__tablename__):
+                    return
+                if not install_overlap_guard(conn):
+                    logger.warning("Vincolo di sovrapposizione non supportato da %s", conn.dialect.name,
+                                   extra={"event": "booking_guard.unsupported"})
+        except SQLAlchemyError as e:
+            # Un altro worker può averlo appena installato (MySQL/PostgreSQL non hanno IF NOT EXISTS)
+            logger.warning("Installazione del vincolo di sovrapposizione fallita: %s", str(e),
+                           extra={"event": "booking_guard.install_failed"})
@@ -0,0 +1,252 @@
+"""
+Ricerca rapida di una prenotazione per codice (banco del ritiro).
+
+I codici esistono in due forme: booking_codes.generated_code (intero) e
+bookings.booking_code (stringa a 8 cifre). Entrambe finiscono nell'indice
+unico booking_code_index (codice -> prenotazione), mantenuto qui dagli eventi
+ORM: un codice già usato in una forma non può essere assegnato nell'altra.
+find_by_code fa un'unica query sulla primary key dell'indice, in join con
+prenotazione, cliente e veicolo, e legge nella stessa query il ruolo di chi
+chiede.
+
+Le prenotazioni che iniziano oggi (quelle scansionate di continuo durante i
+ritiri del mattino) restano in una cache LRU per processo. Una voce viene
+invalidata quando cambiano la prenotazione (toggle di ritiro, riconsegna e
+pagamento compresi), il suo cliente o il suo veicolo: subito nel worker che
+ha scritto, al controllo successivo del bus negli altri (cache_bus.py). Il
+TTL resta come limite massimo di staleness.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from sqlalchemy import Integer, cast, delete, event, exists, func, insert, inspect, literal, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from cache_bus import cache_bus
+from models import (
+    db, Booking, BookingArchive, BookingCode, BookingCodeArchive, BookingCodeIndex, User, Vehicle
+)
+
+logger = logging.getLogger(__name__)
+
+_index = BookingCodeIndex.__table__
+
+
+class DeskCache:
+    """
+    LRU thread-safe codice -> prenotazione dettagliata, valida solo per oggi.
+    """
+
+    def __init__(self, max_size=512, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # codice -> (booking_id, customer_id, dettaglio, scadenza)
+        self._day = date.today()
+        self._lock = threading.Lock()
+
+    def configure(self, app):
+        self.max_size = app.config.get("BOOKING_CODE_CACHE_SIZE", 512)
+        self.ttl = app.config.get("BOOKING_CODE_CACHE_TTL", 30.0)
+        self.clear()
+
+    def get(self, code):
+        with self._lock:
+            if self._day != date.today():
+                # Cambio di giorno: le prenotazioni in cache non iniziano più "oggi"
+                self._entries.clear()
+                self._day = date.today()
+                return None
+            entry = self._entries.get(code)
+            if entry is None:
+                return None
+            if entry[3] < time.monotonic():
+                del self._entries[code]
+                return None
+            self._entries.move_to_end(code)
+            return entry
+
+    def put(self, code, booking_id, customer_id, detail):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[code] = (booking_id, customer_id, detail, time.monotonic() + self.ttl)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate):
+        """
+        Scarta le voci per cui predicate(booking_id, customer_id, dettaglio) è vero.
+        """
+        with self._lock:
+            for code in [code for code, entry in self._entries.items() if predicate(*entry[:3])]:
+                del self._entries[code]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+desk_cache = DeskCache()
+
+
+def find_by_code(code, user_id):
+    """
+    Restituisce (booking_id, customer_id, dettaglio, ruolo di chi chiede)
+    oppure None se il codice non corrisponde a nessuna prenotazione.
+    Il dettaglio è None se cliente o veicolo non esistono più.
+    """
+    cached = desk_cache.get(code)
+    if cached is not None:
+        role = db.session.execute(select(User.role).where(User.id == user_id)).scalar()
+        return cached[0], cached[1], cached[2], role
+
+    row = db.session.execute(
+        select(
+            Booking.id, Booking.customer_id, Booking.bike_id, Booking.start_date, Booking.end_date,
+            Booking.total_price, Booking.payment_status, Booking.pickup, Booking.return_, Booking.status,
+            User.id.label("user_id"), User.name, User.surname, User.email, User.bday, User.place, User.role,
+            Vehicle.id.label("vehicle_id"), Vehicle.brand, Vehicle.model, Vehicle.year, Vehicle.license_plate,
+            Vehicle.fuel_type, Vehicle.deposit, Vehicle.power, Vehicle.image_url, Vehicle.description,
+            select(User.role).where(User.id == user_id).scalar_subquery().label("requester_role"),
+        )
+        .select_from(BookingCodeIndex)
+        .join(Booking, Booking.id == BookingCodeIndex.booking_id)
+        .join(User, User.id == Booking.customer_id, isouter=True)
+        .join(Vehicle, Vehicle.id == Booking.bike_id, isouter=True)
+        .where(BookingCodeIndex.code == code)
+    ).first()
+    if row is None:
+        return None
+
+    detail = None
+    if row.user_id is not None and row.vehicle_id is not None:
+        detail = {
+            "id": row.id,
+            "booking_code": code,
+            "start_date": row.start_date.strftime('%Y-%m-%d %H:%M:%S'),
+            "end_date": row.end_date.strftime('%Y-%m-%d %H:%M:%S'),
+            "total_price": float(row.total_price),
+            "payment_status": row.payment_status,
+            "pickup": row.pickup,
+            "return_": row.return_,
+            "status": row.status,
+            "user": {
+                "id": row.user_id,
+                "name": row.name,
+                "surname": row.surname,
+                "email": row.email,
+                "bday": row.bday.strftime("%Y-%m-%d") if row.bday else None,
+                "place": row.place,
+                "role": row.role
+            },
+            "vehicle": {
+                "id": row.vehicle_id,
+                "brand": row.brand,
+                "model": row.model,
+                "year": row.year,
+                "license_plate": row.license_plate,
+                "fuel_type": row.fuel_type,
+                "deposit": row.deposit,
+                "power": row.power,
+                "image_url": row.image_url,
+                "description": row.description
+            }
+        }
+        if row.start_date.date() == date.today():
+            desk_cache.put(code, row.id, row.customer_id, detail)
+
+    return row.id, row.customer_id, detail, row.requester_role
+
+
+# 🔄 Invalidazione mirata: solo le voci della prenotazione, del cliente o del veicolo modificati
+def _on_change(select_keys):
+    def handler(keys):
+        if keys is None:
+            desk_cache.clear()
+        else:
+            desk_cache.invalidate(lambda *entry: select_keys(*entry) in keys)
+    return handler
+
+
+cache_bus.subscribe("booking", _on_change(lambda booking_id, customer_id, detail: booking_id))
+cache_bus.subscribe("user", _on_change(lambda booking_id, customer_id, detail: customer_id))
+cache_bus.subscribe("vehicle", _on_change(lambda booking_id, customer_id, detail: detail["vehicle"]["id"]))
+
+
+# 🗂️ Indice unico dei codici: stessa transazione dell'inserimento, il PK blocca le collisioni
+@event.listens_for(Booking, "after_insert")
+def _index_booking_code(mapper, connection, target):
+    if target.booking_code and target.booking_code.isdigit():
+        connection.execute(insert(_index).values(
+            code=int(target.booking_code), booking_id=target.id, source="booking"
+        ))
+
+
+@event.listens_for(BookingCode, "after_insert")
+def _index_generated_code(mapper, connection, target):
+    connection.execute(insert(_index).values(
+        code=int(target.generated_code), booking_id=target.booking_id, source="generated"
+    ))
+
+
+@event.listens_for(Booking, "after_delete")
+def _unindex_booking(mapper, connection, target):
+    # Solo le cancellazioni: le prenotazioni archiviate tengono i loro codici
+    connection.execute(delete(_index).where(_index.c.booking_id == target.id))
+
+
+@event.listens_for(BookingCode, "after_delete")
+def _unindex_generated_code(mapper, connection, target):
+    connection.execute(delete(_index).where(
+        _index.c.code == int(target.generated_code), _index.c.source == "generated"
+    ))
+
+
+def rebuild_code_index(conn):
+    """
+    Ricostruisce l'indice dalle tabelle dei codici (anche archiviate). In
+    caso di collisione tra le due forme vince generated_code; restituisce il
+    numero di codici scartati.
+    """
+    sources = [
+        (BookingCode, BookingCode.generated_code, BookingCode.booking_id, "generated"),
+        (BookingCodeArchive, BookingCodeArchive.generated_code, BookingCodeArchive.booking_id, "generated"),
+        (Booking, cast(Booking.booking_code, Integer), Booking.id, "booking"),
+        (BookingArchive, cast(BookingArchive.booking_code, Integer), BookingArchive.id, "booking"),
+    ]
+    conn.execute(delete(_index))
+    total = 0
+    for model, code, booking_id, source in sources:
+        total += conn.execute(select(func.count()).select_from(model)).scalar()
+        conn.execute(insert(_index).from_select(
+            ["code", "booking_id", "source"],
+            select(code, func.min(booking_id), literal(source))
+            .where(~exists().where(_index.c.code == code))
+            .group_by(code)
+        ))
+    skipped = total - conn.execute(select(func.count()).select_from(_index)).scalar()
+    if skipped:
+        logger.warning("Codici di prenotazione in collisione esclusi dall'indice: %s", skipped,
+                       extra={"event": "booking_lookup.code_collisions"})
+    return skipped
+
+
+def init_booking_lookup(app):
+    desk_cache.configure(app)
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                if not inspect(conn).has_table(Booking.__tablename__):
+                    return  # Database nuovo: l'indice lo crea db.create_all insieme alle altre tabelle
+                _index.create(conn, checkfirst=True)  # Database esistenti: db.create_all la crea solo se nuova
+                if conn.execute(select(_index.c.code).limit(1)).first() is None:
+                    rebuild_code_index(conn)
+        except IntegrityError:
+            pass  # Un altro worker ha popolato l'indice nello stesso momento
+        except SQLAlchemyError as e:
+            logger.warning("Preparazione dell'indice dei codici fallita: %s", str(e),
+                           extra={"event": "booking_lookup.index_failed"})
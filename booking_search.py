@@ -0,0 +1,159 @@
+"""
+Ricerca admin delle prenotazioni con filtri combinabili.
+
+Una sola query: bookings in join con users, vehicles e booking_codes,
+proiettata sulle sole colonne mostrate, ordinata su colonne indicizzate (con
+id come spareggio per una paginazione stabile) e con il totale calcolato da
+COUNT(*) OVER () nella stessa query.
+
+Gli indici usati sono dichiarati in Booking.__table_args__; init_booking_search
+li crea sui database esistenti (db.create_all li crea solo con le tabelle).
+"""
+import logging
+
+from sqlalchemy import func, inspect, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Booking, BookingCode, User, Vehicle
+
+logger = logging.getLogger(__name__)
+
+SORT_COLUMNS = {
+    "start_date": Booking.start_date,
+    "created_at": Booking.created_at,
+    "id": Booking.id,
+}
+MAX_PER_PAGE = 100
+
+STATE_FILTERS = {
+    # parametro -> (colonna, valori ammessi); pickup e returned sono già booleani
+    "status": (Booking.status, {"active": True, "cancelled": False}),
+    "payment": (Booking.payment_status, {"paid": True, "unpaid": False}),
+    "pickup": (Booking.pickup, None),
+    "returned": (Booking.return_, None),
+}
+
+
+def build_criteria(query):
+    """
+    Traduce i parametri già validati (schemas.BookingSearchQuery) in criteri di ricerca.
+    """
+    conditions = []
+
+    # 📅 Prenotazioni che si sovrappongono all'intervallo richiesto
+    if query.start_date is not None:
+        conditions.append(Booking.end_date >= query.start_date)
+    if query.end_date is not None:
+        conditions.append(Booking.start_date <= query.end_date)
+
+    for name, (column, values) in STATE_FILTERS.items():
+        value = getattr(query, name)
+        if value is not None:
+            conditions.append(column == (values[value] if values else value))
+
+    if query.vehicle_id is not None:
+        conditions.append(Booking.bike_id == query.vehicle_id)
+
+    if query.customer:
+        # Frammento di nome, cognome o "nome cognome"
+        pattern = f"%{query.customer}%"
+        conditions.append(or_(
+            User.name.ilike(pattern),
+            User.surname.ilike(pattern),
+            (User.name + " " + User.surname).ilike(pattern)
+        ))
+
+    if query.code:
+        code_conditions = [Booking.booking_code == query.code]
+        if query.code.isdigit():
+            code_conditions.append(BookingCode.generated_code == int(query.code))
+        conditions.append(or_(*code_conditions))
+
+    return {
+        "conditions": conditions,
+        "sort": query.sort,
+        "order": query.order,
+        "page": query.page,
+        "per_page": min(query.per_page, MAX_PER_PAGE),
+    }
+
+
+def search_bookings(criteria):
+    """
+    Esegue la ricerca e restituisce la pagina richiesta con il totale.
+    """
+    sort_column = SORT_COLUMNS[criteria["sort"]]
+    if criteria["order"] == "desc":
+        ordering = (sort_column.desc(), Booking.id.desc())
+    else:
+        ordering = (sort_column.asc(), Booking.id.asc())
+
+    query = (
+        select(
+            Booking.id, Booking.bike_id, Booking.customer_id, Booking.start_date, Booking.end_date,
+            Booking.total_price, Booking.status, Booking.payment_status, Booking.pickup, Booking.return_,
+            Booking.booking_code, Booking.created_at,
+            User.name, User.surname, User.email,
+            Vehicle.brand, Vehicle.model, Vehicle.license_plate,
+            BookingCode.generated_code,
+            func.count().over().label("total_count"),
+        )
+        .select_from(Booking)
+        .join(User, User.id == Booking.customer_id, isouter=True)
+        .join(Vehicle, Vehicle.id == Booking.bike_id, isouter=True)
+        .join(BookingCode, BookingCode.booking_id == Booking.id, isouter=True)
+        .where(*criteria["conditions"])
+        .order_by(*ordering)
+        .limit(criteria["per_page"])
+        .offset((criteria["page"] - 1) * criteria["per_page"])
+    )
+    rows = db.session.execute(query).all()
+
+    return {
+        "page": criteria["page"],
+        "per_page": criteria["per_page"],
+        # Pagina oltre la fine: nessuna riga da cui leggere il totale
+        "total": rows[0].total_count if rows else (0 if criteria["page"] == 1 else None),
+        "bookings": [
+            {
+                "id": row.id,
+                "bike_id": row.bike_id,
+                "customer_id": row.customer_id,
+                "customer_name": f"{row.name} {row.surname}" if row.name is not None else "Non trovato",
+                "customer_email": row.email,
+                "vehicle_info": f"{row.brand} {row.model}" if row.brand is not None else "Non trovato",
+                "license_plate": row.license_plate,
+                "start_date": row.start_date.strftime('%Y-%m-%d %H:%M:%S'),
+                "end_date": row.end_date.strftime('%Y-%m-%d %H:%M:%S'),
+                "total_price": float(row.total_price),
+                "status": row.status,
+                "payment_status": row.payment_status,
+                "pickup": row.pickup,
+                "return_": row.return_,
+                "booking_code": row.booking_code,
+                "generated_code": row.generated_code,
+                "created_at": row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None,
+                "archived": False,  # La ricerca copre solo le prenotazioni attive in tabella
+            }
+            for row in rows
+        ],
+    }
+
+
+def init_booking_search(app):
+    """
+    Crea sui database esistenti gli indici dichiarati per la ricerca.
+    """
+    indexes = [*Booking.__table__.indexes, *BookingCode.__table__.indexes]
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                if not inspect(conn).has_table(Booking.__tablename__):
+                    return  # Tabelle nuove: gli indici li crea db.create_all
+                for index in indexes:
+                    if index.name and index.name.startswith(("ix_bookings_", "ix_booking_codes_")):
+                        index.create(conn, checkfirst=True)
+        except SQLAlchemyError as e:
+            # Un altro worker può averli appena creati
+            logger.warning("Creazione degli indici di ricerca fallita: %s", str(e),
+                           extra={"event": "booking_search.index_failed"})
@@ -0,0 +1,228 @@
+"""
+Bus di invalidazione delle cache in-process tra i worker gunicorn.
+
+Ogni flush che inserisce, modifica o cancella un veicolo, una regola
+tariffaria, un utente, una prenotazione o un token revocato scrive, nella
+stessa transazione, una riga (topic, chiave) in cache_invalidations: se la
+scrittura va in rollback sparisce anche l'evento. L'id autoincrementale è la
+versione del bus.
+
+- Nel worker che ha scritto gli eventi arrivano ai sottoscrittori subito,
+  al commit della sessione.
+- Gli altri worker leggono le righe con id maggiore dell'ultimo visto, al
+  massimo una volta per richiesta e non più spesso di
+  CACHE_BUS_POLL_INTERVAL secondi (una query sulla primary key, di solito
+  vuota), e le passano ai sottoscrittori del topic.
+
+    cache_bus.subscribe("vehicle", lambda keys: ...)  # keys: set di id, None = svuota tutto
+
+Due transazioni concorrenti possono committare in ordine diverso da quello
+degli id: i "buchi" nella sequenza vengono riletti per GAP_TIMEOUT secondi
+prima di considerarli rollback. Le righe più vecchie di CACHE_BUS_RETENTION
+vengono cancellate dal job di manutenzione purge_cache_invalidations.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import db, Booking, CacheInvalidation, RateRule, TokenBlacklist, User, Vehicle
+
+logger = logging.getLogger(__name__)
+
+# Modello -> (topic, attributo usato come chiave)
+TOPICS = {
+    Vehicle: ("vehicle", "id"),
+    RateRule: ("rate_rule", "id"),
+    User: ("user", "id"),
+    Booking: ("booking", "id"),
+    TokenBlacklist: ("token", "jti"),
+}
+GAP_TIMEOUT = 10.0   # Secondi oltre i quali un id mancante è un rollback, non un commit in ritardo
+MAX_GAPS = 1000      # Oltre, si svuotano tutte le cache invece di inseguire i buchi
+POLL_BATCH = 1000    # Righe lette per controllo; se sono di più si svuota tutto
+
+_table = CacheInvalidation.__table__
+
+
+def _normalize(key):
+    # Le chiavi tornano dal database come stringhe: gli id numerici tornano interi
+    return int(key) if isinstance(key, str) and key.isdigit() else key
+
+
+class CacheBus:
+    def __init__(self):
+        self.enabled = True
+        self.poll_interval = 0.5
+        self._subscribers = defaultdict(list)  # topic -> [handler]
+        self._last_id = None                   # Ultimo id visto (None = non ancora letto)
+        self._gaps = {}                        # id mancante -> istante in cui è stato notato
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._origin = None
+        self._origin_pid = None
+
+    def configure(self, app):
+        self.enabled = app.config.get("CACHE_BUS_ENABLED", True)
+        self.poll_interval = app.config.get("CACHE_BUS_POLL_INTERVAL", 0.5)
+        self._last_id = None
+        self._gaps.clear()
+
+    @property
+    def origin(self):
+        # Un'identità per processo: dopo il fork dei worker ognuno ha la sua
+        if self._origin_pid != os.getpid():
+            self._origin = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+            self._origin_pid = os.getpid()
+            self._last_id = None
+            self._gaps.clear()
+        return self._origin
+
+    def subscribe(self, topic, handler):
+        self._subscribers[topic].append(handler)
+
+    def dispatch(self, events):
+        """
+        Passa ai sottoscrittori gli eventi (topic, chiave), raggruppati per topic.
+        """
+        grouped = {}
+        for topic, key in events:
+            keys = grouped.setdefault(topic, set())
+            if keys is not None:
+                if key is None:
+                    grouped[topic] = None
+                else:
+                    keys.add(_normalize(key))
+        for topic, keys in grouped.items():
+            for handler in self._subscribers.get(topic, ()):
+                try:
+                    handler(keys)
+                except Exception:
+                    logger.exception("Invalidazione della cache fallita", extra={"event": "cache_bus.handler_failed"})
+
+    def flush_all(self):
+        for topic in list(self._subscribers):
+            self.dispatch([(topic, None)])
+
+    def poll(self, force=False):
+        """
+        Applica gli eventi pubblicati dagli altri worker. Restituisce quanti ne ha applicati.
+        """
+        if not self.enabled:
+            return 0
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return 0
+        if not self._lock.acquire(blocking=False):
+            return 0  # Un altro thread del worker sta già leggendo
+        try:
+            self._last_poll = now
+            return self._apply_new_rows(now)
+        except SQLAlchemyError as e:
+            logger.warning("Lettura del bus di invalidazione fallita: %s", str(e),
+                           extra={"event": "cache_bus.poll_failed"})
+            return 0
+        finally:
+            self._lock.release()
+
+    def _apply_new_rows(self, now):
+        origin = self.origin
+        with db.engine.connect() as conn:
+            if self._last_id is None:
+                # Primo controllo del processo: le cache sono vuote, si parte dall'ultimo id
+                self._last_id = conn.execute(select(func.max(_table.c.id))).scalar() or 0
+                return 0
+            floor = min(self._gaps) - 1 if self._gaps else self._last_id
+            rows = conn.execute(
+                select(_table.c.id, _table.c.topic, _table.c.key, _table.c.origin)
+                .where(_table.c.id > floor)
+                .order_by(_table.c.id)
+                .limit(POLL_BATCH)
+            ).all()
+
+        events = []
+        for row in rows:
+            if row.id <= self._last_id:
+                if self._gaps.pop(row.id, None) is None:
+                    continue  # Già applicato
+            else:
+                for missing in range(self._last_id + 1, min(row.id, self._last_id + MAX_GAPS + 2)):
+                    self._gaps[missing] = now
+                self._last_id = row.id
+            if row.origin != origin:
+                events.append((row.topic, row.key))
+
+        self._gaps = {gap: seen for gap, seen in self._gaps.items() if now - seen < GAP_TIMEOUT}
+        if len(rows) == POLL_BATCH or len(self._gaps) > MAX_GAPS:
+            # Troppo indietro: più semplice ripartire con le cache vuote
+            self._gaps.clear()
+            self.flush_all()
+            return len(rows)
+        if events:
+            self.dispatch(events)
+        return len(events)
+
+
+cache_bus = CacheBus()
+
+
+def _entity_events(session):
+    events = []
+    for objects, check in ((session.new, False), (session.dirty, True), (session.deleted, False)):
+        for obj in objects:
+            spec = TOPICS.get(type(obj))
+            if spec is None or (check and not session.is_modified(obj, include_collections=False)):
+                continue
+            topic, attribute = spec
+            key = getattr(obj, attribute, None)
+            events.append((topic, None if key is None else str(key)))  # Senza chiave: tutto il topic
+    return events
+
+
+# 📣 Pubblicazione: nella transazione della scrittura, consegna locale al commit
+@event.listens_for(Session, "after_flush")
+def _publish(session, flush_context):
+    events = _entity_events(session)
+    if not events:
+        return
+    session.info.setdefault("cache_bus_events", []).extend(events)
+    if cache_bus.enabled:
+        origin = cache_bus.origin
+        session.connection().execute(
+            insert(_table),
+            [{"topic": topic, "key": key, "origin": origin} for topic, key in dict.fromkeys(events)]
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_local(session):
+    events = session.info.pop("cache_bus_events", None)
+    if events:
+        cache_bus.dispatch(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("cache_bus_events", None)
+
+
+def init_cache_bus(app):
+    cache_bus.configure(app)
+    if cache_bus.enabled:
+        with app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    _table.create(conn, checkfirst=True)  # Database esistenti: db.create_all la crea solo se nuova
+            except SQLAlchemyError as e:
+                logger.warning("Creazione della tabella del bus di invalidazione fallita: %s", str(e),
+                               extra={"event": "cache_bus.table_failed"})
+
+    @app.before_request
+    def _poll_cache_bus():
+        cache_bus.poll()
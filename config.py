@@ -1,3 +1,4 @@
+import json
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -14,6 +15,122 @@ class Config:
     JWT_COOKIE_CSRF_PROTECT = False
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=20)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # 🔁 Rinnovo dell'access token scaduto dentro la stessa richiesta
+    JWT_SILENT_REFRESH = os.getenv("JWT_SILENT_REFRESH", "true").lower() == "true"
+    JWT_SILENT_REFRESH_LEEWAY = int(os.getenv("JWT_SILENT_REFRESH_LEEWAY", "0"))  # Secondi di anticipo sulla scadenza
 
     SQLALCHEMY_DATABASE_URI = os.getenv("SQLALCHEMY_DATABASE_URI", "sqlite:///default.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # 🗄️ Pool di connessioni: deve coprire la concorrenza di ogni worker (vedi gunicorn.conf.py)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    SQLALCHEMY_ENGINE_OPTIONS = {} if SQLALCHEMY_DATABASE_URI.startswith("sqlite") else {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True
+    }
+
+    # 📧 Flask-Mail
+    MAIL_SERVER = os.getenv("MAIL_SERVER", "localhost")
+    MAIL_PORT = int(os.getenv("MAIL_PORT", "25"))
+    MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "false").lower() == "true"
+    MAIL_USE_SSL = os.getenv("MAIL_USE_SSL", "false").lower() == "true"
+    MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+    MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER", "noreply@vivirent.it")
+
+    # 🔐 Hashing password in un pool di processi (0 = nel thread della richiesta)
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")  # Cambiarlo forza il rehash al login
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "16"))  # Operazioni in corso prima del 503
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+    # 🚦 Rate limiting degli endpoint non autenticati
+    RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "true").lower() == "true"
+    RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")  # "sqlite:////tmp/ratelimit.db" per condividerlo tra i worker
+    RATELIMIT_TRUSTED_PROXIES = int(os.getenv("RATELIMIT_TRUSTED_PROXIES", "0"))  # Proxy davanti all'app (X-Forwarded-For)
+    # (chiave, algoritmo, limite, periodo in secondi)
+    RATELIMIT_RULES = {
+        "login": [("ip", "bucket", 10, 60), ("email", "window", 10, 900)],
+        "register": [("ip", "bucket", 5, 3600), ("email", "window", 3, 3600)],
+        "password_reset": [("ip", "bucket", 5, 3600), ("email", "window", 3, 3600)],
+    }
+
+    # 🔑 Idempotency-Key per POST /booking e /cart/submit
+    IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))  # Secondi di validità della risposta salvata
+    IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "35"))  # Secondi di una richiesta "processing" (> GUNICORN_TIMEOUT)
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))  # Attesa massima dei duplicati concorrenti
+
+    # 🔒 Ammissione delle prenotazioni serializzata per veicolo (vedi admission.py)
+    BOOKING_LOCK_STRIPES = int(os.getenv("BOOKING_LOCK_STRIPES", "64"))
+    BOOKING_LOCK_TIMEOUT = float(os.getenv("BOOKING_LOCK_TIMEOUT", "10"))
+    # 🛡️ Vincolo anti-sovrapposizione nel database (trigger / exclusion constraint)
+    BOOKING_OVERLAP_GUARD = os.getenv("BOOKING_OVERLAP_GUARD", "true").lower() == "true"
+    BOOKING_PRECHECK = os.getenv("BOOKING_PRECHECK", "true").lower() == "true"  # Controlli Python come fail-fast
+
+    # 💶 Motore di preventivi e verifica dei prezzi lato server (vedi pricing.py)
+    PRICING_FLEET_TTL = float(os.getenv("PRICING_FLEET_TTL", "60"))  # Secondi di validità del listino in memoria
+    PRICE_VERIFICATION = os.getenv("PRICE_VERIFICATION", "log").lower()  # enforce | log | off ("enforce" quando i client usano /quotes)
+    PRICE_TOLERANCE = float(os.getenv("PRICE_TOLERANCE", "0.01"))  # Differenza massima accettata (euro)
+    PRICING_MAX_BATCH = int(os.getenv("PRICING_MAX_BATCH", "500"))  # Combinazioni massime per POST /quotes
+    PRICING_ACCESSORY_PRICES = json.loads(os.getenv("PRICING_ACCESSORY_PRICES", "{}"))  # {"nome accessorio": prezzo}
+    # 📅 Calendario tariffario (vedi rates.py): orizzonte delle somme prefisse orarie
+    RATE_CALENDAR_START = os.getenv("RATE_CALENDAR_START")  # YYYY-MM-DD, default 1 gennaio dell'anno scorso
+    RATE_CALENDAR_YEARS = int(os.getenv("RATE_CALENDAR_YEARS", "3"))
+
+    # 📊 Aggregati di utilizzo per veicolo e giorno (vedi analytics.py); dopo averli riattivati: POST /admin/analytics/rebuild
+    ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
+
+    # 🎫 Cache LRU per codice delle prenotazioni che iniziano oggi (vedi booking_lookup.py)
+    BOOKING_CODE_CACHE_SIZE = int(os.getenv("BOOKING_CODE_CACHE_SIZE", "512"))  # 0 = disattivata
+    BOOKING_CODE_CACHE_TTL = float(os.getenv("BOOKING_CODE_CACHE_TTL", "30"))  # Limite alla staleness tra worker
+
+    # 📅 Fuso orario del noleggio: le date con offset ricevute dalle API vengono convertite in quest'ora locale
+    APP_TIMEZONE = os.getenv("APP_TIMEZONE", "Europe/Rome")
+
+    # 📣 Bus di invalidazione delle cache in-process tra i worker (vedi cache_bus.py)
+    CACHE_BUS_ENABLED = os.getenv("CACHE_BUS_ENABLED", "true").lower() == "true"
+    CACHE_BUS_POLL_INTERVAL = float(os.getenv("CACHE_BUS_POLL_INTERVAL", "0.5"))  # Secondi minimi tra due controlli per worker
+    CACHE_BUS_RETENTION = int(os.getenv("CACHE_BUS_RETENTION", "3600"))  # Secondi di storico degli eventi (> TTL delle cache)
+
+    # 🚗 Disponibilità per intervallo: single-flight e stale-while-revalidate (vedi availability_cache.py)
+    AVAILABILITY_CACHE_SIZE = int(os.getenv("AVAILABILITY_CACHE_SIZE", "256"))  # Intervalli in memoria (0 = solo single-flight)
+    AVAILABILITY_CACHE_TTL = float(os.getenv("AVAILABILITY_CACHE_TTL", "5"))  # Secondi in cui il risultato è fresco
+    AVAILABILITY_CACHE_STALE = float(os.getenv("AVAILABILITY_CACHE_STALE", "60"))  # Secondi in cui è servito mentre si ricalcola
+    AVAILABILITY_CACHE_WAIT_TIMEOUT = float(os.getenv("AVAILABILITY_CACHE_WAIT_TIMEOUT", "10"))  # Attesa massima del calcolo condiviso
+
+    # 🧹 Manutenzione in background (vedi maintenance.py, avviata dai worker gunicorn)
+    MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+    MAINTENANCE_LEADER_LOCK = os.getenv("MAINTENANCE_LEADER_LOCK", "db")  # "db" oppure "file:/percorso/lock"
+    MAINTENANCE_TICK = float(os.getenv("MAINTENANCE_TICK", "60"))  # Secondi tra un controllo e l'altro
+    MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))  # Secondi tra due esecuzioni di un job
+    MAINTENANCE_CHUNK_SIZE = int(os.getenv("MAINTENANCE_CHUNK_SIZE", "500"))  # Righe cancellate per transazione
+    MAINTENANCE_CHUNK_PAUSE = float(os.getenv("MAINTENANCE_CHUNK_PAUSE", "0.1"))  # Pausa tra due blocchi
+    MAINTENANCE_MAX_CHUNKS = int(os.getenv("MAINTENANCE_MAX_CHUNKS", "200"))  # Blocchi massimi per esecuzione
+    MAINTENANCE_TOKEN_RETENTION_DAYS = int(os.getenv("MAINTENANCE_TOKEN_RETENTION_DAYS", "30"))
+    MAINTENANCE_CART_INACTIVE_DAYS = int(os.getenv("MAINTENANCE_CART_INACTIVE_DAYS", "30"))
+    # 🗄️ Prenotazioni chiuse spostate in bookings_archive dopo N giorni (0 = disattivato, vedi archive.py)
+    BOOKING_ARCHIVE_AFTER_DAYS = int(os.getenv("BOOKING_ARCHIVE_AFTER_DAYS", "180"))
+
+    # 📊 Metriche Prometheus (/metrics)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")  # Directory condivisa tra i worker gunicorn
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+    # 🔍 Profiler SQL per richiesta (opt-in)
+    SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER_ENABLED", "false").lower() == "true"
+    SQL_PROFILER_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_PROFILER_N_PLUS_ONE_THRESHOLD", "5"))
+    SQL_PROFILER_SLOW_MS = float(os.getenv("SQL_PROFILER_SLOW_MS", "100"))
+    SQL_PROFILER_EXPLAIN = os.getenv("SQL_PROFILER_EXPLAIN", "true").lower() == "true"
+    SQL_PROFILER_BUFFER_SIZE = int(os.getenv("SQL_PROFILER_BUFFER_SIZE", "200"))
+
+    # 📝 Logging strutturato
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # Es. "models=DEBUG,sqlalchemy.engine=WARNING"
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "cart.add_item=0.1,auth.token_refreshed=0.1")
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # 📘 Documentazione API
+    SWAGGER_UI_ENABLED = os.getenv("SWAGGER_UI_ENABLED", "false").lower() == "true"
+    SWAGGER_PRELOAD = os.getenv("SWAGGER_PRELOAD", "true").lower() == "true"
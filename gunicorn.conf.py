@@ -0,0 +1,115 @@
+"""
+Configurazione di gunicorn per ViviRent.
+
+WORKER_MODE sceglie il modello di concorrenza di ogni worker:
+- sync    (default) un processo serve una richiesta alla volta;
+- gthread un pool di GUNICORN_THREADS thread per processo;
+- gevent  greenlet cooperativi (GUNICORN_WORKER_CONNECTIONS per processo):
+          gunicorn applica il monkey patching prima di caricare l'app, quindi
+          PyMySQL (puro Python) e smtplib di Flask-Mail diventano cooperativi.
+
+All'avvio vengono rifiutate le combinazioni non sicure (vedi _check_worker_mode).
+"""
+import importlib.util
+import os
+import sys
+
+from config import Config
+
+worker_mode = os.getenv("WORKER_MODE", "sync").lower()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+if worker_mode == "sync":
+    worker_class = "sync"
+elif worker_mode == "gthread":
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", "8"))
+elif worker_mode == "gevent":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+else:
+    raise RuntimeError(f"WORKER_MODE non valido: '{worker_mode}'. Usa sync, gthread o gevent.")
+
+# Driver con estensioni C che bloccano l'hub di gevent durante l'I/O di rete
+BLOCKING_DRIVERS = {"mysqldb", "mysqlconnector", "psycopg2", "pyodbc"}
+DEFAULT_DRIVERS = {"mysql": "mysqldb", "mariadb": "mysqldb", "postgresql": "psycopg2", "sqlite": "pysqlite"}
+
+
+def _database_driver(uri):
+    scheme = uri.split("://", 1)[0]
+    backend, _, driver = scheme.partition("+")
+    return backend, driver or DEFAULT_DRIVERS.get(backend, "")
+
+
+def _check_worker_mode():
+    uri = Config.SQLALCHEMY_DATABASE_URI
+    backend, driver = _database_driver(uri)
+    options = Config.SQLALCHEMY_ENGINE_OPTIONS
+    pool_capacity = options.get("pool_size", 5) + options.get("max_overflow", 10)
+    errors, warnings = [], []
+
+    if worker_mode == "gthread":
+        if backend == "sqlite" and uri.rstrip("/") in ("sqlite:", "sqlite:///:memory:"):
+            errors.append("gthread con SQLite in memoria: ogni thread vedrebbe un database diverso.")
+        if threads > pool_capacity:
+            errors.append(
+                f"GUNICORN_THREADS={threads} supera la capacità del pool DB ({pool_capacity}): "
+                "aumenta DB_POOL_SIZE/DB_MAX_OVERFLOW o riduci i thread."
+            )
+
+    if worker_mode == "gevent":
+        if importlib.util.find_spec("gevent") is None:
+            errors.append("WORKER_MODE=gevent richiede il pacchetto 'gevent'.")
+        if driver in BLOCKING_DRIVERS:
+            errors.append(
+                f"Il driver '{driver}' non è cooperativo con gevent: usa mysql+pymysql:// nell'URI del database."
+            )
+        if preload_app:
+            errors.append(
+                "GUNICORN_PRELOAD con gevent carica l'app prima del monkey patching: "
+                "engine, socket e thread resterebbero bloccanti."
+            )
+        if backend == "sqlite":
+            warnings.append("SQLite con gevent: le query bloccano l'hub, usare solo in sviluppo.")
+        if worker_connections > pool_capacity:
+            warnings.append(
+                f"GUNICORN_WORKER_CONNECTIONS={worker_connections} supera il pool DB ({pool_capacity}): "
+                "le richieste oltre il pool attenderanno una connessione libera."
+            )
+
+    for message in warnings:
+        sys.stderr.write(f"[gunicorn.conf] ⚠️ {message}\n")
+
+    if errors:
+        raise RuntimeError("Configurazione gunicorn non sicura:\n - " + "\n - ".join(errors))
+
+
+_check_worker_mode()
+
+
+def post_worker_init(worker):
+    # 🧹 Ogni worker avvia lo scheduler di manutenzione: solo il leader esegue i job
+    from app import app
+    from maintenance import scheduler
+    scheduler.start(app)
+
+
+def worker_exit(server, worker):
+    # Rilascia il lease così un altro worker subentra senza attendere la scadenza
+    from maintenance import scheduler
+    scheduler.stop()
+
+    # 📊 Ultimo flush delle metriche: le richieste dell'ultimo intervallo non vanno perse
+    from metrics import registry
+    registry.maybe_flush(force=True)
+
+
+def child_exit(server, worker):
+    # 📊 Nel master, anche per i worker uccisi: il loro file confluisce nei totali dei worker terminati
+    if Config.METRICS_ENABLED and Config.METRICS_MULTIPROC_DIR:
+        from metrics import mark_process_dead
+        mark_process_dead(worker.pid, Config.METRICS_MULTIPROC_DIR)
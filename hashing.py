@@ -0,0 +1,152 @@
+"""
+Servizio di hashing delle password.
+
+Le KDF di werkzeug (scrypt/pbkdf2) sono volutamente lente e, eseguite nel
+thread della richiesta, tengono il GIL bloccando tutte le altre richieste del
+worker. Qui vengono eseguite in un pool di processi limitato: oltre
+PASSWORD_HASH_QUEUE_DEPTH operazioni in corso la richiesta viene rifiutata
+subito con HashingBusyError invece di accumularsi in coda.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from time import perf_counter
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+
+class HashingBusyError(Exception):
+    """
+    Troppe operazioni di hashing in corso: il chiamante deve rispondere 503.
+    """
+
+    retry_after = 1
+
+
+# ⚙️ Eseguite nei processi del pool: devono restare funzioni di modulo (pickle)
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.workers = 0
+        self.queue_depth = 16
+        self.timeout = 10.0
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        self._lock = threading.Lock()
+
+    def configure(self, app):
+        self.method = app.config.get("PASSWORD_HASH_METHOD", DEFAULT_METHOD)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", 0)
+        self.queue_depth = app.config.get("PASSWORD_HASH_QUEUE_DEPTH", 16)
+        self.timeout = app.config.get("PASSWORD_HASH_TIMEOUT", 10.0)
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        self._shutdown()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # forkserver: i processi del pool non ereditano thread e connessioni del worker
+                    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+                    )
+        return self._executor
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _after_fork(self):
+        # Il pool del processo padre non è utilizzabile dal figlio
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+
+    def _run(self, operation, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            registry.observe_hash(operation, "rejected", 0.0)
+            logger.warning("Coda di hashing piena", extra={"event": "hashing.rejected", "operation": operation})
+            raise HashingBusyError("Servizio di autenticazione sovraccarico, riprova tra poco.")
+
+        started = perf_counter()
+        if self.workers <= 0:
+            try:
+                result = fn(*args)  # Modalità sincrona (sviluppo, script)
+            finally:
+                slots.release()
+            registry.observe_hash(operation, "ok", perf_counter() - started)
+            return result
+
+        try:
+            future = self._pool().submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._executor = None
+            registry.observe_hash(operation, "error", perf_counter() - started)
+            raise HashingBusyError("Servizio di hashing non disponibile, riprova tra poco.")
+        except BaseException:
+            slots.release()
+            raise
+        # Lo slot resta occupato finché la KDF non è davvero finita (o cancellata in coda),
+        # anche se il chiamante smette di aspettare: la coda del pool non supera queue_depth
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # Ancora in coda: non verrà eseguita
+            registry.observe_hash(operation, "timeout", perf_counter() - started)
+            raise HashingBusyError("Timeout del servizio di hashing, riprova tra poco.")
+        except BrokenProcessPool:
+            # Un processo del pool è morto: il pool verrà ricreato alla prossima chiamata
+            self._executor = None
+            registry.observe_hash(operation, "error", perf_counter() - started)
+            raise HashingBusyError("Servizio di hashing non disponibile, riprova tra poco.")
+
+        registry.observe_hash(operation, "ok", perf_counter() - started)
+        return result
+
+    def hash(self, password):
+        return self._run("hash", _hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run("verify", _verify, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        True se l'hash è stato generato con parametri diversi da quelli
+        correnti (es. dopo aver aumentato il costo di scrypt).
+        """
+        return password_hash.split("$", 1)[0] != self.method
+
+
+hasher = PasswordHasher()
+os.register_at_fork(after_in_child=hasher._after_fork)
+
+
+def init_hashing(app):
+    """
+    Configura il pool di hashing. Con PASSWORD_HASH_WORKERS=0 le KDF girano
+    nel thread della richiesta.
+    """
+    hasher.configure(app)
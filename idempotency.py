@@ -0,0 +1,184 @@
+"""
+Supporto all'header Idempotency-Key per le operazioni di scrittura
+(POST /booking, POST /cart/submit).
+
+La prima richiesta con una certa chiave registra una riga "processing",
+esegue la view e salva status e corpo della risposta. I retry con la stessa
+chiave (stesso utente, stesso endpoint) rileggono la risposta salvata con una
+sola query; se l'originale è ancora in corso attendono che finisca.
+
+La riga "processing" ha un lease breve (IDEMPOTENCY_LEASE, poco più del
+timeout delle richieste): se il worker muore a metà, ad esempio ucciso da
+gunicorn per timeout, un retry successivo alla scadenza del lease riprende
+la chiave. Solo la risposta salvata resta valida per IDEMPOTENCY_TTL.
+
+Le righe vengono scritte su una connessione separata dalla sessione ORM della
+view, così il commit/rollback della view non interferisce con il registro.
+"""
+import hashlib
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+_table = IdempotencyKey.__table__
+
+
+def _error(status, code, message):
+    return make_response(jsonify({"error": code, "message": message}), status)
+
+
+def _replay(row):
+    response = current_app.response_class(
+        row.response_body, status=row.response_status, content_type=row.content_type
+    )
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _fetch(key):
+    with db.engine.connect() as conn:
+        return conn.execute(select(_table).where(_table.c.key == key)).first()
+
+
+def _claim(key, user_id, fingerprint, lease):
+    """
+    Prova a registrare la chiave come "processing", o a riprenderla se la riga
+    esistente è scaduta (lease di un worker morto o risposta oltre il TTL).
+    Restituisce il token casuale che identifica il proprietario, oppure None
+    se la chiave è di un'altra richiesta.
+    """
+    now = datetime.utcnow()
+    owner = uuid.uuid4().hex
+    values = dict(user_id=user_id, fingerprint=fingerprint, status="processing", response_status=None,
+                  response_body=None, content_type=None, owner=owner, created_at=now, expires_at=now + lease)
+    try:
+        with db.engine.begin() as conn:
+            taken = conn.execute(
+                update(_table).where(_table.c.key == key, _table.c.expires_at < now).values(**values)
+            ).rowcount
+            if not taken:
+                conn.execute(insert(_table).values(key=key, **values))
+        return owner
+    except IntegrityError:
+        return None
+
+
+def _owned(key, owner):
+    # Un worker lento oltre il lease non deve toccare la riga ripresa da un retry.
+    # Token e non created_at: DATETIME su MySQL perde i microsecondi
+    return (_table.c.key == key) & (_table.c.owner == owner)
+
+
+def _release(key, owner):
+    with db.engine.begin() as conn:
+        conn.execute(delete(_table).where(_owned(key, owner)))
+
+
+def _store(key, owner, response, ttl):
+    with db.engine.begin() as conn:
+        conn.execute(update(_table).where(_owned(key, owner)).values(
+            status="done",
+            response_status=response.status_code,
+            response_body=response.get_data(as_text=True),
+            content_type=response.content_type,
+            expires_at=datetime.utcnow() + ttl
+        ))
+
+
+def _lease_expired(row):
+    return row.status == "processing" and row.expires_at < datetime.utcnow()
+
+
+def _wait_for_result(key, timeout):
+    """
+    Attende che la richiesta originale completi (polling con backoff).
+    Restituisce la riga finale, None se è stata rilasciata, oppure la riga
+    ancora "processing" se il timeout o il lease sono scaduti.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.02
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 0.25)
+        row = _fetch(key)
+        if row is None or row.status == "done" or _lease_expired(row):
+            return row
+    return _fetch(key)
+
+
+def idempotent(name):
+    """
+    Decoratore per le view POST protette da JWT: va applicato dopo
+    @jwt_required() perché la chiave è legata all'utente.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            client_key = request.headers.get(HEADER)
+            if not client_key:
+                return fn(*args, **kwargs)
+            if len(client_key) > MAX_KEY_LENGTH:
+                return _error(400, "invalid_idempotency_key", f"{HEADER} non può superare {MAX_KEY_LENGTH} caratteri.")
+
+            user_id = get_jwt_identity()
+            key = hashlib.sha256(f"{user_id}\x1f{name}\x1f{client_key}".encode()).hexdigest()
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            ttl = timedelta(seconds=current_app.config.get("IDEMPOTENCY_TTL", 86400))
+            lease = timedelta(seconds=current_app.config.get("IDEMPOTENCY_LEASE", 35))
+            wait_timeout = current_app.config.get("IDEMPOTENCY_WAIT_TIMEOUT", 10.0)
+
+            for _ in range(3):
+                # 🔁 Retry: una sola lettura se la risposta è già salvata
+                row = _fetch(key)
+                if row is None or row.expires_at < datetime.utcnow():
+                    # Chiave libera, scaduta o lasciata "processing" da un worker morto
+                    owner = _claim(key, user_id, fingerprint, lease)
+                    if owner is not None:
+                        break
+                    continue  # Un'altra richiesta ha appena registrato la chiave
+
+                if row.fingerprint != fingerprint:
+                    return _error(422, "idempotency_key_reused",
+                                  f"{HEADER} già usata con un corpo della richiesta diverso.")
+                if row.status == "processing":
+                    row = _wait_for_result(key, wait_timeout)
+                    if row is None or _lease_expired(row):
+                        continue  # L'originale è fallita o il suo worker è morto: questa richiesta può riprovare
+                    if row.status != "done":
+                        response = _error(409, "idempotency_in_progress",
+                                          "Una richiesta con la stessa Idempotency-Key è ancora in corso.")
+                        response.headers["Retry-After"] = "1"
+                        return response
+                logger.info("Risposta idempotente riprodotta", extra={"event": "idempotency.replayed", "endpoint": name})
+                return _replay(row)
+            else:
+                return _error(409, "idempotency_in_progress", "Impossibile acquisire la Idempotency-Key, riprova.")
+
+            # 🥇 Prima richiesta: esegue la view e salva l'esito
+            try:
+                response = make_response(fn(*args, **kwargs))
+            except Exception:
+                _release(key, owner)
+                raise
+
+            if response.status_code >= 500:
+                _release(key, owner)  # Errore transitorio: il retry deve poter rieseguire l'operazione
+            else:
+                _store(key, owner, response, ttl)
+            return response
+        return wrapper
+    return decorator
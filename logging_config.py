@@ -0,0 +1,145 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# Attributi standard di LogRecord: tutto il resto viene serializzato come campo extra
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def _parse_mapping(raw, cast):
+    """
+    Converte "models=INFO,routes=WARNING" in {"models": "INFO", "routes": "WARNING"}.
+    """
+    mapping = {}
+    for pair in (raw or "").split(","):
+        if "=" not in pair:
+            continue
+        key, value = pair.split("=", 1)
+        mapping[key.strip()] = cast(value.strip())
+    return mapping
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una riga JSON per evento, con request_id ed eventuali campi extra.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Aggiunge il request_id della richiesta corrente. Gira nel thread della
+    richiesta, prima che il record venga messo in coda.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id") if has_request_context() else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Campiona gli eventi ad alto volume: il tasso arriva da LOG_SAMPLE_RATES
+    (per nome evento) oppure dall'attributo `sample_rate` passato in `extra`.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Se la coda è piena il record viene scartato invece di bloccare la richiesta.
+    """
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+def _restart_listener():
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+def init_logging(app):
+    """
+    Configura il logging strutturato: i thread delle richieste mettono i record
+    in una coda limitata, un thread in background li scrive in JSON su stdout.
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=app.config.get("LOG_QUEUE_SIZE", 10000))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(SamplingFilter(_parse_mapping(app.config.get("LOG_SAMPLE_RATES"), float)))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(app.config.get("LOG_LEVEL", "INFO"))
+
+    # 🎚️ Livelli per modulo, es. LOG_LEVELS="models=DEBUG,sqlalchemy.engine=WARNING"
+    for name, level in _parse_mapping(app.config.get("LOG_LEVELS"), str.upper).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    # 🍴 Con gunicorn --preload il thread del listener non sopravvive al fork dei worker
+    os.register_at_fork(after_in_child=_restart_listener)
+
+    @app.before_request
+    def _assign_request_id():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+    @app.after_request
+    def _expose_request_id(response):
+        request_id = g.get("request_id")
+        if request_id:
+            response.headers["X-Request-ID"] = request_id
+        return response
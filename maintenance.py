@@ -0,0 +1,263 @@
+"""
+Scheduler di manutenzione in-process.
+
+Ogni worker gunicorn avvia lo scheduler (hook post_worker_init in
+gunicorn.conf.py), ma solo il leader esegue i job. Il leader si elegge con:
+- "db":            lease nella tabella maintenance_leases, rinnovato a ogni
+                   tick e conteso solo quando è scaduto (funziona anche con
+                   più macchine sullo stesso database);
+- "file:<path>":   flock esclusivo su un file locale (solo worker della stessa
+                   macchina).
+
+I job cancellano a blocchi di MAINTENANCE_CHUNK_SIZE righe, con un commit e
+una pausa tra un blocco e l'altro per non monopolizzare il database, e
+riportano righe processate e durata.
+"""
+import fcntl
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from archive import archive_closed_bookings
+from models import db, CacheInvalidation, Cart, CartItem, IdempotencyKey, MaintenanceLease, TokenBlacklist
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "maintenance"
+
+
+class DBLease:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def acquire(self):
+        """
+        True se questo processo è (o diventa) il leader. Rinnova il lease.
+        """
+        table = MaintenanceLease.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        with db.engine.begin() as conn:
+            renewed = conn.execute(
+                update(table)
+                .where(table.c.name == LEASE_NAME)
+                .where((table.c.holder == self.holder) | (table.c.expires_at < now))
+                .values(holder=self.holder, expires_at=expires_at)
+            ).rowcount
+        if renewed:
+            return True
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(table).values(name=LEASE_NAME, holder=self.holder, expires_at=expires_at))
+            return True
+        except IntegrityError:
+            return False  # Lease valido di un altro worker
+
+    def release(self):
+        table = MaintenanceLease.__table__
+        with db.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.name == LEASE_NAME, table.c.holder == self.holder))
+
+
+class FileLease:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd  # Il lock resta finché il processo vive
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def delete_in_chunks(table, pk, where, chunk_size, pause, max_chunks):
+    """
+    Cancella le righe che soddisfano `where` a blocchi di chunk_size, con un
+    commit per blocco. Restituisce il numero di righe cancellate.
+    """
+    deleted = 0
+    for _ in range(max_chunks):
+        with db.engine.begin() as conn:
+            ids = conn.execute(select(pk).where(where).limit(chunk_size)).scalars().all()
+            if not ids:
+                break
+            deleted += conn.execute(delete(table).where(pk.in_(ids))).rowcount
+        if len(ids) < chunk_size:
+            break
+        time.sleep(pause)  # ⏳ Lascia spazio al traffico delle richieste
+    return deleted
+
+
+# 🧹 Job: ognuno restituisce il numero di righe processate
+def purge_revoked_tokens(config, chunk):
+    threshold = datetime.utcnow() - timedelta(days=config.get("MAINTENANCE_TOKEN_RETENTION_DAYS", 30))
+    return delete_in_chunks(
+        TokenBlacklist.__table__, TokenBlacklist.id, TokenBlacklist.created_at < threshold, **chunk
+    )
+
+
+def purge_stale_carts(config, chunk):
+    """
+    Svuota i carrelli fermi da MAINTENANCE_CART_INACTIVE_DAYS giorni e cancella
+    quelli non più attivi. Il carrello attivo dell'utente resta (vuoto): le
+    route del carrello lo presuppongono.
+    """
+    threshold = datetime.utcnow() - timedelta(days=config.get("MAINTENANCE_CART_INACTIVE_DAYS", 30))
+    stale_carts = select(Cart.cart_id).where(Cart.updated_at < threshold)
+
+    items = delete_in_chunks(
+        CartItem.__table__, CartItem.item_id, CartItem.cart_id.in_(stale_carts), **chunk
+    )
+    carts = delete_in_chunks(
+        Cart.__table__, Cart.cart_id, (Cart.updated_at < threshold) & (Cart.status != 'active'), **chunk
+    )
+    # Totale dei carrelli attivi rimasti senza item: add_item somma al final_price esistente
+    # (senza filtrare su items, così si recupera anche un run interrotto dopo le delete)
+    has_items = select(CartItem.item_id).where(CartItem.cart_id == Cart.cart_id).exists()
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Cart.__table__)
+            .where(Cart.updated_at < threshold, Cart.status == 'active', Cart.final_price != 0, ~has_items)
+            .values(final_price=0)
+        )
+    return items + carts
+
+
+def purge_idempotency_keys(config, chunk):
+    return delete_in_chunks(
+        IdempotencyKey.__table__, IdempotencyKey.key, IdempotencyKey.expires_at < datetime.utcnow(), **chunk
+    )
+
+
+def purge_cache_invalidations(config, chunk):
+    threshold = datetime.utcnow() - timedelta(seconds=config.get("CACHE_BUS_RETENTION", 3600))
+    return delete_in_chunks(
+        CacheInvalidation.__table__, CacheInvalidation.id, CacheInvalidation.created_at < threshold, **chunk
+    )
+
+
+def archive_bookings(config, chunk):
+    after_days = config.get("BOOKING_ARCHIVE_AFTER_DAYS", 180)
+    if after_days <= 0:
+        return 0  # Archiviazione disattivata
+    return archive_closed_bookings(after_days, **chunk)
+
+
+JOBS = {
+    "purge_revoked_tokens": purge_revoked_tokens,
+    "purge_stale_carts": purge_stale_carts,
+    "purge_idempotency_keys": purge_idempotency_keys,
+    "purge_cache_invalidations": purge_cache_invalidations,
+    "archive_bookings": archive_bookings,
+}
+
+
+class MaintenanceScheduler:
+    def __init__(self):
+        self.app = None
+        self.lease = None
+        self.tick = 60.0
+        self.intervals = {}
+        self.chunk = {}
+        self.last_runs = {}   # job -> {"at", "rows", "duration_ms", "error"}
+        self._next_run = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, app):
+        config = app.config
+        self.app = app
+        self.tick = config.get("MAINTENANCE_TICK", 60.0)
+        self.intervals = {name: config.get("MAINTENANCE_INTERVAL", 3600.0) for name in JOBS}
+        self.chunk = {
+            "chunk_size": config.get("MAINTENANCE_CHUNK_SIZE", 500),
+            "pause": config.get("MAINTENANCE_CHUNK_PAUSE", 0.1),
+            "max_chunks": config.get("MAINTENANCE_MAX_CHUNKS", 200),
+        }
+        lock = config.get("MAINTENANCE_LEADER_LOCK", "db")
+        if lock.startswith("file:"):
+            self.lease = FileLease(lock[len("file:"):])
+        else:
+            self.lease = DBLease(ttl=self.tick * 3)
+
+    def run_job(self, name):
+        """
+        Esegue un job e ne registra righe processate e durata.
+        """
+        started = perf_counter()
+        result = {"at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), "rows": 0, "error": None}
+        try:
+            with self.app.app_context():
+                result["rows"] = JOBS[name](self.app.config, self.chunk)
+        except Exception as e:
+            result["error"] = str(e)
+        result["duration_ms"] = round((perf_counter() - started) * 1000, 1)
+        self.last_runs[name] = result
+
+        level = logging.WARNING if result["error"] else logging.INFO
+        logger.log(level, "Job di manutenzione %s completato", name, extra={
+            "event": "maintenance.job", "job": name, "rows": result["rows"],
+            "duration_ms": result["duration_ms"], "error": result["error"]
+        })
+        return result
+
+    def run_pending(self):
+        now = time.monotonic()
+        with self.app.app_context():
+            if not self.lease.acquire():
+                return
+        for name in JOBS:
+            if now >= self._next_run.get(name, 0):
+                self.run_job(name)
+                self._next_run[name] = time.monotonic() + self.intervals[name]
+
+    def _loop(self):
+        # Avvio sfalsato: i worker non contendono il lease tutti nello stesso istante
+        self._stop.wait(random.uniform(0, min(self.tick, 10)))
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.warning("Tick di manutenzione fallito: %s", str(e), extra={"event": "maintenance.tick_failed"})
+            self._stop.wait(self.tick)
+
+    def start(self, app):
+        if not app.config.get("MAINTENANCE_ENABLED", True) or self._thread is not None:
+            return
+        self.configure(app)
+        self._thread = threading.Thread(target=self._loop, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.lease is not None and self.app is not None:
+            with self.app.app_context():
+                self.lease.release()
+
+
+scheduler = MaintenanceScheduler()
@@ -0,0 +1,379 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from time import perf_counter
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS, CACHING_DISABLED, NO_CACHE_KEY
+
+# ⏱️ Bucket dell'istogramma delle latenze (secondi)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_SEP = "\x1f"
+DEAD_FILE = "metrics_dead.json"  # Totali dei worker terminati (come mark_process_dead di prometheus_client)
+LOCK_FILE = "metrics.lock"
+TABLES = ("requests", "latency", "db", "hash", "sql_cache")
+
+# 🧩 Esito della cache di compilazione di SQLAlchemy per ogni statement eseguito
+CACHE_OUTCOMES = {CACHE_HIT: "hit", CACHE_MISS: "miss", CACHING_DISABLED: "disabled", NO_CACHE_KEY: "no_key"}
+
+
+class _Shard:
+    """
+    Contatori di un singolo thread: gli aggiornamenti non prendono lock,
+    i frammenti vengono sommati solo al momento dello scrape.
+    """
+
+    def __init__(self):
+        self.requests = {}   # (endpoint, method, status) -> count
+        self.latency = {}    # (endpoint, method) -> [bucket..., +Inf, sum]
+        self.db = {}         # (endpoint, method) -> [statements, seconds]
+        self.hash = {}       # (operation, outcome) -> [count, seconds]
+        self.sql_cache = {}  # (outcome,) -> count
+
+    def add(self, other):
+        # dict() e list() copiano in modo atomico sotto il GIL
+        for name in TABLES:
+            target = getattr(self, name)
+            for key, value in dict(getattr(other, name)).items():
+                if isinstance(value, list):
+                    merged = target.setdefault(key, [0] * len(value))
+                    for i, v in enumerate(list(value)):
+                        merged[i] += v
+                else:
+                    target[key] = target.get(key, 0) + value
+
+
+class _ShardOwner:
+    """
+    Segnaposto nel threading.local: quando il thread (o il greenlet, con
+    gevent) termina viene raccolto e il suo frammento va nei ritirati.
+    """
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()  # Contatori dei thread terminati
+        self._shards_lock = threading.RLock()  # Nuovi thread, ritiri e scrape; rientrante per i finalizer
+        self.multiproc_dir = None
+        self.flush_interval = 5.0
+        self._last_flush = 0.0
+        self._flush_pid = None
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            owner = _ShardOwner()
+            self._local.shard = shard
+            self._local.owner = owner
+            weakref.finalize(owner, self._retire, shard)
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    # 🧹 Thread e greenlet di breve durata (refresh, manutenzione, richieste gevent) non accumulano frammenti
+    def _retire(self, shard):
+        with self._shards_lock:
+            self._retired.add(shard)
+            try:
+                self._shards.remove(shard)
+            except ValueError:
+                pass
+
+    # ➕ Registra una richiesta conclusa
+    def observe_request(self, endpoint, method, status, elapsed, db_statements, db_seconds):
+        shard = self._shard()
+
+        key = (endpoint, method, str(status))
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+
+        lkey = (endpoint, method)
+        hist = shard.latency.get(lkey)
+        if hist is None:
+            hist = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            shard.latency[lkey] = hist
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                hist[i] += 1
+                break
+        else:
+            hist[len(LATENCY_BUCKETS)] += 1
+        hist[-1] += elapsed
+
+        db_row = shard.db.get(lkey)
+        if db_row is None:
+            db_row = [0, 0.0]
+            shard.db[lkey] = db_row
+        db_row[0] += db_statements
+        db_row[1] += db_seconds
+
+    # 🔐 Operazioni del servizio di hashing password (hash/verify)
+    def observe_hash(self, operation, outcome, seconds):
+        shard = self._shard()
+        row = shard.hash.get((operation, outcome))
+        if row is None:
+            row = [0, 0.0]
+            shard.hash[(operation, outcome)] = row
+        row[0] += 1
+        row[1] += seconds
+
+    # 🧩 Statement compilati o riusati dalla cache di compilazione
+    def observe_sql_cache(self, outcome):
+        cache = self._shard().sql_cache
+        key = (outcome,)
+        cache[key] = cache.get(key, 0) + 1
+
+    # 🔄 Somma i frammenti di tutti i thread del processo corrente
+    def snapshot(self):
+        total = _Shard()
+        # Sotto lock: un frammento ritirato durante lo scrape non si conta due volte
+        with self._shards_lock:
+            total.add(self._retired)
+            for shard in self._shards:
+                total.add(shard)
+        return {name: getattr(total, name) for name in TABLES}
+
+    # 💾 Modalità multiprocesso: ogni worker scrive il proprio snapshot su file
+    def maybe_flush(self, force=False):
+        if not self.multiproc_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+
+        if self._flush_pid != os.getpid():
+            # Primo flush del processo: un file con lo stesso pid è di un worker morto (pid riusato)
+            mark_process_dead(os.getpid(), self.multiproc_dir)
+            self._flush_pid = os.getpid()
+
+        data = self.snapshot()
+        serializable = {
+            name: {_SEP.join(key): value for key, value in table.items()}
+            for name, table in data.items()
+        }
+        _write_json(os.path.join(self.multiproc_dir, f"metrics_{os.getpid()}.json"), serializable)
+
+    def collect(self):
+        """
+        Restituisce le metriche aggregate: del solo processo corrente oppure,
+        in modalità multiprocesso, di tutti i worker che hanno scritto su file.
+        """
+        if not self.multiproc_dir:
+            return self.snapshot()
+
+        self.maybe_flush(force=True)
+        merged = {}
+        # Lock condiviso: un worker che viene sommato ai terminati non si conta due volte
+        with _dir_lock(self.multiproc_dir, exclusive=False):
+            for filename in os.listdir(self.multiproc_dir):
+                if filename.startswith("metrics_") and filename.endswith(".json"):
+                    _merge_tables(merged, _read_json(os.path.join(self.multiproc_dir, filename)) or {})
+        result = {name: {} for name in TABLES}
+        for name, table in merged.items():
+            result[name] = {tuple(raw_key.split(_SEP)): value for raw_key, value in table.items()}
+        return result
+
+    # 📄 Formato di esposizione testuale di Prometheus
+    def render(self):
+        data = self.collect()
+        lines = [
+            "# HELP vivirent_http_requests_total Richieste HTTP per endpoint, metodo e status.",
+            "# TYPE vivirent_http_requests_total counter",
+        ]
+        for (endpoint, method, status), value in sorted(data["requests"].items()):
+            lines.append(
+                f'vivirent_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}'
+            )
+
+        lines += [
+            "# HELP vivirent_http_request_duration_seconds Latenza delle richieste HTTP.",
+            "# TYPE vivirent_http_request_duration_seconds histogram",
+        ]
+        for (endpoint, method), hist in sorted(data["latency"].items()):
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            cumulative = 0
+            for bound, value in zip(LATENCY_BUCKETS, hist):
+                cumulative += value
+                lines.append(f'vivirent_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += hist[len(LATENCY_BUCKETS)]
+            lines.append(f'vivirent_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"vivirent_http_request_duration_seconds_sum{{{labels}}} {hist[-1]:.6f}")
+            lines.append(f"vivirent_http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+        lines += [
+            "# HELP vivirent_db_statements_total Statement SQL eseguiti per endpoint.",
+            "# TYPE vivirent_db_statements_total counter",
+        ]
+        for (endpoint, method), row in sorted(data["db"].items()):
+            lines.append(f'vivirent_db_statements_total{{endpoint="{endpoint}",method="{method}"}} {row[0]}')
+
+        lines += [
+            "# HELP vivirent_db_time_seconds_total Tempo speso nel database per endpoint.",
+            "# TYPE vivirent_db_time_seconds_total counter",
+        ]
+        for (endpoint, method), row in sorted(data["db"].items()):
+            lines.append(f'vivirent_db_time_seconds_total{{endpoint="{endpoint}",method="{method}"}} {row[1]:.6f}')
+
+        lines += [
+            "# HELP vivirent_password_hash_operations_total Operazioni di hashing password per esito.",
+            "# TYPE vivirent_password_hash_operations_total counter",
+        ]
+        for (operation, outcome), row in sorted(data["hash"].items()):
+            lines.append(
+                f'vivirent_password_hash_operations_total{{operation="{operation}",outcome="{outcome}"}} {row[0]}'
+            )
+
+        lines += [
+            "# HELP vivirent_password_hash_seconds_total Tempo speso nelle KDF (attesa in coda inclusa).",
+            "# TYPE vivirent_password_hash_seconds_total counter",
+        ]
+        for (operation, outcome), row in sorted(data["hash"].items()):
+            lines.append(
+                f'vivirent_password_hash_seconds_total{{operation="{operation}",outcome="{outcome}"}} {row[1]:.6f}'
+            )
+
+        lines += [
+            "# HELP vivirent_sql_compile_cache_total Statement SQL per esito della cache di compilazione.",
+            "# TYPE vivirent_sql_compile_cache_total counter",
+        ]
+        for (outcome,), value in sorted(data["sql_cache"].items()):
+            lines.append(f'vivirent_sql_compile_cache_total{{outcome="{outcome}"}} {value}')
+
+        cache_hits = data["sql_cache"].get(("hit",), 0)
+        cache_lookups = cache_hits + data["sql_cache"].get(("miss",), 0)
+        lines += [
+            "# HELP vivirent_sql_compile_cache_hit_ratio Quota di statement serviti dalla cache di compilazione.",
+            "# TYPE vivirent_sql_compile_cache_hit_ratio gauge",
+            f"vivirent_sql_compile_cache_hit_ratio {cache_hits / cache_lookups if cache_lookups else 0:.4f}",
+        ]
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# 📁 File condivisi della modalità multiprocesso
+@contextmanager
+def _dir_lock(directory, exclusive):
+    with open(os.path.join(directory, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)  # Scrittura atomica, lo scrape non legge mai file a metà
+
+
+def _merge_tables(target, data):
+    for name, table in data.items():
+        merged = target.setdefault(name, {})
+        for raw_key, value in table.items():
+            if isinstance(value, list):
+                current = merged.setdefault(raw_key, [0] * len(value))
+                for i, v in enumerate(value):
+                    current[i] += v
+            else:
+                merged[raw_key] = merged.get(raw_key, 0) + value
+
+
+def mark_process_dead(pid, multiproc_dir):
+    """
+    Somma il file di un worker terminato ai totali dei worker morti e lo
+    rimuove: la directory non cresce con il riciclo dei worker e un pid
+    riusato non sovrascrive i contatori del precedente. Chiamata dal master
+    gunicorn (child_exit) e, per i pid riusati, dal primo flush del worker.
+    """
+    path = os.path.join(multiproc_dir, f"metrics_{pid}.json")
+    if not os.path.exists(path):
+        return False
+    with _dir_lock(multiproc_dir, exclusive=True):
+        data = _read_json(path)
+        if data is None:
+            return False
+        dead_path = os.path.join(multiproc_dir, DEAD_FILE)
+        dead = _read_json(dead_path) or {}
+        _merge_tables(dead, data)
+        _write_json(dead_path, dead)
+        os.remove(path)
+    return True
+
+
+# 🗄️ Conteggio e tempo degli statement SQL della richiesta corrente
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    outcome = CACHE_OUTCOMES.get(getattr(context, "cache_hit", None))
+    if outcome is not None:
+        registry.observe_sql_cache(outcome)
+    if not has_request_context():
+        return
+    stats = g.get("_metrics_db")
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += perf_counter() - getattr(context, "_metrics_start", perf_counter())
+
+
+def init_metrics(app):
+    """
+    Registra gli hook di strumentazione e l'endpoint /metrics.
+    """
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+
+    registry.multiproc_dir = app.config.get("METRICS_MULTIPROC_DIR") or None
+    registry.flush_interval = app.config.get("METRICS_FLUSH_INTERVAL", 5.0)
+    if registry.multiproc_dir:
+        os.makedirs(registry.multiproc_dir, exist_ok=True)
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = perf_counter()
+        g._metrics_db = [0, 0.0]
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get("_metrics_start")
+        if start is None:
+            return response
+
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        db_stats = g.get("_metrics_db") or [0, 0.0]
+        registry.observe_request(
+            endpoint, request.method, response.status_code,
+            perf_counter() - start, db_stats[0], db_stats[1]
+        )
+        registry.maybe_flush()
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
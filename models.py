@@ -1,17 +1,74 @@
 from flask_sqlalchemy import SQLAlchemy
 from decimal import Decimal
-from sqlalchemy import and_, or_
-from datetime import datetime
+from sqlalchemy import and_, or_, bindparam, select
+from datetime import date, datetime
 from datetime import timedelta
 from sqlalchemy.exc import SQLAlchemyError
 import json, hashlib, re
-from werkzeug.security import generate_password_hash, check_password_hash
+import logging
+from flask import current_app
+from hashing import hasher
+from batch_loader import request_loader
 from flask_mail import Message  # Importa Message per l'email
 from extensions import mail  # Importa mail dall'estensione di Flask-Mail
 
 # Usa l'istanza di db definita in app.py
 db = SQLAlchemy()
 
+logger = logging.getLogger(__name__)
+
+# Nome del vincolo / messaggio dei trigger anti-sovrapposizione (vedi booking_guard.py)
+BOOKING_OVERLAP_MARKER = "bookings_no_overlap"
+
+
+class BookingConflictError(Exception):
+    """
+    La prenotazione si sovrappone a un'altra prenotazione attiva della stessa moto
+    (rilevato dal vincolo del database).
+    """
+
+    def __init__(self, bike_id=None):
+        self.bike_id = bike_id
+        super().__init__(
+            f"La moto {bike_id} non è disponibile per le date selezionate." if bike_id is not None
+            else "La moto non è disponibile per le date selezionate."
+        )
+
+
+def is_booking_overlap(error):
+    """True se l'eccezione del database è una violazione del vincolo anti-sovrapposizione."""
+    return BOOKING_OVERLAP_MARKER in str(getattr(error, "orig", error))
+
+
+def booking_precheck_enabled():
+    """
+    I controlli Python di disponibilità sono solo un fail-fast: con il vincolo
+    del database attivo si possono disattivare (BOOKING_PRECHECK=false).
+    """
+    return current_app.config.get("BOOKING_PRECHECK", True)
+
+
+def quote_cart_items(items):
+    """
+    Prezzi attuali (calendario tariffario incluso) degli item del carrello, in
+    un'unica chiamata vettorizzata al motore di preventivi. Con
+    PRICE_VERIFICATION=off restano i prezzi salvati nel carrello.
+    """
+    from pricing import quote_engine
+    if quote_engine.verification == "off":
+        return [item["price"] for item in items]
+
+    quotes = quote_engine.quote_many([{
+        "vehicle_id": item["moto_id"],
+        "start_date": datetime.strptime(item["start_date"], '%Y-%m-%d %H:%M:%S'),
+        "end_date": datetime.strptime(item["end_date"], '%Y-%m-%d %H:%M:%S'),
+        "accessories": json.loads(item["accessories"]) if item.get("accessories") else []
+    } for item in items])
+    for quote in quotes:
+        if "error" in quote:
+            raise ValueError(f"Moto {quote['vehicle_id']}: {quote['error']}")
+    return [quote["rental_price"] for quote in quotes]
+
 class User(db.Model):
     __tablename__ = 'users'
 
@@ -55,7 +112,7 @@ class User(db.Model):
             raise ValueError("La password deve avere almeno 8 caratteri.")
 
         # 🔒 Hash della nuova password
-        self.password = generate_password_hash(new_password)
+        self.password = hasher.hash(new_password)
 
         # ✅ Salva nel database
         db.session.commit()
@@ -88,8 +145,8 @@ class User(db.Model):
         if role not in ["user", "admin", "moderator"]:
             raise ValueError("Ruolo non valido.")
 
-        # 🔒 Genera l'hash della password
-        hashed_password = generate_password_hash(password)
+        # 🔒 Genera l'hash della password (pool di processi, vedi hashing.py)
+        hashed_password = hasher.hash(password)
 
         # ✅ Crea l'utente
         new_user = User(
@@ -300,7 +357,8 @@ class Vehicle(db.Model):
     # 🔍 Trovare un veicolo tramite ID
     @staticmethod
     def find_by_id(vehicle_id):
-        return Vehicle.query.get(vehicle_id)
+        # Memorizzato per la richiesta: gli id già raccolti con prime() arrivano da un'unica query IN
+        return request_loader().get(Vehicle, vehicle_id)
 
     # 📋 Restituire tutti i veicoli attivi
     @staticmethod
@@ -354,10 +412,13 @@ class Vehicle(db.Model):
     # 💰 Calcolare il costo totale del noleggio
     @staticmethod
     def calculate_rental_cost(vehicle_id, hours):
-        vehicle = Vehicle.query.get(vehicle_id)
-        if vehicle:
-            return round(vehicle.price_per_hour * hours + vehicle.deposit, 2)
-        return None
+        # Tariffe dal listino in memoria del motore di preventivi: nessuna query
+        from pricing import quote_engine
+        fleet = quote_engine.fleet()
+        position = int(fleet.index_of([vehicle_id])[0])
+        if position < 0:
+            return None
+        return round(float(fleet.price_per_hour[position]) * hours + float(fleet.deposit[position]), 2)
 
     # 🔍 Filtrare i veicoli disponibili per tipo
     @staticmethod
@@ -384,20 +445,10 @@ class Vehicle(db.Model):
         """
         Restituisce tutti i veicoli che NON sono prenotati in un determinato intervallo di date.
         """
-        conflicting_vehicles = db.session.query(Booking.bike_id).filter(
-            Booking.status == True,  # Solo prenotazioni attive
-            or_(
-                (Booking.start_date <= start_date) & (Booking.end_date >= start_date),
-                (Booking.start_date <= end_date) & (Booking.end_date >= end_date),
-                (Booking.start_date >= start_date) & (Booking.end_date <= end_date)
-            )
-        ).subquery()  # Subquery per ottenere gli ID delle moto prenotate
-
-        # Recupera i veicoli che NON sono nella lista delle prenotazioni in conflitto
-        available_vehicles = Vehicle.query.filter(
-            Vehicle.id.notin_(conflicting_vehicles),
-            Vehicle.is_active == True
-        ).all()
+        # Veicoli attivi che NON sono nella lista delle prenotazioni in conflitto (statement precompilato)
+        available_vehicles = db.session.execute(
+            AVAILABLE_VEHICLES_STMT, {"start_date": start_date, "end_date": end_date}
+        ).scalars().all()
 
         return [vehicle.to_dict() for vehicle in available_vehicles]
 
@@ -434,19 +485,13 @@ class Cart(db.Model):
 
     # 🔍 Controllo conflitti di date senza restituire il prodotto
     def check_date_conflict(self, start_date, end_date):
-        # Verifica sovrapposizioni di date
-        conflicting_items = CartItem.query.filter(
-            CartItem.cart_id == self.cart_id,
-            or_(
-                # Il nuovo intervallo si sovrappone parzialmente o totalmente
-                (CartItem.start_date <= start_date) & (CartItem.end_date >= start_date),
-                (CartItem.start_date <= end_date) & (CartItem.end_date >= end_date),
-                (CartItem.start_date >= start_date) & (CartItem.end_date <= end_date)
-            )
-        ).all()
+        # Verifica sovrapposizioni di date (il nuovo intervallo si sovrappone parzialmente o totalmente)
+        conflicting_item = db.session.execute(
+            CART_OVERLAP_STMT, {"cart_id": self.cart_id, "start_date": start_date, "end_date": end_date}
+        ).first()
 
         # Restituisci solo un messaggio di errore in caso di conflitto
-        if conflicting_items:
+        if conflicting_item is not None:
             return {
                 "error": "Il prodotto non può essere aggiunto: le date selezionate si sovrappongono a un altro prodotto nel carrello."
             }
@@ -466,18 +511,12 @@ class Cart(db.Model):
         Returns:
             bool: True se la moto è già prenotata, False altrimenti.
         """
-        conflicting_bookings = Booking.query.filter(
-            Booking.bike_id == moto_id,
-            Booking.status == True,  # Solo prenotazioni attive
-            or_(
-                # La nuova prenotazione si sovrappone con una esistente
-                (Booking.start_date <= start_date) & (Booking.end_date >= start_date),
-                (Booking.start_date <= end_date) & (Booking.end_date >= end_date),
-                (Booking.start_date >= start_date) & (Booking.end_date <= end_date)
-            )
-        ).all()
+        # La nuova prenotazione si sovrappone con una esistente attiva
+        conflicting_booking = db.session.execute(
+            BIKE_OVERLAP_STMT, {"bike_id": moto_id, "start_date": start_date, "end_date": end_date}
+        ).first()
 
-        return len(conflicting_bookings) > 0
+        return conflicting_booking is not None
 
     # 🔍 Recupera un carrello tramite ID
     @staticmethod
@@ -495,13 +534,14 @@ class Cart(db.Model):
         if self.status != 'active':
             return {"error": "Non è possibile aggiungere oggetti a un carrello non attivo."}
 
-        # Log di debug
-        print("Aggiunta al carrello: ", {
+        # Log di debug (campionato tramite LOG_SAMPLE_RATES)
+        logger.debug("Aggiunta al carrello", extra={
+            "event": "cart.add_item",
+            "cart_id": self.cart_id,
             "moto_id": moto_id,
             "start_date": start_date,
             "end_date": end_date,
-            "price": price,
-            "accessories": accessories
+            "price": price
         })
 
         # 🔍 Controlla conflitti di date
@@ -535,6 +575,9 @@ class Cart(db.Model):
         return new_item.to_dict()
 
     def get_detailed_user_cart(self):
+        items = CartItem.query.filter_by(cart_id=self.cart_id).all()
+        # 🏍️ Tutte le moto del carrello con una sola query
+        request_loader().prime(Vehicle, [item.moto_id for item in items])
         return {
             "cart_id": self.cart_id,
             "user_id": self.user_id,
@@ -548,7 +591,7 @@ class Cart(db.Model):
                     "accessories": item.accessories,
                     "moto_details": self.get_moto_details(item.moto_id)
                 }
-                for item in CartItem.query.filter_by(cart_id=self.cart_id).all()
+                for item in items
             ],
             "final_price": float(self.final_price),
             "status": self.status,
@@ -665,18 +708,28 @@ class Cart(db.Model):
 
         try:
             booking_codes = []  # Lista per tenere traccia dei codici generati
+            prices = quote_cart_items(cart_items)  # 💶 Prezzi ricalcolati sul listino attuale
+
+            for item_data, price in zip(cart_items, prices):
+                start_date = datetime.strptime(item_data["start_date"], "%Y-%m-%d %H:%M:%S")
+                end_date = datetime.strptime(item_data["end_date"], "%Y-%m-%d %H:%M:%S")
+
+                # 🔍 Fail-fast: la moto può essere stata prenotata dopo l'aggiunta al carrello
+                # (il vincolo del database lo rileverebbe comunque al flush)
+                if booking_precheck_enabled() and not Booking.check_availability(item_data["moto_id"], start_date, end_date):
+                    db.session.rollback()
+                    return {"error": f"La moto {item_data['moto_id']} non è più disponibile per le date selezionate."}
 
-            for item_data in cart_items:
                 # 🛒 Crea una prenotazione
                 new_booking = Booking(
                     bike_id=item_data["moto_id"],
                     customer_id=self.user_id,
-                    start_date=datetime.strptime(item_data["start_date"], "%Y-%m-%d %H:%M:%S"),
-                    end_date=datetime.strptime(item_data["end_date"], "%Y-%m-%d %H:%M:%S"),
-                    total_price=item_data["price"],
+                    start_date=start_date,
+                    end_date=end_date,
+                    total_price=price,
                     accessories=item_data.get("accessories", "[]"),
                     dl_type=extra_data.get("dl_type", "A"),
-                    dl_expiration=datetime.strptime(extra_data.get("dl_expiration", datetime.now().strftime("%Y-%m-%d")), "%Y-%m-%d"),
+                    dl_expiration=extra_data.get("dl_expiration") or date.today(),
                     dl_number=extra_data.get("dl_number", "DL000000"),
                     helmet_size=extra_data.get("helmet_size", "M"),
                     gloves_size=extra_data.get("gloves_size", "M"),
@@ -686,7 +739,13 @@ class Cart(db.Model):
                     payment_status=False
                 )
                 db.session.add(new_booking)
-                db.session.flush()  # 🔍 Ottieni l'ID della prenotazione
+                try:
+                    db.session.flush()  # 🔍 Ottieni l'ID della prenotazione
+                except SQLAlchemyError as e:
+                    if not is_booking_overlap(e):
+                        raise
+                    db.session.rollback()
+                    return {"error": f"La moto {item_data['moto_id']} non è più disponibile per le date selezionate."}
 
             # 🔄 Completa l'ordine
             db.session.commit()
@@ -753,6 +812,16 @@ class CartItem(db.Model):
 
 class Booking(db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        # 🔎 Indici della ricerca admin (booking_search.py): filtro + ordinamento con id come spareggio
+        db.Index("ix_bookings_start_id", "start_date", "id"),
+        db.Index("ix_bookings_created_id", "created_at", "id"),
+        db.Index("ix_bookings_state_start", "status", "payment_status", "start_date"),
+        db.Index("ix_bookings_handover_start", "pickup", "return_", "start_date"),
+        db.Index("ix_bookings_customer_start", "customer_id", "start_date"),
+        # Su SQLite gli id non vengono riusati dopo l'archiviazione delle righe più recenti
+        {"sqlite_autoincrement": True},
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     bike_id = db.Column(db.Integer, nullable=False)
@@ -798,7 +867,13 @@ class Booking(db.Model):
             return_=data.get('return_', False)
         )
         db.session.add(new_booking)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            if is_booking_overlap(e):
+                raise BookingConflictError(data['bike_id']) from e
+            raise
 
         return new_booking.to_dict()
 
@@ -814,9 +889,8 @@ class Booking(db.Model):
         attempts = 0
         while attempts < max_attempts:
             code = ''.join(random.choices('0123456789', k=8))
-            # Verifica se esiste già una prenotazione con questo booking_code
-            existing = Booking.query.filter_by(booking_code=code).first()
-            if not existing:
+            # Verifica nell'indice unico dei codici (prenotazioni anche archiviate e codici generati)
+            if db.session.get(BookingCodeIndex, int(code)) is None:
                 return code
             attempts += 1
         raise Exception("Non è stato possibile generare un booking_code univoco dopo molti tentativi.")
@@ -827,16 +901,20 @@ class Booking(db.Model):
         booking = Booking.query.get(booking_id)
         return booking.to_dict() if booking else None
 
-    # 🔍 Recupera tutte le prenotazioni di un utente
+    # 🔍 Recupera tutte le prenotazioni di un utente (include_archived: anche lo storico)
     @staticmethod
-    def get_bookings_by_customer(customer_id):
+    def get_bookings_by_customer(customer_id, include_archived=False):
         bookings = Booking.query.filter_by(customer_id=customer_id).all()
+        if include_archived:
+            bookings += BookingArchive.query.filter_by(customer_id=customer_id).all()
         return [booking.to_dict() for booking in bookings]
 
     # 🔍 Recupera tutte le prenotazioni (solo per admin)
     @staticmethod
-    def get_all_bookings():
+    def get_all_bookings(include_archived=False):
         bookings = Booking.query.all()
+        if include_archived:
+            bookings += BookingArchive.query.all()
         return [booking.to_dict() for booking in bookings]
 
     # 🔍 Recupera i dettagli di una prenotazione usando il codice generato
@@ -908,16 +986,11 @@ class Booking(db.Model):
     # 🔍 Controlla se le date sono disponibili per una nuova prenotazione
     @staticmethod
     def check_availability(bike_id, start_date, end_date):
-        conflicting_bookings = Booking.query.filter(
-            Booking.bike_id == bike_id,
-            Booking.status == True,
-            or_(
-                (Booking.start_date <= start_date) & (Booking.end_date >= start_date),
-                (Booking.start_date <= end_date) & (Booking.end_date >= end_date),
-                (Booking.start_date >= start_date) & (Booking.end_date <= end_date)
-            )
-        ).all()
-        return len(conflicting_bookings) == 0
+        # Basta sapere se esiste un conflitto: nessun oggetto ORM, LIMIT 1, statement precompilato
+        conflicting_booking = db.session.execute(
+            BIKE_OVERLAP_STMT, {"bike_id": bike_id, "start_date": start_date, "end_date": end_date}
+        ).first()
+        return conflicting_booking is None
 
     # 🔄 Aggiorna una prenotazione
     @staticmethod
@@ -932,13 +1005,21 @@ class Booking(db.Model):
 
         # 🔄 Aggiorna i campi della prenotazione
         for key, value in update_data.items():
+            if key == "accessories" and not isinstance(value, str):
+                value = json.dumps(value)  # Colonna di testo: lista serializzata come in create_booking
             if hasattr(booking, key):
                 setattr(booking, key, value)
 
         # 🔄 Aggiorna la data di modifica
         booking.last_update = datetime.utcnow()
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            if is_booking_overlap(e):
+                return {"error": "Le nuove date si sovrappongono a un'altra prenotazione della moto."}
+            raise
 
         return {
             "message": "Prenotazione aggiornata con successo.",
@@ -958,19 +1039,13 @@ class Booking(db.Model):
     # 🔍 Controllo conflitto di date nelle prenotazioni attive
     @staticmethod
     def check_date_conflict_in_cart(customer_id, start_date, end_date):
-        # 🔍 Recupera tutte le prenotazioni attive per l'utente
-        conflicting_bookings = Booking.query.filter(
-            Booking.customer_id == customer_id,
-            Booking.status == True,  # Solo prenotazioni attive
-            or_(
-                (Booking.start_date <= start_date) & (Booking.end_date >= start_date),
-                (Booking.start_date <= end_date) & (Booking.end_date >= end_date),
-                (Booking.start_date >= start_date) & (Booking.end_date <= end_date)
-            )
-        ).all()
+        # 🔍 Cerca una prenotazione attiva dell'utente con date sovrapposte
+        conflicting_booking = db.session.execute(
+            CUSTOMER_OVERLAP_STMT, {"customer_id": customer_id, "start_date": start_date, "end_date": end_date}
+        ).first()
 
         # 🚫 Se ci sono prenotazioni con date sovrapposte
-        if conflicting_bookings:
+        if conflicting_booking is not None:
             return {
                 "error": "Hai già una prenotazione attiva con date che si sovrappongono a quelle selezionate."
             }
@@ -980,8 +1055,10 @@ class Booking(db.Model):
 
     # 🔍 Recupera tutte le prenotazioni relative a un veicolo specifico
     @staticmethod
-    def get_bookings_by_vehicle(bike_id):
+    def get_bookings_by_vehicle(bike_id, include_archived=False):
         bookings = Booking.query.filter_by(bike_id=bike_id).all()
+        if include_archived:
+            bookings += BookingArchive.query.filter_by(bike_id=bike_id).all()
 
         if not bookings:
             return {"error": "Nessuna prenotazione trovata per questo veicolo."}
@@ -1083,20 +1160,26 @@ class Booking(db.Model):
             User.surname.ilike(f"%{last_name}%")
         ).all()
 
+        # 🔄 Clienti, veicoli e codici con una query per tipo
+        loader = request_loader()
+        loader.prime(User, [booking.customer_id for booking in bookings])
+        loader.prime(Vehicle, [booking.bike_id for booking in bookings])
+        loader.prime(BookingCode, [booking.id for booking in bookings], by="booking_id")
+
         detailed_bookings = []
         for booking in bookings:
             booking_data = booking.to_dict()
 
             # Aggiungi i dettagli dell'utente
-            user = User.query.get(booking.customer_id)
+            user = loader.get(User, booking.customer_id)
             booking_data["user"] = user.to_dict() if user else {}
 
             # Aggiungi i dettagli del veicolo
-            vehicle = Vehicle.query.get(booking.bike_id)
+            vehicle = loader.get(Vehicle, booking.bike_id)
             booking_data["vehicle"] = vehicle.to_dict() if vehicle else {}
 
             # Aggiungi il codice della prenotazione
-            booking_code_entry = BookingCode.query.filter_by(booking_id=booking.id).first()
+            booking_code_entry = loader.get(BookingCode, booking.id, by="booking_id")
             booking_data["booking_code"] = booking_code_entry.generated_code if booking_code_entry else None
 
             detailed_bookings.append(booking_data)
@@ -1117,18 +1200,12 @@ class Booking(db.Model):
         Returns:
             bool: True se c'è una sovrapposizione, False altrimenti.
         """
-        conflicting_bookings = Booking.query.filter(
-            Booking.customer_id == user_id,
-            Booking.status == True,  # Solo prenotazioni attive
-            or_(
-                # L'intervallo fornito si sovrappone a un'altra prenotazione
-                (Booking.start_date <= start_date) & (Booking.end_date >= start_date),
-                (Booking.start_date <= end_date) & (Booking.end_date >= end_date),
-                (Booking.start_date >= start_date) & (Booking.end_date <= end_date)
-            )
-        ).all()
+        # L'intervallo fornito si sovrappone a un'altra prenotazione attiva
+        conflicting_booking = db.session.execute(
+            CUSTOMER_OVERLAP_STMT, {"customer_id": user_id, "start_date": start_date, "end_date": end_date}
+        ).first()
 
-        return len(conflicting_bookings) > 0
+        return conflicting_booking is not None
     
     @staticmethod
     def submit_cart_as_booking(cart):
@@ -1139,15 +1216,23 @@ class Booking(db.Model):
                 return {"error": "Il carrello non è attivo o non esiste."}
 
             booking_codes = []
+            prices = quote_cart_items(cart_details["items"])  # 💶 Prezzi ricalcolati sul listino attuale
+
+            for item, price in zip(cart_details["items"], prices):
+                start_date = datetime.strptime(item["start_date"], '%Y-%m-%d %H:%M:%S')
+                end_date = datetime.strptime(item["end_date"], '%Y-%m-%d %H:%M:%S')
+
+                # 🔍 Fail-fast prima di confermare l'item (il vincolo del database resta la garanzia)
+                if booking_precheck_enabled() and not Booking.check_availability(item["moto_id"], start_date, end_date):
+                    raise BookingConflictError(item["moto_id"])
 
-            for item in cart_details["items"]:
                 # 🛒 Crea una nuova prenotazione
                 new_booking = Booking(
                     customer_id=cart_details["user_id"],
                     bike_id=item["moto_id"],
-                    start_date=datetime.strptime(item["start_date"], '%Y-%m-%d %H:%M:%S'),
-                    end_date=datetime.strptime(item["end_date"], '%Y-%m-%d %H:%M:%S'),
-                    total_price=item["price"],
+                    start_date=start_date,
+                    end_date=end_date,
+                    total_price=price,
                     accessories=item.get("accessories", "[]"),
                     dl_type="A",
                     dl_expiration=datetime.now().date(),
@@ -1161,7 +1246,12 @@ class Booking(db.Model):
                 )
 
                 db.session.add(new_booking)
-                db.session.flush()  # 🔍 Ottieni l'ID della prenotazione
+                try:
+                    db.session.flush()  # 🔍 Ottieni l'ID della prenotazione
+                except SQLAlchemyError as e:
+                    if is_booking_overlap(e):
+                        raise BookingConflictError(item["moto_id"]) from e
+                    raise
 
                 # 🔢 Genera automaticamente il codice di prenotazione
                 generated_code_result = BookingCode.generate_code_only(
@@ -1178,7 +1268,7 @@ class Booking(db.Model):
                 generated_code = generated_code_result["generated_code"]
 
                 # ➕ Aggiungi il codice al database
-                add_code_result = BookingCode.add_booking_code(new_booking.id, generated_code)
+                add_code_result = BookingCode.add_booking_code(new_booking.id, generated_code, commit=False)
 
                 if "error" in add_code_result:
                     raise ValueError(f"Errore durante il salvataggio del codice: {add_code_result['error']}")
@@ -1199,6 +1289,9 @@ class Booking(db.Model):
                 "bookings": booking_codes
             }
 
+        except BookingConflictError as e:
+            db.session.rollback()
+            return {"error": str(e)}
         except (SQLAlchemyError, ValueError) as e:
             db.session.rollback()
             return {"error": f"Errore durante la sottomissione delle prenotazioni: {str(e)}"}
@@ -1224,11 +1317,16 @@ class Booking(db.Model):
             "gloves_size": self.gloves_size,
             "pickup": self.pickup,
             "return_": self.return_,
-            "booking_code": self.booking_code
+            "booking_code": self.booking_code,
+            "archived": False  # BookingArchive.to_dict lo porta a True: stessa forma su tutti gli endpoint
         }
     
 class BookingCode(db.Model):
     __tablename__ = 'booking_codes'
+    __table_args__ = (
+        db.Index("ix_booking_codes_booking_id", "booking_id", "generated_code"),
+        {"sqlite_autoincrement": True},
+    )
 
     key_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     booking_id = db.Column(db.Integer, nullable=False)
@@ -1265,7 +1363,7 @@ class BookingCode(db.Model):
         return None
 
     @staticmethod
-    def add_booking_code(booking_id, generated_code):
+    def add_booking_code(booking_id, generated_code, commit=True):
         # 🔍 Controlla se la prenotazione esiste
         booking = Booking.query.get(booking_id)
         if not booking:
@@ -1276,8 +1374,8 @@ class BookingCode(db.Model):
         if existing_code:
             return {"error": "Codice già esistente per questa prenotazione."}
 
-        # 🔍 Verifica se il codice è già utilizzato in un'altra prenotazione
-        duplicate_code = BookingCode.query.filter_by(generated_code=generated_code).first()
+        # 🔍 Verifica se il codice è già utilizzato in un'altra prenotazione (anche come booking_code)
+        duplicate_code = db.session.get(BookingCodeIndex, int(generated_code))
         if duplicate_code:
             return {"error": "Questo codice è già associato a un'altra prenotazione."}
 
@@ -1288,7 +1386,10 @@ class BookingCode(db.Model):
                 generated_code=generated_code
             )
             db.session.add(new_code)
-            db.session.commit()
+            if commit:
+                db.session.commit()
+            else:
+                db.session.flush()  # Il chiamante committa l'intero checkout in un'unica transazione
 
             return {
                 "message": "Codice di prenotazione aggiunto con successo.",
@@ -1298,6 +1399,149 @@ class BookingCode(db.Model):
             db.session.rollback()
             return {"error": f"Errore durante l'aggiunta del codice: {str(e)}"}
         
+class BookingArchive(db.Model):
+    """
+    Prenotazioni chiuse (restituite o cancellate) spostate da `bookings` da
+    archive.py. Stesse colonne e stesso id della riga originale.
+    """
+    __tablename__ = 'bookings_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bike_id = db.Column(db.Integer, nullable=False, index=True)
+    customer_id = db.Column(db.Integer, nullable=False, index=True)
+    start_date = db.Column(db.DateTime, nullable=False)
+    end_date = db.Column(db.DateTime, nullable=False)
+    total_price = db.Column(db.Numeric(10, 2), nullable=False)
+    status = db.Column(db.Boolean)
+    payment_status = db.Column(db.Boolean)
+    created_at = db.Column(db.DateTime)
+    last_update = db.Column(db.DateTime)
+    accessories = db.Column(db.Text)
+    dl_type = db.Column(db.String(10))
+    dl_expiration = db.Column(db.Date)
+    dl_number = db.Column(db.String(50))
+    helmet_size = db.Column(db.String(10))
+    gloves_size = db.Column(db.String(10))
+    pickup = db.Column(db.Boolean)
+    return_ = db.Column(db.Boolean)
+    booking_code = db.Column(db.String(8), nullable=False, index=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        data = Booking.to_dict(self)
+        data["archived"] = True
+        return data
+
+
+class BookingCodeArchive(db.Model):
+    __tablename__ = 'booking_codes_archive'
+
+    key_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    booking_id = db.Column(db.Integer, nullable=False, index=True)
+    generated_code = db.Column(db.Integer, nullable=False, index=True)
+
+
+class BookingCodeIndex(db.Model):
+    """
+    Indice unico dei codici a 8 cifre letti al banco (vedi booking_lookup.py):
+    booking_code e generated_code condividono lo stesso spazio, quindi un
+    codice identifica al più una prenotazione. Le righe restano dopo
+    l'archiviazione, così un codice non viene mai riassegnato.
+    """
+    __tablename__ = 'booking_code_index'
+
+    code = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    booking_id = db.Column(db.Integer, nullable=False, index=True)
+    source = db.Column(db.String(10), nullable=False)  # booking | generated
+
+
+class RateRule(db.Model):
+    """
+    Moltiplicatore tariffario (weekend, festivi, alta stagione, fascia oraria).
+    Ambito: vehicle_id, altrimenti vehicle_type, altrimenti tutta la flotta.
+    I filtri nulli non limitano; le regole sovrapposte si moltiplicano.
+    Compilate in somme prefisse da rates.py.
+    """
+    __tablename__ = 'rate_rules'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(100), nullable=False)
+    vehicle_id = db.Column(db.Integer, nullable=True, index=True)
+    vehicle_type = db.Column(db.String(50), nullable=True)
+    start_date = db.Column(db.Date, nullable=True)  # Primo giorno incluso
+    end_date = db.Column(db.Date, nullable=True)    # Ultimo giorno incluso
+    weekdays = db.Column(db.String(20), nullable=True)  # Es. "5,6" (lunedì = 0)
+    hour_from = db.Column(db.Integer, nullable=True)    # Fascia oraria [hour_from, hour_to), anche a cavallo della mezzanotte
+    hour_to = db.Column(db.Integer, nullable=True)
+    multiplier = db.Column(db.Numeric(6, 3), nullable=False)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def create_rule(values):
+        """
+        Crea una regola dai valori già validati (schemas.RateRuleCreateBody).
+        """
+        rule = RateRule(**values)
+        db.session.add(rule)
+        db.session.commit()
+        return rule.to_dict()
+
+    @staticmethod
+    def update_rule(rule_id, values):
+        """
+        Aggiorna i soli campi inviati, già validati (schemas.RateRuleBody).
+        """
+        rule = db.session.get(RateRule, rule_id)
+        if not rule:
+            return {"error": "Regola tariffaria non trovata."}
+        for field, value in values.items():
+            setattr(rule, field, value)
+        db.session.commit()
+        return rule.to_dict()
+
+    @staticmethod
+    def delete_rule(rule_id):
+        rule = db.session.get(RateRule, rule_id)
+        if not rule:
+            return {"error": "Regola tariffaria non trovata."}
+        db.session.delete(rule)
+        db.session.commit()
+        return {"message": "Regola tariffaria eliminata con successo."}
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "vehicle_id": self.vehicle_id,
+            "vehicle_type": self.vehicle_type,
+            "start_date": self.start_date.strftime('%Y-%m-%d') if self.start_date else None,
+            "end_date": self.end_date.strftime('%Y-%m-%d') if self.end_date else None,
+            "weekdays": self.weekdays,
+            "hour_from": self.hour_from,
+            "hour_to": self.hour_to,
+            "multiplier": float(self.multiplier),
+            "is_active": self.is_active,
+            "updated_at": self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
+        }
+
+
+class VehicleDailyStats(db.Model):
+    """
+    Aggregato materializzato per veicolo e giorno: ore prenotate e ricavi
+    (ripartiti in proporzione alle ore) delle prenotazioni attive.
+    Mantenuto da analytics.py ad ogni flush delle prenotazioni.
+    """
+    __tablename__ = 'vehicle_daily_stats'
+
+    bike_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    booked_hours = db.Column(db.Float, nullable=False, default=0.0)
+    revenue = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    paid_revenue = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    bookings_started = db.Column(db.Integer, nullable=False, default=0)
+
+
 class TokenBlacklist(db.Model):
     __tablename__ = 'revoked_tokens'  # Tabella aggiornata
 
@@ -1315,7 +1559,7 @@ class TokenBlacklist(db.Model):
     @staticmethod
     def is_token_blacklisted(jti):
         """Controlla se il token è nella blacklist"""
-        return TokenBlacklist.query.filter_by(jti=jti).first() is not None
+        return db.session.execute(TOKEN_REVOKED_STMT, {"jti": jti}).first() is not None
 
     @staticmethod
     def clean_old_tokens():
@@ -1323,3 +1567,83 @@ class TokenBlacklist(db.Model):
         threshold = datetime.utcnow() - timedelta(days=30)
         db.session.query(TokenBlacklist).filter(TokenBlacklist.created_at < threshold).delete()
         db.session.commit()
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(64), primary_key=True)  # sha256 di utente + endpoint + Idempotency-Key
+    user_id = db.Column(db.Integer, nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 del corpo della richiesta originale
+    status = db.Column(db.String(20), nullable=False, default="processing")  # processing | done
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    owner = db.Column(db.String(32), nullable=True)  # uuid4 della richiesta che detiene la chiave
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def clean_expired():
+        """Rimuove le chiavi di idempotenza scadute"""
+        db.session.query(IdempotencyKey).filter(IdempotencyKey.expires_at < datetime.utcnow()).delete()
+        db.session.commit()
+
+
+class MaintenanceLease(db.Model):
+    __tablename__ = 'maintenance_leases'
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)  # host:pid del worker leader
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class CacheInvalidation(db.Model):
+    """
+    Bus di invalidazione delle cache tra worker (vedi cache_bus.py): una riga
+    per entità modificata, l'id crescente fa da versione.
+    """
+    __tablename__ = 'cache_invalidations'
+    __table_args__ = {"sqlite_autoincrement": True}  # Id mai riusati dopo la pulizia
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    topic = db.Column(db.String(30), nullable=False)  # vehicle | rate_rule | user | booking | token
+    key = db.Column(db.String(64), nullable=True)     # Id dell'entità; NULL = tutto il topic
+    origin = db.Column(db.String(64), nullable=False)  # Worker che ha pubblicato (non rilegge i propri eventi)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+# ⚡ Statement delle query più frequenti, costruiti una sola volta con parametri bind.
+# Vengono eseguiti così come sono: niente costruzione di Query a ogni chiamata e
+# compilazione SQL servita dalla cache di SQLAlchemy (vedi metrics.py,
+# vivirent_sql_compile_cache_total).
+def _overlaps(model):
+    """
+    L'intervallo [:start_date, :end_date] si sovrappone (estremi inclusi) a quello della riga.
+    """
+    start_date, end_date = bindparam("start_date"), bindparam("end_date")
+    return or_(
+        (model.start_date <= start_date) & (model.end_date >= start_date),
+        (model.start_date <= end_date) & (model.end_date >= end_date),
+        (model.start_date >= start_date) & (model.end_date <= end_date)
+    )
+
+
+BIKE_OVERLAP_STMT = select(Booking.id).where(
+    Booking.bike_id == bindparam("bike_id"), Booking.status == True, _overlaps(Booking)
+).limit(1)
+
+CUSTOMER_OVERLAP_STMT = select(Booking.id).where(
+    Booking.customer_id == bindparam("customer_id"), Booking.status == True, _overlaps(Booking)
+).limit(1)
+
+CART_OVERLAP_STMT = select(CartItem.item_id).where(
+    CartItem.cart_id == bindparam("cart_id"), _overlaps(CartItem)
+).limit(1)
+
+AVAILABLE_VEHICLES_STMT = select(Vehicle).where(
+    Vehicle.id.notin_(select(Booking.bike_id).where(Booking.status == True, _overlaps(Booking))),
+    Vehicle.is_active == True
+)
+
+TOKEN_REVOKED_STMT = select(TokenBlacklist.id).where(TokenBlacklist.jti == bindparam("jti")).limit(1)
@@ -0,0 +1,252 @@
+"""
+Motore di preventivi vettorizzato.
+
+Le tariffe della flotta (id, prezzo orario, deposito, stato) vengono lette
+dalla tabella `vehicles` con una sola query e tenute in array NumPy ordinati
+per id. Un preventivo per N combinazioni (veicolo, finestra, accessori) è
+quindi una searchsorted più qualche operazione sugli array, senza query.
+
+Il listino in memoria viene invalidato quando un veicolo o una regola
+tariffaria cambiano: subito nel worker che ha scritto, al controllo
+successivo del bus negli altri (cache_bus.py). PRICING_FLEET_TTL resta come
+limite massimo di validità.
+
+Prezzo del noleggio = prezzo orario × ore tariffate + accessori, dove le
+ore tariffate applicano i moltiplicatori del calendario (rates.py). Il
+deposito viene restituito a parte e non fa parte del prezzo verificato.
+Il calendario viene riallineato alle regole insieme al listino.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from flask import jsonify, make_response
+from sqlalchemy import select
+
+from cache_bus import cache_bus
+from models import db, Vehicle
+from rates import RateCalendar, calendar_origin, load_rule_specs
+
+logger = logging.getLogger(__name__)
+
+_HOUR = np.timedelta64(1, "h")
+
+
+def _naive_utc(values):
+    # NumPy non accetta datetime con fuso: si convertono in UTC senza tzinfo
+    if isinstance(values, datetime):
+        return values.astimezone(timezone.utc).replace(tzinfo=None) if values.tzinfo else values
+    if isinstance(values, (list, tuple)):
+        return [_naive_utc(value) for value in values]
+    return values
+
+
+class FleetRates:
+    """
+    Istantanea immutabile del listino: array paralleli ordinati per id.
+    """
+
+    def __init__(self, ids, vehicle_types, price_per_hour, deposit, active):
+        self.ids = ids
+        self.vehicle_types = vehicle_types
+        self.price_per_hour = price_per_hour
+        self.deposit = deposit
+        self.active = active
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        rows = db.session.execute(
+            select(Vehicle.id, Vehicle.vehicle_type, Vehicle.price_per_hour, Vehicle.deposit, Vehicle.is_active)
+            .order_by(Vehicle.id)
+        ).all()
+        return cls(
+            ids=np.array([row[0] for row in rows], dtype=np.int64),
+            vehicle_types=np.array([row[1] for row in rows], dtype=object),
+            price_per_hour=np.array([float(row[2]) for row in rows], dtype=np.float64),
+            deposit=np.array([float(row[3] or 0) for row in rows], dtype=np.float64),
+            active=np.array([bool(row[4]) for row in rows], dtype=bool),
+        )
+
+    def index_of(self, vehicle_ids):
+        """
+        Posizioni dei veicoli negli array; -1 per gli id sconosciuti.
+        """
+        vehicle_ids = np.asarray(vehicle_ids, dtype=np.int64)
+        if not self.ids.size:
+            return np.full(vehicle_ids.shape, -1, dtype=np.int64)
+        positions = np.searchsorted(self.ids, vehicle_ids)
+        positions = np.minimum(positions, self.ids.size - 1)
+        return np.where(self.ids[positions] == vehicle_ids, positions, -1)
+
+
+class QuoteEngine:
+    def __init__(self):
+        self._fleet = None
+        self._lock = threading.Lock()
+        self.calendar = None
+        self.fleet_ttl = 60.0
+        self.accessory_prices = {}
+        self.verification = "log"
+        self.tolerance = 0.01
+
+    def configure(self, app):
+        self.fleet_ttl = app.config.get("PRICING_FLEET_TTL", 60.0)
+        self.accessory_prices = dict(app.config.get("PRICING_ACCESSORY_PRICES", {}))
+        self.verification = app.config.get("PRICE_VERIFICATION", "log")
+        self.tolerance = app.config.get("PRICE_TOLERANCE", 0.01)
+        self.calendar = RateCalendar(calendar_origin(app.config), app.config.get("RATE_CALENDAR_YEARS", 3))
+        self._fleet = None
+
+    def invalidate(self):
+        self._fleet = None
+
+    def fleet(self):
+        fleet = self._fleet
+        if fleet is None or time.monotonic() - fleet.loaded_at > self.fleet_ttl:
+            with self._lock:
+                fleet = self._fleet
+                if fleet is None or time.monotonic() - fleet.loaded_at > self.fleet_ttl:
+                    fleet = FleetRates.load()
+                    if self.calendar is not None:
+                        # Ricalcola solo i profili toccati dalle regole cambiate
+                        self.calendar.set_rules(load_rule_specs())
+                    self._fleet = fleet
+        return fleet
+
+    # 🧰 Accessori: stringhe ("casco") o oggetti ({"name": "casco", ...}); quelli senza prezzo sono gratuiti
+    def accessories_cost(self, accessories):
+        total = 0.0
+        for accessory in accessories or []:
+            name = accessory.get("name", accessory.get("id")) if isinstance(accessory, dict) else accessory
+            total += float(self.accessory_prices.get(str(name), 0))
+        return total
+
+    @staticmethod
+    def hours_between(starts, ends):
+        starts = np.asarray(_naive_utc(starts), dtype="datetime64[s]")
+        ends = np.asarray(_naive_utc(ends), dtype="datetime64[s]")
+        return (ends - starts) / _HOUR
+
+    def rental_costs(self, fleet, positions, starts, ends):
+        """
+        Costo del noleggio (senza accessori) per ogni combinazione.
+        """
+        if self.calendar is None:
+            return fleet.price_per_hour[positions] * self.hours_between(starts, ends)
+        billable = self.calendar.billable_hours(
+            fleet.vehicle_types[positions], fleet.ids[positions], _naive_utc(starts), _naive_utc(ends)
+        )
+        return fleet.price_per_hour[positions] * billable
+
+    def quote_many(self, items):
+        """
+        Preventivo di una lista di dict {vehicle_id, start_date, end_date,
+        accessories}. Restituisce una lista di dict nello stesso ordine; le
+        righe con veicolo inesistente o inattivo o finestra non valida hanno
+        "error".
+        """
+        if not items:
+            return []
+        fleet = self.fleet()
+        vehicle_ids = np.array([int(item["vehicle_id"]) for item in items], dtype=np.int64)
+        # Nessun ricaricamento per gli id sconosciuti (endpoint pubblici): i veicoli
+        # creati da altri worker arrivano con il bus di invalidazione
+        positions = fleet.index_of(vehicle_ids)
+
+        known = positions >= 0
+        if not fleet.ids.size:
+            return [{"vehicle_id": int(vehicle_id), "error": "Veicolo non trovato."} for vehicle_id in vehicle_ids]
+
+        starts = [item["start_date"] for item in items]
+        ends = [item["end_date"] for item in items]
+        safe_positions = np.where(known, positions, 0)
+
+        hours = self.hours_between(starts, ends)
+        extras = np.array([self.accessories_cost(item.get("accessories")) for item in items], dtype=np.float64)
+        totals = np.round(self.rental_costs(fleet, safe_positions, starts, ends) + extras, 2)
+        deposits = fleet.deposit[safe_positions]
+        valid = known & fleet.active[safe_positions] & (hours > 0)
+
+        quotes = []
+        for i, item in enumerate(items):
+            if not known[i]:
+                quotes.append({"vehicle_id": int(vehicle_ids[i]), "error": "Veicolo non trovato."})
+            elif not valid[i]:
+                reason = "Veicolo non attivo." if hours[i] > 0 else "La data di inizio deve essere antecedente alla data di fine."
+                quotes.append({"vehicle_id": int(vehicle_ids[i]), "error": reason})
+            else:
+                quotes.append({
+                    "vehicle_id": int(vehicle_ids[i]),
+                    "hours": round(float(hours[i]), 2),
+                    "rental_price": float(totals[i]),
+                    "deposit": float(deposits[i]),
+                })
+        return quotes
+
+    def quote_fleet(self, start_date, end_date, accessories=None):
+        """
+        Preventivo di tutti i veicoli attivi per una finestra (pagina catalogo).
+        """
+        fleet = self.fleet()
+        positions = np.flatnonzero(fleet.active)
+        count = positions.size
+        starts = np.full(count, np.datetime64(start_date, "s"))
+        ends = np.full(count, np.datetime64(end_date, "s"))
+        hours = float(self.hours_between(start_date, end_date))
+        totals = np.round(self.rental_costs(fleet, positions, starts, ends) + self.accessories_cost(accessories), 2)
+        return [
+            {"vehicle_id": int(vehicle_id), "hours": round(hours, 2), "rental_price": float(total), "deposit": float(deposit)}
+            for vehicle_id, total, deposit in zip(fleet.ids[positions], totals, fleet.deposit[positions])
+        ]
+
+    def quote(self, vehicle_id, start_date, end_date, accessories=None):
+        return self.quote_many([{
+            "vehicle_id": vehicle_id, "start_date": start_date, "end_date": end_date, "accessories": accessories
+        }])[0]
+
+    def verify(self, vehicle_id, start_date, end_date, accessories, client_price):
+        """
+        Confronta il prezzo inviato dal client con il preventivo del server.
+        Restituisce (prezzo da salvare, risposta di errore o None).
+        """
+        if self.verification == "off":
+            return client_price, None
+
+        quote = self.quote(vehicle_id, start_date, end_date, accessories)
+        if "error" in quote:
+            return client_price, make_response(jsonify({"error": quote["error"]}), 400)
+
+        expected = quote["rental_price"]
+        try:
+            matches = abs(float(client_price) - expected) <= self.tolerance
+        except (TypeError, ValueError):
+            matches = False
+        if matches:
+            return expected, None
+
+        logger.warning("Prezzo del client diverso dal preventivo", extra={
+            "event": "pricing.mismatch", "vehicle_id": vehicle_id,
+            "client_price": str(client_price), "expected_price": expected
+        })
+        if self.verification == "log":
+            return expected, None  # Si salva comunque il prezzo del server
+        return client_price, make_response(jsonify({
+            "error": "price_mismatch",
+            "message": "Il prezzo indicato non corrisponde al listino attuale.",
+            "expected_price": expected
+        }), 400)
+
+
+quote_engine = QuoteEngine()
+
+
+# 🔄 Invalidazione del listino quando cambiano veicoli o regole tariffarie (anche da altri worker)
+cache_bus.subscribe("vehicle", lambda keys: quote_engine.invalidate())
+cache_bus.subscribe("rate_rule", lambda keys: quote_engine.invalidate())
+
+
+def init_pricing(app):
+    quote_engine.configure(app)
@@ -0,0 +1,162 @@
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 🔍 Normalizzazione della "forma" di uno statement: liste IN e letterali collassati
+_IN_LIST_RE = re.compile(r"IN \((?:\s*(?:\?|%s|%\(\w+\)s)\s*,?)+\)", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    shape = _STRING_RE.sub("?", statement)
+    shape = _IN_LIST_RE.sub("IN (...)", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    return _SPACES_RE.sub(" ", shape).strip()
+
+
+class SQLProfiler:
+    """
+    Profiler SQL per richiesta, attivabile con SQL_PROFILER_ENABLED.
+    Conta e cronometra gli statement, segnala le forme ripetute (probabili N+1)
+    e cattura l'EXPLAIN degli statement più lenti della soglia.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.n_plus_one_threshold = 5
+        self.slow_threshold = 0.1
+        self.explain_enabled = True
+        self._reports = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def configure(self, app):
+        self.enabled = app.config.get("SQL_PROFILER_ENABLED", False)
+        self.n_plus_one_threshold = app.config.get("SQL_PROFILER_N_PLUS_ONE_THRESHOLD", 5)
+        self.slow_threshold = app.config.get("SQL_PROFILER_SLOW_MS", 100) / 1000.0
+        self.explain_enabled = app.config.get("SQL_PROFILER_EXPLAIN", True)
+        self._reports = deque(maxlen=app.config.get("SQL_PROFILER_BUFFER_SIZE", 200))
+
+    # 🗄️ Hook sugli eventi dell'engine
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._profiler_start = perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        entries = g.get("_sql_profile")
+        if entries is None or g.get("_sql_profile_explaining"):
+            return
+        elapsed = perf_counter() - getattr(context, "_profiler_start", perf_counter())
+        entries.append((statement, parameters, elapsed, conn.engine))
+
+    def _explain(self, engine, statement, parameters):
+        """
+        Esegue l'EXPLAIN su una connessione separata, per non toccare
+        la transazione della richiesta. Solo per le SELECT.
+        """
+        if not statement.lstrip().upper().startswith("SELECT"):
+            return None
+
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        g._sql_profile_explaining = True
+        try:
+            with engine.connect() as conn:
+                rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+            return [" | ".join(str(col) for col in row) for row in rows]
+        except Exception as e:
+            return [f"EXPLAIN non disponibile: {str(e)}"]
+        finally:
+            g._sql_profile_explaining = False
+
+    # 📄 Costruisce il report della richiesta corrente
+    def build_report(self, status_code):
+        entries = g.get("_sql_profile") or []
+        g._sql_profile = None
+
+        shapes = {}
+        total_time = 0.0
+        slow = []
+        for statement, parameters, elapsed, engine in entries:
+            total_time += elapsed
+            shape = statement_shape(statement)
+            stats = shapes.setdefault(shape, {"count": 0, "time": 0.0})
+            stats["count"] += 1
+            stats["time"] += elapsed
+
+            if elapsed >= self.slow_threshold:
+                slow.append({
+                    "statement": statement,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "explain": self._explain(engine, statement, parameters) if self.explain_enabled else None
+                })
+
+        n_plus_one = [
+            {"shape": shape, "count": stats["count"], "time_ms": round(stats["time"] * 1000, 3)}
+            for shape, stats in shapes.items()
+            if stats["count"] >= self.n_plus_one_threshold
+        ]
+
+        report = {
+            "timestamp": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.url_rule.rule if request.url_rule else None,
+            "status": status_code,
+            "statements": len(entries),
+            "db_time_ms": round(total_time * 1000, 3),
+            "n_plus_one": n_plus_one,
+            "slow_queries": slow
+        }
+
+        with self._lock:
+            self._reports.append(report)
+
+        return report
+
+    def recent_reports(self, limit=50):
+        with self._lock:
+            reports = list(self._reports)
+        return reports[-limit:][::-1]
+
+
+profiler = SQLProfiler()
+
+
+def init_profiler(app):
+    """
+    Attiva il profiler SQL se SQL_PROFILER_ENABLED è impostato.
+    Il report è disponibile nell'header X-SQL-Profile e nel ring buffer
+    esposto da /api/admin/sql-profile.
+    """
+    profiler.configure(app)
+    if not profiler.enabled:
+        return
+
+    event.listen(Engine, "before_cursor_execute", profiler.before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", profiler.after_cursor_execute)
+
+    @app.before_request
+    def _start_sql_profile():
+        g._sql_profile = []
+
+    @app.after_request
+    def _attach_sql_profile(response):
+        if g.get("_sql_profile") is None:
+            return response
+
+        report = profiler.build_report(response.status_code)
+        response.headers["X-SQL-Profile"] = (
+            f"statements={report['statements']}; "
+            f"db_time_ms={report['db_time_ms']}; "
+            f"n_plus_one={len(report['n_plus_one'])}; "
+            f"slow={len(report['slow_queries'])}"
+        )
+        return response
@@ -0,0 +1,224 @@
+"""
+Rate limiting per gli endpoint non autenticati (login, registrazione, reset).
+
+Ogni endpoint ha una lista di regole, ciascuna con una chiave (IP del client
+o email del payload) e un algoritmo:
+- bucket: token bucket, `limit` richieste di burst ricaricate in `period` secondi;
+- window: finestra scorrevole (contatore pesato su due finestre fisse),
+          al massimo `limit` richieste negli ultimi `period` secondi.
+
+Il controllo avviene nel decoratore, prima che la view esegua query o KDF.
+Lo stato vive in memoria (per processo) oppure in un file SQLite condiviso
+tra i worker gunicorn (RATELIMIT_STORAGE_URI="sqlite:////tmp/ratelimit.db").
+"""
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, make_response, request
+
+logger = logging.getLogger(__name__)
+
+
+# ⚙️ Algoritmi: funzioni pure (stato, ora) -> (nuovo stato, attesa in secondi o 0)
+def _token_bucket(state, now, limit, period):
+    rate = limit / period
+    tokens, updated = state if state else (limit, now)
+    tokens = min(limit, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+def _sliding_window(state, now, limit, period):
+    current_start = now - (now % period)
+    start, current, previous = state if state else (current_start, 0, 0)
+    if start != current_start:
+        # La finestra precedente è quella appena conclusa solo se contigua
+        previous = current if current_start - start == period else 0
+        current, start = 0, current_start
+
+    weight = 1 - (now - current_start) / period
+    if previous * weight + current + 1 <= limit:
+        return (start, current + 1, previous), 0
+
+    # Attesa fino a quando il peso della finestra precedente lascia spazio a una richiesta
+    if previous and current + 1 <= limit:
+        elapsed_needed = (1 - (limit - current - 1) / previous) * period
+        return (start, current, previous), max(elapsed_needed - (now - current_start), 0.001)
+    return (start, current, previous), current_start + period - now
+
+
+ALGORITHMS = {"bucket": _token_bucket, "window": _sliding_window}
+
+
+class MemoryStore:
+    """
+    Stato in un dizionario del processo: ogni worker ha i propri contatori.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._last_purge = time.time()
+
+    def update(self, key, ttl, fn):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            state = entry[0] if entry and entry[1] > now else None
+            new_state, wait = fn(state, now)
+            self._data[key] = (new_state, now + ttl)
+            if now - self._last_purge > 60:
+                self._purge(now)
+        return wait
+
+    def _purge(self, now):
+        self._data = {key: entry for key, entry in self._data.items() if entry[1] > now}
+        self._last_purge = now
+
+
+class SQLiteStore:
+    """
+    Stato in un file SQLite condiviso da tutti i worker della macchina.
+    Ogni aggiornamento è una transazione BEGIN IMMEDIATE (lettura + scrittura
+    atomiche rispetto agli altri processi).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+        self._connect().executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL);"
+        )
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def update(self, key, ttl, fn):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state, expires_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            state = tuple(json.loads(row[0])) if row and row[1] > now else None
+            new_state, wait = fn(state, now)
+            conn.execute(
+                "INSERT INTO rate_limits (key, state, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at",
+                (key, json.dumps(new_state), now + ttl)
+            )
+            if now - self._last_purge > 60:
+                conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+                self._last_purge = now
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+def create_store(uri):
+    if not uri or uri == "memory://":
+        return MemoryStore()
+    if uri.startswith("sqlite:///"):
+        return SQLiteStore(uri[len("sqlite:///"):])
+    raise ValueError(f"RATELIMIT_STORAGE_URI non supportato: '{uri}'")
+
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = False
+        self.rules = {}
+        self.trusted_proxies = 0
+        self.store = MemoryStore()
+
+    def configure(self, app):
+        self.enabled = app.config.get("RATELIMIT_ENABLED", True)
+        self.rules = app.config.get("RATELIMIT_RULES", {})
+        self.trusted_proxies = app.config.get("RATELIMIT_TRUSTED_PROXIES", 0)
+        self.store = create_store(app.config.get("RATELIMIT_STORAGE_URI"))
+
+    def client_ip(self):
+        # Dietro N proxy fidati l'IP reale è l'N-esimo indirizzo da destra in X-Forwarded-For
+        if self.trusted_proxies:
+            forwarded = [part.strip() for part in request.headers.get("X-Forwarded-For", "").split(",") if part.strip()]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        return request.remote_addr or "unknown"
+
+    def _identity(self, scope):
+        if scope == "ip":
+            return self.client_ip()
+        if scope == "email":
+            data = request.get_json(silent=True)
+            email = data.get("email") if isinstance(data, dict) else None
+            return email.strip().lower() if isinstance(email, str) and email.strip() else None
+        raise ValueError(f"Chiave di rate limit non valida: '{scope}'")
+
+    def check(self, name):
+        """
+        Applica le regole dell'endpoint `name`. Restituisce i secondi da
+        attendere (0 se la richiesta è ammessa).
+        """
+        retry_after = 0
+        for scope, algorithm, limit, period in self.rules.get(name, ()):
+            identity = self._identity(scope)
+            if identity is None:
+                continue
+            fn = ALGORITHMS[algorithm]
+            key = f"{name}:{scope}:{algorithm}:{identity}"
+            # TTL doppio: la finestra scorrevole usa anche il contatore della finestra precedente
+            wait = self.store.update(key, 2 * period, lambda state, now: fn(state, now, limit, period))
+            retry_after = max(retry_after, wait)
+        return retry_after
+
+    def limit(self, name):
+        """
+        Decoratore: risponde 429 con Retry-After se una regola è superata.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if self.enabled:
+                    retry_after = self.check(name)
+                    if retry_after > 0:
+                        logger.warning(
+                            "Richiesta limitata",
+                            extra={"event": "ratelimit.blocked", "endpoint": name, "ip": self.client_ip()}
+                        )
+                        response = make_response(jsonify({
+                            "error": "rate_limited",
+                            "message": "Troppe richieste, riprova più tardi."
+                        }), 429)
+                        response.headers["Retry-After"] = str(math.ceil(retry_after))
+                        return response
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+limiter = RateLimiter()
+
+
+def init_rate_limit(app):
+    """
+    Configura regole e store del rate limiter.
+    """
+    limiter.configure(app)
@@ -0,0 +1,211 @@
+"""
+Calendario tariffario: moltiplicatori stagionali, festivi, weekend e per
+fascia oraria (tabella rate_rules) compilati in somme prefisse per ora.
+
+Ogni profilo (tipo di veicolo, più eventuali regole del singolo veicolo) ha
+un array `prefix` lungo ore_orizzonte + 1 con prefix[k] = somma dei
+moltiplicatori delle prime k ore. Le "ore tariffate" di una finestra
+[start, end) sono F(end) - F(start), dove F interpola linearmente l'ora
+parziale: due lookup, per qualsiasi durata. Il costo è prezzo_orario × ore
+tariffate.
+
+Più regole sulla stessa ora si moltiplicano. Fuori dall'orizzonte
+[RATE_CALENDAR_START, + RATE_CALENDAR_YEARS) il moltiplicatore è 1.
+
+Quando le regole cambiano si ricalcolano solo i profili interessati e, al
+loro interno, solo l'intervallo di ore coperto dalla regola vecchia e nuova;
+il resto della somma prefissa viene traslato.
+"""
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from models import db, RateRule
+
+logger = logging.getLogger(__name__)
+
+_HOUR = np.timedelta64(1, "h")
+
+
+class RuleSpec:
+    """
+    Copia immutabile di una RateRule, usata per il calcolo e per il diff.
+    """
+    __slots__ = ("id", "vehicle_id", "vehicle_type", "start_date", "end_date", "weekdays", "hour_from", "hour_to",
+                 "multiplier")
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.vehicle_id = rule.vehicle_id
+        self.vehicle_type = rule.vehicle_type
+        self.start_date = rule.start_date
+        self.end_date = rule.end_date
+        self.weekdays = frozenset(int(day) for day in rule.weekdays.split(",") if day.strip()) if rule.weekdays else None
+        self.hour_from = rule.hour_from
+        self.hour_to = rule.hour_to
+        self.multiplier = float(rule.multiplier)
+
+    def _key(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, RuleSpec) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def applies_to(self, vehicle_type, vehicle_id):
+        if self.vehicle_id is not None:
+            return self.vehicle_id == vehicle_id
+        return self.vehicle_type is None or self.vehicle_type == vehicle_type
+
+
+class RateCalendar:
+    def __init__(self, origin, years=3):
+        self.origin = np.datetime64(origin, "h")
+        end = datetime(origin.year + years, origin.month, origin.day)
+        self.size = int((np.datetime64(end, "h") - self.origin) / _HOUR)
+
+        # Attributi di ogni ora dell'orizzonte, calcolati una volta sola
+        slots = self.origin + np.arange(self.size)
+        self._days = slots.astype("datetime64[D]")
+        self._weekdays = (self._days.astype(np.int64) + 3) % 7  # 1970-01-01 era giovedì; lunedì = 0
+        self._hours = slots.astype(np.int64) % 24
+
+        self.rules = {}      # id -> RuleSpec
+        self._own_vehicle_ids = set()
+        self._profiles = {}  # (vehicle_type, vehicle_id | None) -> prefix
+
+    # 🔢 Compilazione dei moltiplicatori
+    def _span(self, rule):
+        """
+        Intervallo di ore [a, b) in cui la regola può applicarsi.
+        """
+        a = 0 if rule.start_date is None else self._slot(datetime.combine(rule.start_date, datetime.min.time()))
+        b = self.size if rule.end_date is None else self._slot(datetime.combine(rule.end_date + timedelta(days=1), datetime.min.time()))
+        return max(0, min(a, self.size)), max(0, min(b, self.size))
+
+    def _slot(self, moment):
+        return int((np.datetime64(moment, "h") - self.origin) / _HOUR)
+
+    def _mask(self, rule, a, b):
+        mask = np.ones(b - a, dtype=bool)
+        days = self._days[a:b]
+        if rule.start_date is not None:
+            mask &= days >= np.datetime64(rule.start_date, "D")
+        if rule.end_date is not None:
+            mask &= days <= np.datetime64(rule.end_date, "D")
+        if rule.weekdays is not None:
+            mask &= np.isin(self._weekdays[a:b], list(rule.weekdays))
+        if rule.hour_from is not None and rule.hour_to is not None:
+            hours = self._hours[a:b]
+            if rule.hour_from <= rule.hour_to:
+                mask &= (hours >= rule.hour_from) & (hours < rule.hour_to)
+            else:  # Fascia a cavallo della mezzanotte (es. 22-6)
+                mask &= (hours >= rule.hour_from) | (hours < rule.hour_to)
+        return mask
+
+    def _multipliers(self, key, a, b):
+        vehicle_type, vehicle_id = key
+        multipliers = np.ones(b - a, dtype=np.float64)
+        for rule in self.rules.values():
+            if rule.applies_to(vehicle_type, vehicle_id):
+                multipliers[self._mask(rule, a, b)] *= rule.multiplier
+        return multipliers
+
+    def _build_profile(self, key):
+        prefix = np.zeros(self.size + 1, dtype=np.float64)
+        np.cumsum(self._multipliers(key, 0, self.size), out=prefix[1:])
+        return prefix
+
+    def _profile_key(self, vehicle_type, vehicle_id):
+        # Il profilo del singolo veicolo esiste solo se ha regole proprie
+        return (vehicle_type, vehicle_id if vehicle_id in self._own_vehicle_ids else None)
+
+    def _prefix(self, key):
+        prefix = self._profiles.get(key)
+        if prefix is None:
+            prefix = self._build_profile(key)  # Profilo compilato al primo utilizzo
+            self._profiles[key] = prefix
+        return prefix
+
+    # 🔄 Aggiornamento incrementale
+    def set_rules(self, specs):
+        """
+        Applica il nuovo insieme di regole ricalcolando solo ciò che cambia.
+        Restituisce il numero di regole aggiunte, modificate o rimosse.
+        """
+        new_rules = {spec.id: spec for spec in specs}
+        changed = [
+            (self.rules.get(rule_id), new_rules.get(rule_id))
+            for rule_id in set(self.rules) | set(new_rules)
+            if self.rules.get(rule_id) != new_rules.get(rule_id)
+        ]
+        if not changed:
+            return 0
+
+        self.rules = new_rules
+        self._own_vehicle_ids = {rule.vehicle_id for rule in new_rules.values() if rule.vehicle_id is not None}
+
+        # Copy-on-write: le richieste in corso continuano a leggere gli array precedenti
+        profiles = {}
+        for key, prefix in self._profiles.items():
+            if key[1] is not None and key[1] not in self._own_vehicle_ids:
+                continue  # Veicolo rimasto senza regole proprie: torna al profilo del tipo
+            spans = [
+                self._span(spec)
+                for old, new in changed
+                for spec in (old, new)
+                if spec is not None and spec.applies_to(*key)
+            ]
+            a = min((span[0] for span in spans), default=0)
+            b = max((span[1] for span in spans), default=0)
+            if a < b:
+                prefix = prefix.copy()
+                old_total = prefix[b]
+                prefix[a + 1:b + 1] = prefix[a] + np.cumsum(self._multipliers(key, a, b))
+                prefix[b + 1:] += prefix[b] - old_total
+            profiles[key] = prefix
+        self._profiles = profiles
+        return len(changed)
+
+    # 💶 Ore tariffate
+    def _integral(self, prefix, t):
+        k = np.clip(np.floor(t), 0, self.size - 1).astype(np.int64)
+        inside = prefix[k] + (t - k) * (prefix[k + 1] - prefix[k])
+        return np.where(t < 0, t, np.where(t > self.size, prefix[self.size] + (t - self.size), inside))
+
+    def billable_hours(self, vehicle_types, vehicle_ids, starts, ends):
+        """
+        Ore tariffate (somma dei moltiplicatori) per ogni finestra [start, end),
+        vettorizzato. vehicle_types e vehicle_ids sono paralleli alle finestre.
+        """
+        t_start = (np.asarray(starts, dtype="datetime64[s]") - self.origin) / _HOUR
+        t_end = (np.asarray(ends, dtype="datetime64[s]") - self.origin) / _HOUR
+        if not self.rules:
+            return t_end - t_start  # Nessuna regola: tariffa piatta
+        result = np.empty(t_start.shape, dtype=np.float64)
+
+        keys = [self._profile_key(vehicle_type, int(vehicle_id)) for vehicle_type, vehicle_id in zip(vehicle_types, vehicle_ids)]
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+        for key, indexes in groups.items():
+            prefix = self._prefix(key)
+            indexes = np.asarray(indexes)
+            result[indexes] = self._integral(prefix, t_end[indexes]) - self._integral(prefix, t_start[indexes])
+        return result
+
+
+def load_rule_specs():
+    rules = db.session.execute(select(RateRule).where(RateRule.is_active == True)).scalars().all()
+    return [RuleSpec(rule) for rule in rules]
+
+
+def calendar_origin(config):
+    start = config.get("RATE_CALENDAR_START")
+    if start:
+        return datetime.combine(date.fromisoformat(start), datetime.min.time())
+    return datetime(datetime.utcnow().year - 1, 1, 1)
@@ -1,13 +1,25 @@
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, jsonify, make_response
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity, create_refresh_token
-from werkzeug.security import check_password_hash, generate_password_hash
-from models import db, User, Vehicle, Cart, Booking, BookingCode, TokenBlacklist
+from models import db, User, Vehicle, Cart, CartItem, Booking, BookingArchive, BookingCode, TokenBlacklist, RateRule
+from models import BookingConflictError, booking_precheck_enabled
 import datetime as dt  # Rinominato per evitare conflitti
 from datetime import datetime  # Classe datetime senza conflitti
 from datetime import timedelta  # ✅ Import corretto
 from config import Config  # ✅ Importa Config per accedere alle variabili di configurazione
-from dateutil import parser  # Aggiungi questa importazione in cima al file
 from functools import wraps
+from profiler import profiler
+from hashing import hasher, HashingBusyError
+from ratelimit import limiter
+from idempotency import idempotent
+from admission import admission
+from pricing import quote_engine
+from batch_loader import request_loader
+from availability_cache import available_vehicles_in_range
+from schemas import validate
+import schemas
+import analytics
+import booking_search
+import booking_lookup
 
 # Define the jwt_blacklist set to store blacklisted JWTs
 jwt_blacklist = set()
@@ -16,6 +28,13 @@ jwt_blacklist = set()
 api = Blueprint('api', __name__)
 
 
+# ⏳ Pool di hashing saturo: il client può riprovare dopo Retry-After
+def hashing_busy_response(error):
+    response = make_response(jsonify({"error": "auth_busy", "message": str(error)}), 503)
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
 # 🔒 Controllo ruolo admin
 def admin_required(fn):
 
@@ -34,52 +53,29 @@ def admin_required(fn):
 
 # Endpoint per la registrazione di un nuovo utente
 @api.route('/register', methods=['POST'])
-def register_user():
+@limiter.limit("register")
+@validate(body=schemas.RegisterBody)
+def register_user(body):
     """
     Registra un nuovo utente e imposta JWT nei cookie httpOnly
     """
-    data = request.get_json()
-
-    if not data:
-        return jsonify({"error": "Richiesta non valida. Il payload JSON è richiesto."}), 400
-
-    required_fields = ['name', 'surname', 'password', 'email', 'bday', 'place']
-    for field in required_fields:
-        if field not in data or not data[field].strip():
-            return jsonify({"error": f"Il campo '{field}' è obbligatorio."}), 400
-
-    # ✅ Pulizia e validazione
-
-    name = data['name'].strip()
-    surname = data['surname'].strip()
-    password = data['password'].strip()
-    email = data['email'].strip()
-    bday_str = data['bday'].strip()
-    place = data['place'].strip()
-
     # 🔍 Controllo email già registrata
-    if User.is_email_registered(email):
+    if User.is_email_registered(body.email):
         return jsonify({"error": "Questa email è già registrata."}), 400
 
-    # ✅ Validazione della data di nascita
-    try:
-        bday = datetime.strptime(bday_str, "%Y-%m-%d")
-    except ValueError:
-        return jsonify({"error": "La data di nascita deve essere nel formato YYYY-MM-DD."}), 400
-
     # ➕ Creazione dell'utente
     try:
         new_user = User.add_user(
-            name=name,
-            surname=surname,
-            password=password,
-            email=email,
-            bday=bday,
-            place=place
+            name=body.name,
+            surname=body.surname,
+            password=body.password,
+            email=body.email,
+            bday=body.bday,
+            place=body.place
         )
 
         # 🔍 Recupera l'ID dal database dopo il commit
-        user_instance = User.find_by_email(email)
+        user_instance = User.find_by_email(body.email)
         if not user_instance:
             return jsonify({"error": "Errore durante la registrazione: Utente non trovato dopo il commit."}), 500
 
@@ -120,25 +116,33 @@ def register_user():
 
         return response, 200
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la registrazione: {str(e)}"}), 500
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
 
 
 # 🔥 Login user restituendo un cookie contenente l'accessToken JWT
 @api.route('/login', methods=['POST'])
-def login():
-    data = request.json
-    email = data.get('email')
-    password = data.get('password')
-    
+@limiter.limit("login")
+@validate(body=schemas.LoginBody)
+def login(body):
+    password = body.password
+
     # 🔍 Recupera l'utente dal DB tramite email
-    user = User.query.filter_by(email=email).first()
+    user = User.query.filter_by(email=body.email).first()
     if not user:
         return jsonify({'message': 'Invalid credentials'}), 401
     
     # 👀 Verifica la password
-    if not check_password_hash(user.password, password):
-        return jsonify({'message': 'Invalid credentials'}), 401
+    try:
+        if not hasher.verify(user.password, password):
+            return jsonify({'message': 'Invalid credentials'}), 401
+
+        # 🔁 Hash generato con parametri di costo superati: lo aggiorniamo ora che abbiamo la password in chiaro
+        if hasher.needs_rehash(user.password):
+            user.password = hasher.hash(password)
+            db.session.commit()
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
 
     # ✅ Usa le variabili di configurazione per la durata dei token
     access_token = create_access_token(
@@ -173,82 +177,54 @@ def login():
 # Endpoint per l'update del profilo utente
 @api.route('/update-profile', methods=['PUT'])
 @jwt_required()
-def update_user():
+@validate(body=schemas.ProfileUpdateBody)
+def update_user(body):
     # #print(✅ La richiesta è stata ricevuta.")
     
-    try:
-        data = request.get_json()
-        # #print(📥 Dati ricevuti:", data)
-
-        if not data:
-            return jsonify({"error": "Nessun dato ricevuto per l'aggiornamento."}), 400
+    # 🔐 Ottieni l'ID dell'utente dal token JWT
+    user_id = get_jwt_identity()
+    # #print(🔑 ID Utente dal JWT:", user_id)
 
-        # 🔐 Ottieni l'ID dell'utente dal token JWT
-        user_id = get_jwt_identity()
-        # #print(🔑 ID Utente dal JWT:", user_id)
-
-        updated_user = User.update_user(
-            user_id=user_id,
-            name=data.get('name'),
-            surname=data.get('surname'),
-            email=data.get('email'),
-            bday=data.get('bday'),
-            place=data.get('place')
-        )
+    updated_user = User.update_user(user_id=user_id, **body.as_dict())
 
-        if updated_user:
-            return jsonify({
-                "message": "Dati aggiornati con successo!",
-                "user": updated_user
-            }), 200
-        else:
-            return jsonify({"error": "Utente non trovato."}), 404
-    except Exception as e:
-        # #print(Errore:", str(e))
-        return jsonify({"error": "Errore imprevisto."}), 500
+    if updated_user:
+        return jsonify({
+            "message": "Dati aggiornati con successo!",
+            "user": updated_user
+        }), 200
+    else:
+        return jsonify({"error": "Utente non trovato."}), 404
 
 
 @api.route('/update-user/<int:user_id>', methods=['PUT'])
 @jwt_required()
 @admin_required
-def update_any_user(user_id):
+@validate(body=schemas.AdminUserUpdateBody)
+def update_any_user(user_id, body):
     """
     Permette agli amministratori di aggiornare un qualsiasi utente specificato nell'URL, incluso il ruolo.
     """
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "Nessun dato ricevuto per l'aggiornamento."}), 400
-
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "Utente non trovato."}), 404
-
-        # ✅ Aggiorna i dati dell'utente
-        user.name = data.get("name", user.name)
-        user.surname = data.get("surname", user.surname)
-        user.bday = data.get("bday", user.bday)
-        user.place = data.get("place", user.place)
-
-        # ✅ Se è stato fornito un nuovo ruolo, verifica e aggiorna
-        new_role = data.get("role")
-        if new_role:
-            if new_role not in ["admin", "user"]:
-                return jsonify({"error": "Ruolo non valido. Usa 'admin' o 'user'."}), 400
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "Utente non trovato."}), 404
 
-            # 🔒 Impedisci di modificare il proprio ruolo (per sicurezza)
-            current_user_id = get_jwt_identity()
-            if user_id == current_user_id:
-                return jsonify({"error": "Non puoi modificare il tuo stesso ruolo."}), 403
+    # ✅ Aggiorna i dati dell'utente (solo i campi inviati)
+    for field in ("name", "surname", "bday", "place"):
+        if body.is_set(field):
+            setattr(user, field, getattr(body, field))
 
-            user.role = new_role
+    # ✅ Se è stato fornito un nuovo ruolo (già validato dallo schema), aggiorna
+    if body.role:
+        # 🔒 Impedisci di modificare il proprio ruolo (per sicurezza); l'identità del JWT è una stringa
+        current_user_id = get_jwt_identity()
+        if str(user_id) == str(current_user_id):
+            return jsonify({"error": "Non puoi modificare il tuo stesso ruolo."}), 403
 
-        db.session.commit()
+        user.role = body.role
 
-        return jsonify({"message": "Utente aggiornato con successo!"}), 200
+    db.session.commit()
 
-    except Exception as e:
-        return jsonify({"error": f"Errore: {str(e)}"}), 500
+    return jsonify({"message": "Utente aggiornato con successo!"}), 200
 
 
 @api.route('/admin/delete-user/<int:user_id>', methods=['DELETE'])
@@ -258,19 +234,15 @@ def delete_any_user(user_id):
     """
     🗑️ Permette agli amministratori di eliminare qualsiasi utente
     """
-    try:
-        user_to_delete = User.query.get(user_id)
+    user_to_delete = User.query.get(user_id)
 
-        if not user_to_delete:
-            return jsonify({"error": "Utente non trovato."}), 404
+    if not user_to_delete:
+        return jsonify({"error": "Utente non trovato."}), 404
 
-        db.session.delete(user_to_delete)
-        db.session.commit()
+    db.session.delete(user_to_delete)
+    db.session.commit()
 
-        return jsonify({"message": f"Utente {user_id} eliminato con successo."}), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'eliminazione dell'utente: {str(e)}"}), 500
+    return jsonify({"message": f"Utente {user_id} eliminato con successo."}), 200
 
 
 @api.route('/delete-profile', methods=['DELETE'])
@@ -289,27 +261,23 @@ def delete_account():
       404:
         description: Utente non trovato
     """
-    try:
-        # 🔐 Ottieni l'ID utente dal token JWT
-        user_id = get_jwt_identity()
-        # print(user_id)
-
-        # 🔄 Elimina l'utente
-        result = User.delete_user(user_id)
+    # 🔐 Ottieni l'ID utente dal token JWT
+    user_id = get_jwt_identity()
+    # print(user_id)
 
-        if result:
-            # 🔒 Revoca il token attuale (aggiungendolo alla blacklist)
-            jti = get_jwt()["jti"]  # 🔍 Ottieni il JWT Token ID
-            jwt_blacklist.add(jti)
+    # 🔄 Elimina l'utente
+    result = User.delete_user(user_id)
 
-            return jsonify({
-                "message": "Account eliminato con successo. Il token è stato revocato."
-            }), 200
-        else:
-            return jsonify({"error": "Utente non trovato."}), 404
+    if result:
+        # 🔒 Revoca il token attuale (aggiungendolo alla blacklist)
+        jti = get_jwt()["jti"]  # 🔍 Ottieni il JWT Token ID
+        jwt_blacklist.add(jti)
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'eliminazione dell'account: {str(e)}"}), 500
+        return jsonify({
+            "message": "Account eliminato con successo. Il token è stato revocato."
+        }), 200
+    else:
+        return jsonify({"error": "Utente non trovato."}), 404
 
 
 @api.route('/logout', methods=['POST'])
@@ -358,7 +326,11 @@ def refresh_access_token():
     user_id = get_jwt_identity()
 
     # ✅ Usa la scadenza definita in `Config`
-    new_access_token = create_access_token(identity=user_id, expires_delta=Config.JWT_ACCESS_TOKEN_EXPIRES)
+    new_access_token = create_access_token(
+        identity=user_id,
+        additional_claims={"role": get_jwt().get("role")},
+        expires_delta=Config.JWT_ACCESS_TOKEN_EXPIRES
+    )
     response = jsonify({"message": "Token refreshed", "access_token": new_access_token})
 
     # ✅ Imposta il nuovo access_token nel cookie
@@ -377,19 +349,15 @@ def refresh_access_token():
 @api.route('/get-role', methods=['GET'])
 @jwt_required()  # ✅ Verifica il token JWT nel cookie httpOnly
 def get_role():
-    try:
-        claims = get_jwt()  # 🔥 Ottiene i dati dal JWT
-        user_role = claims.get("role", None)  # Recupera il ruolo aggiunto nel token
+    claims = get_jwt()  # 🔥 Ottiene i dati dal JWT
+    user_role = claims.get("role", None)  # Recupera il ruolo aggiunto nel token
 
-        if not user_role:
-            return jsonify({"error": "Ruolo non trovato nel token"}), 400
+    if not user_role:
+        return jsonify({"error": "Ruolo non trovato nel token"}), 400
 
-        return jsonify({"role": user_role}), 200
+    return jsonify({"role": user_role}), 200
 
-    except Exception as e:
-        return jsonify({"error": f"Errore nel recupero del ruolo: {str(e)}"}), 500
 
-    
 @api.route('/users', methods=['GET'])
 @jwt_required()
 @admin_required
@@ -407,44 +375,38 @@ def get_all_users():
       403:
         description: Accesso negato, permessi insufficienti
     """
-    try:
 
-        # ✅ Recupera tutti gli utenti dal database
-        all_users = User.get_all_users()
+    # ✅ Recupera tutti gli utenti dal database
+    all_users = User.get_all_users()
 
-        return jsonify({
-            "message": "Utenti recuperati con successo.",
-            "users": all_users
-        }), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero degli utenti: {str(e)}"}), 500
+    return jsonify({
+        "message": "Utenti recuperati con successo.",
+        "users": all_users
+    }), 200
 
 
 @api.route('/profile', methods=['GET'])
 @jwt_required()
 def get_user_profile():
-    try:
-        # 🔐 user_id ora è un intero (es: 1)
-        user_id = get_jwt_identity()
-        # #print(user_id)
+    # 🔐 user_id ora è un intero (es: 1)
+    user_id = get_jwt_identity()
+    # #print(user_id)
         
-        # 🔍 Recupera l'utente dal DB usando la PK
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "Utente non trovato."}), 404
+    # 🔍 Recupera l'utente dal DB usando la PK
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "Utente non trovato."}), 404
 
-        return jsonify({
-            "message": "Profilo utente recuperato con successo.",
-            "user": user.to_dict()  # E.g. { "id": 1, "email": "a@gmail" }
-        }), 200
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero del profilo: {str(e)}"}), 500
+    return jsonify({
+        "message": "Profilo utente recuperato con successo.",
+        "user": user.to_dict()  # E.g. { "id": 1, "email": "a@gmail" }
+    }), 200
 
 
 @api.route('/change-password', methods=['POST'])
 @jwt_required()  # 🔒 Richiede autenticazione tramite JWT
-def change_password():
+@validate(body=schemas.ChangePasswordBody)
+def change_password(body):
     """
     Permette a un utente autenticato di cambiare la password
     """
@@ -456,32 +418,26 @@ def change_password():
         if not user:
             return jsonify({"error": "Utente non trovato"}), 404
 
-        # ✅ Riceve i dati JSON
-        data = request.get_json()
-
-        if not data or "current_password" not in data or "new_password" not in data:
-            return jsonify({"error": "Dati mancanti"}), 400
+        # 👀 Verifica la password attuale
+        if not hasher.verify(user.password, body.current_password):
+            return jsonify({"error": "La password attuale non è corretta."}), 400
 
         # ✅ Aggiorna la password usando il metodo `update_password`
-        user.update_password(data["current_password"].strip(), data["new_password"].strip())
+        user.update_password(body.new_password)
 
         return jsonify({"message": "Password aggiornata con successo!"}), 200
 
     except ValueError as e:  # 🔍 Cattura errori specifici di validazione
         return jsonify({"error": str(e)}), 400
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la modifica della password: {str(e)}"}), 500
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
 
 
 @api.route('/password-reset/request', methods=['POST'])
-def request_password_reset():
-    data = request.get_json()
-    email = data.get("email")
-
-    if not email:
-        return jsonify({"error": "Email richiesta"}), 400
-
-    user = User.find_by_email(email=email)
+@limiter.limit("password_reset")
+@validate(body=schemas.PasswordResetRequestBody)
+def request_password_reset(body):
+    user = User.find_by_email(email=body.email)
 
     if not user:
         return jsonify({"error": "Nessun utente trovato con questa email"}), 400
@@ -494,7 +450,8 @@ def request_password_reset():
 
 @api.route('/password-reset/<string:token>', methods=['POST'])
 @jwt_required()
-def reset_password(token):
+@validate(body=schemas.PasswordResetBody)
+def reset_password(token, body):
     """
     ✅ Endpoint per aggiornare la password dopo il reset
     """
@@ -506,22 +463,15 @@ def reset_password(token):
         if not user:
             return jsonify({"error": "Utente non trovato"}), 404
 
-        # ✅ Riceve la nuova password dal payload JSON
-        data = request.get_json()
-        new_password = data.get("new_password")
-
-        if not new_password:
-            return jsonify({"error": "La nuova password è obbligatoria."}), 400
-
         # ✅ Aggiorna la password tramite il metodo della classe `User`
-        user.update_password(new_password)
+        user.update_password(body.new_password)
 
         return jsonify({"message": "Password aggiornata con successo!"}), 200
 
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il reset della password: {str(e)}"}), 500
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
 
 ######################### VEHICLES #########################
 
@@ -541,17 +491,13 @@ def get_all_vehicles():
       500:
         description: Errore durante il recupero dei veicoli
     """
-    try:
-        # ✅ Recupera tutti i veicoli attivi
-        all_vehicles = Vehicle.get_all_active_vehicles()
-
-        return jsonify({
-            "message": "Veicoli recuperati con successo.",
-            "vehicles": all_vehicles
-        }), 200
+    # ✅ Recupera tutti i veicoli attivi
+    all_vehicles = Vehicle.get_all_active_vehicles()
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero dei veicoli: {str(e)}"}), 500
+    return jsonify({
+        "message": "Veicoli recuperati con successo.",
+        "vehicles": all_vehicles
+    }), 200
 
 
 @api.route('/vehicles/<int:vehicle_id>', methods=['GET'])
@@ -575,20 +521,16 @@ def get_vehicle_by_id(vehicle_id):
       404:
         description: Veicolo non trovato
     """
-    try:
-        # 🔍 Cerca il veicolo tramite ID
-        vehicle = Vehicle.find_by_id(vehicle_id)
+    # 🔍 Cerca il veicolo tramite ID
+    vehicle = Vehicle.find_by_id(vehicle_id)
 
-        if vehicle:
-            return jsonify({
-                "message": "Veicolo trovato con successo.",
-                "vehicle": vehicle.to_dict()
-            }), 200
-        else:
-            return jsonify({"error": "Veicolo non trovato."}), 404
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero del veicolo: {str(e)}"}), 500
+    if vehicle:
+        return jsonify({
+            "message": "Veicolo trovato con successo.",
+            "vehicle": vehicle.to_dict()
+        }), 200
+    else:
+        return jsonify({"error": "Veicolo non trovato."}), 404
 
 
 @api.route('/vehicles/license/<string:license_type>', methods=['GET'])
@@ -612,20 +554,16 @@ def get_vehicles_by_license(license_type):
       404:
         description: Nessun veicolo trovato per il tipo di patente
     """
-    try:
-        # 🔍 Recupera i veicoli che richiedono la patente specificata
-        vehicles = Vehicle.filter_by_driving_license(license_type)
-
-        if vehicles:
-            return jsonify({
-                "message": f"✅ Veicoli trovati per la patente {license_type}.",
-                "vehicles": vehicles  # Rimuovi il ciclo con to_dict()
-            }), 200
-        else:
-            return jsonify({"error": f"Nessun veicolo trovato per la patente {license_type}."}), 404
+    # 🔍 Recupera i veicoli che richiedono la patente specificata
+    vehicles = Vehicle.filter_by_driving_license(license_type)
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero dei veicoli: {str(e)}"}), 500
+    if vehicles:
+        return jsonify({
+            "message": f"✅ Veicoli trovati per la patente {license_type}.",
+            "vehicles": vehicles  # Rimuovi il ciclo con to_dict()
+        }), 200
+    else:
+        return jsonify({"error": f"Nessun veicolo trovato per la patente {license_type}."}), 404
 
 
 @api.route('/vehicles/available', methods=['GET'])
@@ -643,76 +581,42 @@ def get_available_vehicles():
       404:
         description: Nessun veicolo disponibile trovato
     """
-    try:
-        # 🔍 Recupera solo i veicoli attivi
-        available_vehicles = Vehicle.get_all_active_vehicles()
+    # 🔍 Recupera solo i veicoli attivi
+    available_vehicles = Vehicle.get_all_active_vehicles()
 
-        if available_vehicles:
-            return jsonify({
-                "message": "Veicoli disponibili recuperati con successo.",
-                "vehicles": available_vehicles
-            }), 200
-        else:
-            return jsonify({"error": "Nessun veicolo disponibile trovato."}), 404
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero dei veicoli disponibili: {str(e)}"}), 500
+    if available_vehicles:
+        return jsonify({
+            "message": "Veicoli disponibili recuperati con successo.",
+            "vehicles": available_vehicles
+        }), 200
+    else:
+        return jsonify({"error": "Nessun veicolo disponibile trovato."}), 404
 
 
 @api.route('/vehicles', methods=['POST'])
 @jwt_required()  # 🔐 Richiede autenticazione JWT
 @admin_required
-def add_vehicle():
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "Dati mancanti o non validi."}), 400
-
-        # ✅ Imposta "motorbike" come tipo veicolo automaticamente
-        vehicle_type = "motorbike"
-
-        required_fields = [
-            'brand', 'model', 'year', 'price_per_hour',
-            'license_plate', 'driving_license', 'power', 'engine_size',
-            'fuel_type', 'description', 'image_url', 'deposit'
-        ]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Il campo '{field}' è obbligatorio."}), 400
-
-        new_vehicle = Vehicle(
-            vehicle_type=vehicle_type,  # 🔥 Impostato automaticamente su "motorbike"
-            brand=data['brand'],
-            model=data['model'],
-            year=data['year'],
-            price_per_hour=data['price_per_hour'],
-            license_plate=data['license_plate'],
-            driving_license=data['driving_license'],
-            power=data['power'],
-            engine_size=data['engine_size'],
-            fuel_type=data['fuel_type'],
-            is_active=data.get('is_active', True),  # Usa il default True se non viene inviato
-            description=data['description'],
-            image_url=data['image_url'],
-            deposit=data['deposit']
-        )
-
-        db.session.add(new_vehicle)
-        db.session.commit()
+@validate(body=schemas.VehicleBody)
+def add_vehicle(body):
+    new_vehicle = Vehicle(
+        vehicle_type="motorbike",  # 🔥 Impostato automaticamente su "motorbike"
+        **body.as_dict()
+    )
 
-        return jsonify({
-            "message": "Veicolo aggiunto con successo.",
-            "vehicle": new_vehicle.to_dict()
-        }), 200
+    db.session.add(new_vehicle)
+    db.session.commit()
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'aggiunta del veicolo: {str(e)}"}), 500
+    return jsonify({
+        "message": "Veicolo aggiunto con successo.",
+        "vehicle": new_vehicle.to_dict()
+    }), 200
 
 
 @api.route('/vehicles/update/<int:vehicle_id>', methods=['PUT'])
 @jwt_required()  # 🔐 Richiede autenticazione JWT
 @admin_required
-def update_vehicle(vehicle_id):
+@validate(body=schemas.VehicleUpdateBody)
+def update_vehicle(vehicle_id, body):
     """
     🔄 Modifica i dettagli di un veicolo specifico (solo per amministratori)
     ---
@@ -734,29 +638,21 @@ def update_vehicle(vehicle_id):
       403:
         description: Accesso negato, permessi insufficienti
     """
-    try:
-        data = request.get_json()
+    # 🔄 Usa il metodo della classe per aggiornare il veicolo (solo i campi inviati)
+    updated_vehicle = Vehicle.update_vehicle(vehicle_id, **body.as_dict(exclude_unset=True))
 
-        if not data:
-            return jsonify({"error": "Dati mancanti o non validi."}), 400
-
-        # 🔄 Usa il metodo della classe per aggiornare il veicolo
-        updated_vehicle = Vehicle.update_vehicle(vehicle_id, **data)
-
-        if updated_vehicle:
-            return jsonify({
-                "message": "Veicolo aggiornato con successo.",
-                "vehicle": updated_vehicle
-            }), 200
-        else:
-            return jsonify({"error": "Veicolo non trovato."}), 404
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'aggiornamento del veicolo: {str(e)}"}), 500
+    if updated_vehicle:
+        return jsonify({
+            "message": "Veicolo aggiornato con successo.",
+            "vehicle": updated_vehicle
+        }), 200
+    else:
+        return jsonify({"error": "Veicolo non trovato."}), 404
 
 
 @api.route('/vehicles/available-range', methods=['GET'])
-def get_available_vehicles_range():
+@validate(query=schemas.DateRangeQuery)
+def get_available_vehicles_range(query):
     """
     📅 Recupera i veicoli disponibili in un intervallo di date.
     ---
@@ -779,33 +675,172 @@ def get_available_vehicles_range():
       400:
         description: Errore nei parametri forniti
     """
-    try:
-        start_date_str = request.args.get('start_date')
-        end_date_str = request.args.get('end_date')
+    # Date già convertite e ordinate dallo schema: richieste identiche condividono un solo calcolo
+    available_vehicles = available_vehicles_in_range(query.start_date, query.end_date)
 
-        if not start_date_str or not end_date_str:
-            return jsonify({"error": "Le date 'start_date' e 'end_date' sono obbligatorie."}), 400
+    return jsonify({
+        "message": "Veicoli disponibili recuperati con successo.",
+        "vehicles": available_vehicles
+    }), 200
 
-        # Converti le stringhe in oggetti datetime
-        start_date = parser.parse(start_date_str)
-        end_date = parser.parse(end_date_str)   
 
-        # Controlla che le date siano valide
-        if start_date >= end_date:
-            return jsonify({"error": "La data di inizio deve essere antecedente alla data di fine."}), 400
+@api.route('/vehicles/quotes', methods=['GET'])
+@validate(query=schemas.FleetQuotesQuery)
+def get_fleet_quotes(query):
+    """
+    💶 Prezzi di tutti i veicoli attivi per un intervallo di date (pagina catalogo).
+    ---
+    tags:
+      - Vehicles
+    parameters:
+      - name: start_date
+        in: query
+        required: true
+        type: string
+        description: Data di inizio nel formato ISO (es. 2025-02-27T09:00:00)
+      - name: end_date
+        in: query
+        required: true
+        type: string
+        description: Data di fine nel formato ISO (es. 2025-02-28T17:00:00)
+      - name: accessories
+        in: query
+        required: false
+        type: string
+        description: Accessori separati da virgola
+    responses:
+      200:
+        description: Prezzo del noleggio e deposito per ogni veicolo attivo
+      400:
+        description: Errore nei parametri forniti
+    """
+    return jsonify({
+        "message": "Preventivi calcolati con successo.",
+        "quotes": quote_engine.quote_fleet(query.start_date, query.end_date, query.accessories)
+    }), 200
 
-        # Recupera i veicoli disponibili
-        available_vehicles = Vehicle.get_available_vehicles_in_range(start_date, end_date)
 
-        return jsonify({
-            "message": "Veicoli disponibili recuperati con successo.",
-            "vehicles": available_vehicles
-        }), 200
+@api.route('/quotes', methods=['POST'])
+@validate(body=schemas.QuotesBody)
+def get_quotes(body):
+    """
+    💶 Preventivo di più combinazioni (veicolo, intervallo, accessori) in una chiamata.
+    ---
+    tags:
+      - Vehicles
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            items:
+              type: array
+              items:
+                type: object
+                properties:
+                  vehicle_id:
+                    type: integer
+                  start_date:
+                    type: string
+                  end_date:
+                    type: string
+                  accessories:
+                    type: array
+                    items:
+                      type: string
+    responses:
+      200:
+        description: Un preventivo per ogni combinazione, nello stesso ordine
+      400:
+        description: Errore nei parametri forniti
+    """
+    return jsonify({
+        "message": "Preventivi calcolati con successo.",
+        "quotes": quote_engine.quote_many([item.as_dict() for item in body.items])
+    }), 200
 
-    except ValueError:
-        return jsonify({"error": "Formato delle date non valido. Usa il formato ISO (YYYY-MM-DDTHH:MM:SS)."}), 400
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero dei veicoli disponibili: {str(e)}"}), 500
+
+@api.route('/admin/rate-rules', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_rate_rules():
+    rules = RateRule.query.order_by(RateRule.id).all()
+    return jsonify({
+        "message": "Regole tariffarie recuperate con successo.",
+        "rules": [rule.to_dict() for rule in rules]
+    }), 200
+
+
+@api.route('/admin/rate-rules', methods=['POST'])
+@jwt_required()
+@admin_required
+@validate(body=schemas.RateRuleCreateBody)
+def create_rate_rule(body):
+    """
+    📅 Crea una regola tariffaria (moltiplicatore per weekend, festivi, stagione o fascia oraria)
+    ---
+    tags:
+      - Vehicles
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            name:
+              type: string
+            multiplier:
+              type: number
+            vehicle_id:
+              type: integer
+            vehicle_type:
+              type: string
+            start_date:
+              type: string
+            end_date:
+              type: string
+            weekdays:
+              type: string
+              description: Giorni separati da virgola, lunedì = 0 (es. "5,6")
+            hour_from:
+              type: integer
+            hour_to:
+              type: integer
+    responses:
+      201:
+        description: Regola creata
+      400:
+        description: Dati non validi
+    """
+    result = RateRule.create_rule(body.as_dict(exclude_unset=True))
+
+    return jsonify({"message": "Regola tariffaria creata con successo.", "rule": result}), 201
+
+
+@api.route('/admin/rate-rules/<int:rule_id>', methods=['PUT'])
+@jwt_required()
+@admin_required
+@validate(body=schemas.RateRuleBody)
+def update_rate_rule(rule_id, body):
+    result = RateRule.update_rule(rule_id, body.as_dict(exclude_unset=True))
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
+
+    return jsonify({"message": "Regola tariffaria aggiornata con successo.", "rule": result}), 200
+
+
+@api.route('/admin/rate-rules/<int:rule_id>', methods=['DELETE'])
+@jwt_required()
+@admin_required
+def delete_rate_rule(rule_id):
+    result = RateRule.delete_rule(rule_id)
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
+
+    return jsonify(result), 200
 
 
 @api.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
@@ -833,21 +868,18 @@ def delete_vehicle(vehicle_id):
       403:
         description: Accesso negato, permessi insufficienti
     """
-    try:
-        # 🔄 Usa il metodo della classe per eliminare il veicolo
-        deleted = Vehicle.delete_vehicle(vehicle_id)
-
-        if deleted:
-            return jsonify({"message": "Veicolo eliminato con successo."}), 200
-        else:
-            return jsonify({"error": "Veicolo non trovato."}), 404
+    # 🔄 Usa il metodo della classe per eliminare il veicolo
+    deleted = Vehicle.delete_vehicle(vehicle_id)
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'eliminazione del veicolo: {str(e)}"}), 500
+    if deleted:
+        return jsonify({"message": "Veicolo eliminato con successo."}), 200
+    else:
+        return jsonify({"error": "Veicolo non trovato."}), 404
 
 
 @api.route('/check-moto-availability', methods=['POST'])
-def check_moto_availability():
+@validate(body=schemas.AvailabilityBody)
+def check_moto_availability(body):
     """
     🔍 Controlla se una moto è già prenotata in un intervallo di date.
     ---  
@@ -877,38 +909,27 @@ def check_moto_availability():
       400:
         description: Errore nei dati inviati
     """
-    try:
-        data = request.get_json()
-
-        # Controllo parametri richiesti
-        if not data or "moto_id" not in data or "start_date" not in data or "end_date" not in data:
-            return jsonify({"error": "Dati mancanti o non validi."}), 400
-
-        moto_id = data["moto_id"]
-        start_date = datetime.strptime(data["start_date"], "%Y-%m-%d %H:%M:%S")
-        end_date = datetime.strptime(data["end_date"], "%Y-%m-%d %H:%M:%S")
-
-        # Controllo se la data di inizio è inferiore alle 24 ore dal momento attuale
-        now = datetime.now()
-        if start_date <= now + timedelta(hours=12):
-            return jsonify({
-                "moto_id": moto_id,
-                "is_booked": True,
-                "message": "La moto è bloccata poiché la data di inizio è inferiore alle 24 ore."
-            }), 200
-
-        # Verifica la disponibilità tramite la classe Cart
-        is_booked = Cart.is_bike_booked(moto_id, start_date, end_date)
+    moto_id = body.moto_id
+    start_date = body.start_date
+    end_date = body.end_date
 
+    # Controllo se la data di inizio è inferiore alle 24 ore dal momento attuale
+    now = datetime.now()
+    if start_date <= now + timedelta(hours=12):
         return jsonify({
             "moto_id": moto_id,
-            "is_booked": is_booked
+            "is_booked": True,
+            "message": "La moto è bloccata poiché la data di inizio è inferiore alle 24 ore."
         }), 200
 
-    except ValueError:
-        return jsonify({"error": "Formato data non valido. Usa il formato YYYY-MM-DD HH:MM:SS."}), 400
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il controllo della disponibilità: {str(e)}"}), 500
+    # Verifica la disponibilità tramite la classe Cart
+    is_booked = Cart.is_bike_booked(moto_id, start_date, end_date)
+
+    return jsonify({
+        "moto_id": moto_id,
+        "is_booked": is_booked
+    }), 200
+
     
 ######################## CARTS #########################
 
@@ -927,396 +948,349 @@ def create_cart():
       200:
         description: Carrello creato con successo
     """
-    try:
-        user_id = get_jwt_identity()  # 🔐 Ottiene l'ID dell'utente dal JWT
+    user_id = get_jwt_identity()  # 🔐 Ottiene l'ID dell'utente dal JWT
 
-        # ➕ Crea un nuovo carrello
-        cart = Cart.create_cart(user_id)
+    # ➕ Crea un nuovo carrello
+    cart = Cart.create_cart(user_id)
 
-        return jsonify({
-            "message": "Carrello creato con successo.",
-            "cart": cart
-        }), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la creazione del carrello: {str(e)}"}), 500
+    return jsonify({
+        "message": "Carrello creato con successo.",
+        "cart": cart
+    }), 200
 
 
 @api.route('/cart', methods=['POST'])
 @jwt_required()
-def add_item_to_user_cart():
-    try:
-        user_id = get_jwt_identity()
-        # #print(user_id)
-
-        # 🔍 Recupera il carrello attivo per l'utente
-        carts = Cart.get_carts_by_user(user_id)
-        # print(carts)
-        active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
-
-        if not active_cart:
-            return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
-
-        cart = Cart.query.get(active_cart['cart_id'])
+@validate(body=schemas.CartItemBody)
+def add_item_to_user_cart(body):
+    user_id = get_jwt_identity()
+    # #print(user_id)
 
-        # ✅ Ricezione dati dal body della richiesta
-        if not request.is_json:
-            return jsonify({"error": "Il corpo della richiesta deve essere in formato JSON."}), 400
+    # 🔍 Recupera il carrello attivo per l'utente
+    carts = Cart.get_carts_by_user(user_id)
+    # print(carts)
+    active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
 
-        data = request.get_json()
+    if not active_cart:
+        return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
 
-        if not data:
-            return jsonify({"error": "Nessun dato fornito per aggiungere il prodotto."}), 400
+    cart = Cart.query.get(active_cart['cart_id'])
 
-        # ➕ Aggiungi il prodotto al carrello
-        item = cart.add_item(
-        moto_id=data['moto_id'],
-        start_date=parser.isoparse(data['start_date']) + timedelta(hours=1),
-        end_date=parser.isoparse(data['end_date']) + timedelta(hours=1),
-        price=data['price'],
-        accessories=data.get('accessories', [])
+    # 💶 Verifica del prezzo sul listino del server (nessuna query aggiuntiva);
+    # le date con offset sono già nell'ora locale (APP_TIMEZONE)
+    price, price_error = quote_engine.verify(
+        body.moto_id, body.start_date, body.end_date, body.accessories, body.price
+    )
+    if price_error:
+        return price_error
+
+    # ➕ Aggiungi il prodotto al carrello
+    item = cart.add_item(
+        moto_id=body.moto_id,
+        start_date=body.start_date,
+        end_date=body.end_date,
+        price=price,
+        accessories=body.accessories
     )
 
-        # 🔍 Se viene restituito un errore dal metodo add_item
-        if isinstance(item, dict) and "error" in item:
-            return jsonify({"error": item["error"]}), 400  # Restituisce solo l'errore
-
-        return jsonify({
-            "message": "Prodotto aggiunto con successo al carrello.",
-            "item": item
-        }), 200
+    # 🔍 Se viene restituito un errore dal metodo add_item
+    if isinstance(item, dict) and "error" in item:
+        return jsonify({"error": item["error"]}), 400  # Restituisce solo l'errore
 
-    except Exception as e:
-        # #print(f"Errore completo: {str(e)}")
-        return jsonify({"error": f"Errore durante l'aggiunta del prodotto: {str(e)}"}), 500
+    return jsonify({
+        "message": "Prodotto aggiunto con successo al carrello.",
+        "item": item
+    }), 200
 
 
 @api.route('/cart/remove/<int:item_id>', methods=['DELETE'])
 @jwt_required()
 def remove_item_from_cart(item_id):
-    try:
-        user_id = get_jwt_identity()
-
-        # 🔍 Recupera il carrello attivo per l'utente
-        carts = Cart.get_carts_by_user(user_id)
-        active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
+    user_id = get_jwt_identity()
 
-        if not active_cart:
-            return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
+    # 🔍 Recupera il carrello attivo per l'utente
+    carts = Cart.get_carts_by_user(user_id)
+    active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
 
-        cart = Cart.query.get(active_cart['cart_id'])
+    if not active_cart:
+        return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
 
-        # 🗑️ Rimuovi l'elemento dal carrello
-        result = cart.remove_item(item_id)
+    cart = Cart.query.get(active_cart['cart_id'])
 
-        # 🔍 Gestione di eventuali errori
-        if "error" in result:
-            return jsonify(result), 400
+    # 🗑️ Rimuovi l'elemento dal carrello
+    result = cart.remove_item(item_id)
 
-        return jsonify(result), 200
+    # 🔍 Gestione di eventuali errori
+    if "error" in result:
+        return jsonify(result), 400
 
-    except Exception as e:
-        # #print(f"Errore completo: {str(e)}")
-        return jsonify({"error": f"Errore durante la rimozione del prodotto: {str(e)}"}), 500
+    return jsonify(result), 200
 
 
 @api.route('/cart', methods=['GET'])
 @jwt_required()
 def get_user_cart_basic():
-    try:
-        user_id = get_jwt_identity()
-
-        # 🔍 Recupera il carrello attivo per l'utente
-        carts = Cart.get_carts_by_user(user_id)
-        active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
+    user_id = get_jwt_identity()
 
-        if not active_cart:
-            return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
+    # 🔍 Recupera il carrello attivo per l'utente
+    carts = Cart.get_carts_by_user(user_id)
+    active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
 
-        cart = Cart.query.get(active_cart['cart_id'])
-        cart_data = cart.get_user_cart()
+    if not active_cart:
+        return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
 
-        return jsonify(cart_data), 200
+    cart = Cart.query.get(active_cart['cart_id'])
+    cart_data = cart.get_user_cart()
 
-    except Exception as e:
-        # #print(f"Errore completo: {str(e)}")
-        return jsonify({"error": f"Errore durante il recupero del carrello: {str(e)}"}), 500
+    return jsonify(cart_data), 200
 
 
 @api.route('/cart/detailed', methods=['GET'])
 @jwt_required()
 def get_user_cart_detailed():
-    try:
-        user_id = get_jwt_identity()
+    user_id = get_jwt_identity()
 
-        # 🔍 Recupera il carrello attivo per l'utente
-        carts = Cart.get_carts_by_user(user_id)
-        active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
+    # 🔍 Recupera il carrello attivo per l'utente
+    carts = Cart.get_carts_by_user(user_id)
+    active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
 
-        if not active_cart:
-            return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
+    if not active_cart:
+        return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
 
-        cart = Cart.query.get(active_cart['cart_id'])
-        detailed_cart_data = cart.get_detailed_user_cart()
+    cart = Cart.query.get(active_cart['cart_id'])
+    detailed_cart_data = cart.get_detailed_user_cart()
 
-        return jsonify(detailed_cart_data), 200
+    return jsonify(detailed_cart_data), 200
 
-    except Exception as e:
-        # #print(f"Errore completo: {str(e)}")
-        return jsonify({"error": f"Errore durante il recupero dettagliato del carrello: {str(e)}"}), 500
 
 ######################## BOOKINGS #########################
 
 
 @api.route('/booking', methods=['POST'])
 @jwt_required()
-def create_booking():
+@idempotent("booking")
+@validate(body=schemas.BookingBody)
+def create_booking(body):
     try:
         user_id = get_jwt_identity()
+        start_date = body.start_date
+        end_date = body.end_date
+
+        # 💶 Verifica del prezzo sul listino del server (nessuna query aggiuntiva)
+        total_price, price_error = quote_engine.verify(
+            body.bike_id, start_date, end_date, body.accessories, body.total_price
+        )
+        if price_error:
+            return price_error
 
-        # ✅ Controlla se il corpo della richiesta è in formato JSON
-        if not request.is_json:
-            return jsonify({"error": "Il corpo della richiesta deve essere in formato JSON."}), 400
-
-        data = request.get_json()
-
-        # 🔍 Verifica dei dati obbligatori
-        required_fields = [
-            "bike_id", "start_date", "end_date", "total_price",
-            "dl_type", "dl_expiration", "dl_number"
-        ]
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return jsonify({"error": f"Campi obbligatori mancanti: {', '.join(missing_fields)}"}), 400
-
-        # 🕒 Converti le date in formato datetime
-        try:
-            start_date = datetime.strptime(data['start_date'], "%Y-%m-%d %H:%M:%S")
-            end_date = datetime.strptime(data['end_date'], "%Y-%m-%d %H:%M:%S")
-            dl_expiration = datetime.strptime(data['dl_expiration'], "%Y-%m-%d")
-        except ValueError:
-            return jsonify({"error": "Formato data non valido. Usa 'YYYY-MM-DD HH:MM:SS'."}), 400
-
-        # 🔍 Verifica disponibilità della moto
-        if not Booking.check_availability(data['bike_id'], start_date, end_date):
-            return jsonify({"error": "La moto non è disponibile per le date selezionate."}), 400
-
-        # 🔍 Controlla conflitti con altre prenotazioni
-        date_conflict = Booking.check_date_conflict_in_cart(user_id, start_date, end_date)
-        if date_conflict:
-            return jsonify(date_conflict), 400
-
-        # ➕ Crea la prenotazione
+        # ➕ Dati della prenotazione
         booking_data = {
-            "bike_id": data['bike_id'],
+            **body.as_dict(),
             "customer_id": user_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "total_price": data['total_price'],
-            "accessories": data.get('accessories', []),
-            "dl_type": data['dl_type'],
-            "dl_expiration": dl_expiration,
-            "dl_number": data['dl_number'],
-            "helmet_size": data.get('helmet_size'),
-            "gloves_size": data.get('gloves_size'),
-            "pickup": data.get('pickup', False),
-            "return_": data.get('return_', False)
+            "total_price": total_price
         }
 
-        new_booking = Booking.create_booking(booking_data)
+        # 🔒 Controlli e inserimento sotto lock per veicolo: due richieste per la stessa moto non passano entrambe
+        with admission.lock_vehicles([body.bike_id]):
+            # 🔍 Verifica disponibilità della moto (fail-fast: il vincolo del database resta la garanzia)
+            if booking_precheck_enabled() and not Booking.check_availability(body.bike_id, start_date, end_date):
+                return jsonify({"error": "La moto non è disponibile per le date selezionate."}), 400
+
+            # 🔍 Controlla conflitti con altre prenotazioni
+            date_conflict = Booking.check_date_conflict_in_cart(user_id, start_date, end_date)
+            if date_conflict:
+                return jsonify(date_conflict), 400
+
+            new_booking = Booking.create_booking(booking_data)
 
         return jsonify({
             "message": "Prenotazione creata con successo.",
             "booking": new_booking
         }), 201
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la creazione della prenotazione: {str(e)}"}), 500
+    except BookingConflictError:
+        return jsonify({"error": "La moto non è disponibile per le date selezionate."}), 400
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 503
 
 
 @api.route('/booking/<int:booking_id>', methods=['DELETE'])
 @jwt_required()
 def delete_booking(booking_id):
-    try:
-        user_id = get_jwt_identity()
+    user_id = get_jwt_identity()
 
-        # 🔍 Utilizza il metodo della classe per eliminare la prenotazione
-        result = Booking.delete_booking(booking_id, user_id)
+    # 🔍 Utilizza il metodo della classe per eliminare la prenotazione
+    result = Booking.delete_booking(booking_id, user_id)
 
-        # Controlla se la prenotazione è stata trovata o è già cancellata
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 404
+    # Controlla se la prenotazione è stata trovata o è già cancellata
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
 
-        return jsonify({
-            "message": "Prenotazione cancellata con successo.",
-            "booking": result
-        }), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la cancellazione della prenotazione: {str(e)}"}), 500
+    return jsonify({
+        "message": "Prenotazione cancellata con successo.",
+        "booking": result
+    }), 200
 
 
 @api.route('/all-bookings', methods=['GET'])
 @jwt_required()
 @admin_required
-def get_all_bookings():
-    try:
-        # 🔍 Recupera tutte le prenotazioni direttamente dalla tabella bookings
-        all_bookings = Booking.query.all()
-
-        # 🔄 Aggiunge nome utente e modello veicolo a ciascun booking
-        detailed_bookings = []
-        for booking in all_bookings:
-            # 🔍 Recupera le informazioni del cliente
-            customer = User.query.get(booking.customer_id)
-            customer_name = f"{customer.name} {customer.surname}" if customer else "Non trovato"
-
-            # 🔍 Recupera le informazioni del veicolo
-            vehicle = Vehicle.query.get(booking.bike_id)
-            vehicle_info = f"{vehicle.brand} {vehicle.model}" if vehicle else "Non trovato"
-
-            # ➕ Costruisce l'oggetto JSON con tutti i dati della tabella + dettagli
-            detailed_bookings.append({
-                "id": booking.id,
-                "bike_id": booking.bike_id,
-                "customer_id": booking.customer_id,
-                "customer_name": customer_name,
-                "start_date": booking.start_date,
-                "end_date": booking.end_date,
-                "total_price": booking.total_price,
-                "status": booking.status,
-                "payment_status": booking.payment_status,
-                "created_at": booking.created_at,
-                "last_update": booking.last_update,
-                "accessories": booking.accessories,
-                "dl_type": booking.dl_type,
-                "dl_expiration": booking.dl_expiration,
-                "dl_number": booking.dl_number,
-                "helmet_size": booking.helmet_size,
-                "gloves_size": booking.gloves_size,
-                "pickup": booking.pickup,
-                "return_": booking.return_,
-                "booking_code": booking.booking_code,  # 🔥 Ora prende il valore direttamente dalla tabella
-                "vehicle_info": vehicle_info
-            })
-
-        # ✅ Restituisce tutte le prenotazioni con i dettagli aggiuntivi
-        return jsonify({
-            "message": "Elenco di tutte le prenotazioni recuperato con successo.",
-            "bookings": detailed_bookings
-        }), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero delle prenotazioni: {str(e)}"}), 500
+@validate(query=schemas.ArchiveQuery)
+def get_all_bookings(query):
+    # 🔍 Recupera tutte le prenotazioni dalla tabella bookings (?include_archived=true per lo storico)
+    all_bookings = Booking.query.all()
+    if query.include_archived:
+        all_bookings += BookingArchive.query.all()
+
+    # 🔄 Aggiunge nome utente e modello veicolo a ciascun booking (una query IN per tipo)
+    loader = request_loader()
+    loader.prime(User, [booking.customer_id for booking in all_bookings])
+    loader.prime(Vehicle, [booking.bike_id for booking in all_bookings])
+
+    detailed_bookings = []
+    for booking in all_bookings:
+        # 🔍 Recupera le informazioni del cliente
+        customer = loader.get(User, booking.customer_id)
+        customer_name = f"{customer.name} {customer.surname}" if customer else "Non trovato"
+
+        # 🔍 Recupera le informazioni del veicolo
+        vehicle = loader.get(Vehicle, booking.bike_id)
+        vehicle_info = f"{vehicle.brand} {vehicle.model}" if vehicle else "Non trovato"
+
+        # ➕ Costruisce l'oggetto JSON con tutti i dati della tabella + dettagli
+        detailed_bookings.append({
+            "id": booking.id,
+            "bike_id": booking.bike_id,
+            "customer_id": booking.customer_id,
+            "customer_name": customer_name,
+            "start_date": booking.start_date,
+            "end_date": booking.end_date,
+            "total_price": booking.total_price,
+            "status": booking.status,
+            "payment_status": booking.payment_status,
+            "created_at": booking.created_at,
+            "last_update": booking.last_update,
+            "accessories": booking.accessories,
+            "dl_type": booking.dl_type,
+            "dl_expiration": booking.dl_expiration,
+            "dl_number": booking.dl_number,
+            "helmet_size": booking.helmet_size,
+            "gloves_size": booking.gloves_size,
+            "pickup": booking.pickup,
+            "return_": booking.return_,
+            "booking_code": booking.booking_code,  # 🔥 Ora prende il valore direttamente dalla tabella
+            "vehicle_info": vehicle_info,
+            "archived": isinstance(booking, BookingArchive)
+        })
+
+    # ✅ Restituisce tutte le prenotazioni con i dettagli aggiuntivi
+    return jsonify({
+        "message": "Elenco di tutte le prenotazioni recuperato con successo.",
+        "bookings": detailed_bookings
+    }), 200
+
+
+@api.route('/admin/bookings/search', methods=['GET'])
+@jwt_required()
+@admin_required
+@validate(query=schemas.BookingSearchQuery)
+def search_bookings(query):
+    """
+    🔎 Ricerca delle prenotazioni per date, stato, pagamento, ritiro/riconsegna,
+    veicolo, cliente e codice, ordinata e paginata (solo per amministratori)
+    """
+    return jsonify({
+        "message": "Ricerca delle prenotazioni completata con successo.",
+        **booking_search.search_bookings(booking_search.build_criteria(query))
+    }), 200
 
 
 @api.route('/booking/<int:booking_id>', methods=['PUT'])
 @jwt_required()
-def update_booking(booking_id):
-    try:
-        user_id = get_jwt_identity()
-
-        # ✅ Controlla se il corpo della richiesta è in formato JSON
-        if not request.is_json:
-            return jsonify({"error": "Il corpo della richiesta deve essere in formato JSON."}), 400
-
-        data = request.get_json()
-
-        # 🔍 Controlla che siano stati inviati dati da aggiornare
-        if not data:
-            return jsonify({"error": "Nessun dato fornito per l'aggiornamento."}), 400
+@validate(body=schemas.BookingUpdateBody)
+def update_booking(booking_id, body):
+    user_id = get_jwt_identity()
 
-        # 🔍 Utilizza il metodo della classe per aggiornare la prenotazione
-        result = Booking.update_booking(booking_id, user_id, data)
+    # 🔍 Controlla che siano stati inviati dati da aggiornare
+    update_data = body.as_dict(exclude_unset=True)
+    if not update_data:
+        return jsonify({"error": "Nessun campo modificabile fornito per l'aggiornamento."}), 400
 
-        # Controlla se si è verificato un errore
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 404
+    # 🔍 Utilizza il metodo della classe per aggiornare la prenotazione
+    result = Booking.update_booking(booking_id, user_id, update_data)
 
-        return jsonify(result), 200
+    # Controlla se si è verificato un errore
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'aggiornamento della prenotazione: {str(e)}"}), 500
+    return jsonify(result), 200
 
 
 @api.route('/booking/user', methods=['GET'])
 @jwt_required()
-def get_user_bookings():
-    try:
-        user_id = get_jwt_identity()
-
-        # 🔍 Recupera tutte le prenotazioni dell'utente usando il metodo della classe
-        bookings = Booking.get_bookings_by_customer(user_id)
+@validate(query=schemas.ArchiveQuery)
+def get_user_bookings(query):
+    user_id = get_jwt_identity()
 
-        # 🔄 Aggiungi i dettagli del veicolo e il codice di prenotazione
-        detailed_bookings = []
-        for booking in bookings:
-            # 🔍 Aggiungi i dettagli del veicolo
-            vehicle = Vehicle.find_by_id(booking['bike_id'])
-            if vehicle:
-                booking['vehicle'] = vehicle.to_dict()
+    # 🔍 Recupera tutte le prenotazioni dell'utente usando il metodo della classe
+    bookings = Booking.get_bookings_by_customer(user_id, include_archived=query.include_archived)
 
-            detailed_bookings.append(booking)
+    # 🔄 Aggiungi i dettagli del veicolo e il codice di prenotazione
+    request_loader().prime(Vehicle, [booking['bike_id'] for booking in bookings])
+    detailed_bookings = []
+    for booking in bookings:
+        # 🔍 Aggiungi i dettagli del veicolo
+        vehicle = Vehicle.find_by_id(booking['bike_id'])
+        if vehicle:
+            booking['vehicle'] = vehicle.to_dict()
 
-        return jsonify({
-            "message": "Elenco delle prenotazioni recuperato con successo.",
-            "bookings": detailed_bookings
-        }), 200
+        detailed_bookings.append(booking)
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero delle prenotazioni: {str(e)}"}), 500
+    return jsonify({
+        "message": "Elenco delle prenotazioni recuperato con successo.",
+        "bookings": detailed_bookings
+    }), 200
 
 
 @api.route('/bookings/vehicle/<int:bike_id>', methods=['GET'])
-def get_bookings_by_vehicle(bike_id):
-    try:
-        # 🔍 Recupera tutte le prenotazioni per il veicolo usando il metodo della classe
-        bookings = Booking.get_bookings_by_vehicle(bike_id)
-
-        # Controlla se ci sono prenotazioni
-        if isinstance(bookings, dict) and "error" in bookings:
-            return jsonify({"error": bookings["error"]}), 404
+@validate(query=schemas.ArchiveQuery)
+def get_bookings_by_vehicle(bike_id, query):
+    # 🔍 Recupera tutte le prenotazioni per il veicolo usando il metodo della classe
+    bookings = Booking.get_bookings_by_vehicle(bike_id, include_archived=query.include_archived)
 
-        return jsonify({
-            "message": "Elenco delle prenotazioni recuperato con successo.",
-            "bookings": bookings
-        }), 200
+    # Controlla se ci sono prenotazioni
+    if isinstance(bookings, dict) and "error" in bookings:
+        return jsonify({"error": bookings["error"]}), 404
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero delle prenotazioni: {str(e)}"}), 500
+    return jsonify({
+        "message": "Elenco delle prenotazioni recuperato con successo.",
+        "bookings": bookings
+    }), 200
 
 
 @api.route('/booking/<int:booking_id>/payment', methods=['PATCH'])
 @jwt_required()
 def update_payment_status(booking_id):
-    try:
-        user_id = get_jwt_identity()
+    user_id = get_jwt_identity()
 
-        # 🔍 Usa il metodo della classe per aggiornare il pagamento
-        result = Booking.update_payment_status(booking_id, user_id)
+    # 🔍 Usa il metodo della classe per aggiornare il pagamento
+    result = Booking.update_payment_status(booking_id, user_id)
 
-        # Controlla se ci sono errori
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 404 if "non trovata" in result["error"] else 400
+    # Controlla se ci sono errori
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404 if "non trovata" in result["error"] else 400
 
-        return jsonify(result), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'aggiornamento dello stato di pagamento: {str(e)}"}), 500
+    return jsonify(result), 200
 
 
 @api.route('/cart/submit', methods=['POST'])
 @jwt_required()
-def submit_cart():
+@idempotent("cart_submit")
+@validate(body=schemas.CartSubmitBody)
+def submit_cart(body):
     try:
         user_id = get_jwt_identity()
 
-        # ✅ Controlla se il corpo della richiesta è in formato JSON
-        if not request.is_json:
-            return jsonify({"error": "Il corpo della richiesta deve essere in formato JSON."}), 400
-
-        extra_data = request.get_json()
-
         # 🔍 Recupera il carrello attivo
         carts = Cart.get_carts_by_user(user_id)
         active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
@@ -1325,9 +1299,12 @@ def submit_cart():
             return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
 
         cart = Cart.query.get(active_cart['cart_id'])
+        bike_ids = [moto_id for (moto_id,) in db.session.query(CartItem.moto_id).filter_by(cart_id=cart.cart_id)]
 
-        # 🔄 Usa il metodo della classe per sottomettere il carrello con i dati extra
-        result = cart.submit_cart_as_order(extra_data)
+        # 🔄 Usa il metodo della classe per sottomettere il carrello con i dati extra,
+        # sotto il lock di tutti i veicoli del carrello
+        with admission.lock_vehicles(bike_ids):
+            result = cart.submit_cart_as_order(body.as_dict())
 
         # Controlla se si è verificato un errore
         if "error" in result:
@@ -1335,116 +1312,67 @@ def submit_cart():
 
         return jsonify(result), 200
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la sottomissione del carrello: {str(e)}"}), 500
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 503
 
 
 @api.route('/cart/clear', methods=['DELETE'])
 @jwt_required()
 def clear_cart():
-    try:
-        user_id = get_jwt_identity()
-
-        # 🔍 Recupera il carrello attivo
-        carts = Cart.get_carts_by_user(user_id)
-        active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
+    user_id = get_jwt_identity()
 
-        if not active_cart:
-            return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
+    # 🔍 Recupera il carrello attivo
+    carts = Cart.get_carts_by_user(user_id)
+    active_cart = next((cart for cart in carts if cart['status'] == 'active'), None)
 
-        cart = Cart.query.get(active_cart['cart_id'])
+    if not active_cart:
+        return jsonify({"error": "Nessun carrello attivo trovato per l'utente."}), 404
 
-        # 🔄 Usa il metodo della classe per eliminare tutti i prodotti
-        result = cart.clear_cart()
+    cart = Cart.query.get(active_cart['cart_id'])
 
-        # Controlla se si è verificato un errore
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 400
+    # 🔄 Usa il metodo della classe per eliminare tutti i prodotti
+    result = cart.clear_cart()
 
-        return jsonify(result), 200
+    # Controlla se si è verificato un errore
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 400
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la cancellazione del carrello: {str(e)}"}), 500
+    return jsonify(result), 200
 
 
 @api.route('/booking/code/<int:generated_code>', methods=['GET'])
 @jwt_required()
 def get_booking_by_code(generated_code):
-    try:
-        user_id = get_jwt_identity()
+    user_id = get_jwt_identity()
 
-        # 🔍 Recupera l'utente autenticato
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "Utente non trovato."}), 404
-
-        # 🔍 Usa il metodo della classe per recuperare la prenotazione
-        booking = Booking.get_booking_by_code(generated_code)
-
-        # Controlla se la prenotazione è stata trovata
-        if booking is None:
-            return jsonify({"error": "Prenotazione non trovata."}), 404
-
-        # 🔒 Controllo dei permessi di accesso:
-        if booking["customer_id"] != user_id and user.role != "admin":
-            return jsonify({"error": "Accesso negato. La prenotazione non appartiene all'utente o non sei un admin."}), 403
-
-        # 🔍 Recupera i dati completi del cliente
-        customer = User.query.get(booking["customer_id"])
-        if not customer:
-            return jsonify({"error": "Utente associato alla prenotazione non trovato."}), 404
-
-        # 🏍️ Recupera i dettagli del veicolo associato
-        vehicle = Vehicle.query.get(booking["bike_id"])
-        if not vehicle:
-            return jsonify({"error": "Veicolo associato alla prenotazione non trovato."}), 404
-
-        # 📄 Costruisce la risposta dettagliata
-        detailed_booking = {
-            "id": booking["id"],
-            "booking_code": generated_code,
-            "start_date": booking["start_date"],
-            "end_date": booking["end_date"],
-            "total_price": booking["total_price"],
-            "payment_status": booking["payment_status"],
-            "pickup": booking["pickup"],
-            "return_": booking["return_"],
-            "status": booking["status"],
-            "user": {
-                "id": customer.id,
-                "name": customer.name,
-                "surname": customer.surname,
-                "email": customer.email,
-                "bday": customer.bday.strftime("%Y-%m-%d") if customer.bday else None,
-                "place": customer.place,
-                "role": customer.role
-            },
-            "vehicle": {
-                "id": vehicle.id,
-                "brand": vehicle.brand,
-                "model": vehicle.model,
-                "year": vehicle.year,
-                "license_plate": vehicle.license_plate,
-                "fuel_type": vehicle.fuel_type,
-                "deposit": vehicle.deposit,
-                "power": vehicle.power,
-                "image_url": vehicle.image_url,
-                "description": vehicle.description
-            }
-        }
+    # 🔍 Prenotazione, cliente, veicolo e ruolo dell'utente in una sola query (cache per i ritiri di oggi)
+    found = booking_lookup.find_by_code(generated_code, user_id)
 
-        return jsonify({
-            "message": "Prenotazione trovata con successo.",
-            "booking": detailed_booking
-        }), 200
+    # Controlla se la prenotazione è stata trovata
+    if found is None:
+        return jsonify({"error": "Prenotazione non trovata."}), 404
+    booking_id, customer_id, detailed_booking, role = found
+
+    if role is None:
+        return jsonify({"error": "Utente non trovato."}), 404
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il recupero della prenotazione: {str(e)}"}), 500
+    # 🔒 Controllo dei permessi di accesso:
+    if str(customer_id) != str(user_id) and role != "admin":
+        return jsonify({"error": "Accesso negato. La prenotazione non appartiene all'utente o non sei un admin."}), 403
+
+    if detailed_booking is None:
+        return jsonify({"error": "Cliente o veicolo associato alla prenotazione non trovato."}), 404
+
+    return jsonify({
+        "message": "Prenotazione trovata con successo.",
+        "booking": detailed_booking
+    }), 200
 
 
 @api.route('/check-user-booking-conflict', methods=['POST'])
 @jwt_required()
-def check_user_booking_conflict():
+@validate(body=schemas.ConflictCheckBody)
+def check_user_booking_conflict(body):
     """
     🔍 Controlla se l'utente ha altre prenotazioni nello stesso intervallo di date.
     ---
@@ -1458,83 +1386,47 @@ def check_user_booking_conflict():
       400:
         description: Dati non validi
     """
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-
-        # Controlla la presenza dei dati richiesti
-        if not data or "start_date" not in data or "end_date" not in data:
-            return jsonify({"error": "Dati mancanti o non validi."}), 400
-
-        start_date = datetime.strptime(data["start_date"], "%Y-%m-%d %H:%M:%S")
-        end_date = datetime.strptime(data["end_date"], "%Y-%m-%d %H:%M:%S")
-
-        # Verifica se ci sono prenotazioni in conflitto
-        has_conflict = Booking.has_conflicting_booking(user_id, start_date, end_date)
+    user_id = get_jwt_identity()
 
-        return jsonify({
-            "user_id": user_id,
-            "has_conflict": has_conflict
-        }), 200
+    # Verifica se ci sono prenotazioni in conflitto
+    has_conflict = Booking.has_conflicting_booking(user_id, body.start_date, body.end_date)
 
-    except ValueError:
-        return jsonify({"error": "Formato data non valido. Usa il formato YYYY-MM-DD HH:MM:SS."}), 400
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il controllo del conflitto: {str(e)}"}), 500
+    return jsonify({
+        "user_id": user_id,
+        "has_conflict": has_conflict
+    }), 200
 
 
 @api.route('/bookings_by_name', methods=['GET'])
 @jwt_required()
-def get_bookings_by_name():
-    try:
-        first_name = request.args.get('first_name', '').strip()
-        last_name = request.args.get('last_name', '').strip()
-
-        if not first_name or not last_name:
-            return jsonify({"error": "I parametri 'first_name' e 'last_name' sono obbligatori."}), 400
+@validate(query=schemas.BookingsByNameQuery)
+def get_bookings_by_name(query):
+    # Recupera le prenotazioni dettagliate
+    bookings = Booking.get_detailed_bookings_by_name(query.first_name, query.last_name)
 
-        # Recupera le prenotazioni dettagliate
-        bookings = Booking.get_detailed_bookings_by_name(first_name, last_name)
+    if not bookings:
+        return jsonify({"message": "Nessuna prenotazione trovata per questo utente."}), 200
 
-        if not bookings:
-            return jsonify({"message": "Nessuna prenotazione trovata per questo utente."}), 200
-
-        return jsonify({"bookings": bookings}), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la ricerca delle prenotazioni: {str(e)}"}), 500
+    return jsonify({"bookings": bookings}), 200
 
 
 @api.route('/booking/generate-code', methods=['POST'])
 @jwt_required()
-def generate_booking_code_without_saving():
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-
-        # 🔍 Controllo dei dati richiesti
-        required_fields = ["bike_id", "booking_id", "start_date", "end_date"]
-        if not all(field in data for field in required_fields):
-            return jsonify({"error": "Dati richiesti mancanti."}), 400
-
-        bike_id = data["bike_id"]
-        booking_id = data["booking_id"]
-        start_date = data["start_date"]
-        end_date = data["end_date"]
+@validate(body=schemas.GenerateCodeBody)
+def generate_booking_code_without_saving(body):
+    user_id = get_jwt_identity()
 
-        # 🔢 Genera solo il codice senza salvarlo nel database
-        result = BookingCode.generate_code_only(user_id, bike_id, booking_id, start_date, end_date)
+    # 🔢 Genera solo il codice senza salvarlo nel database
+    result = BookingCode.generate_code_only(user_id, body.bike_id, body.booking_id, body.start_date, body.end_date)
 
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 404
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
 
-        return jsonify({
-            "message": "Codice generato con successo.",
-            "generated_code": result["generated_code"]
-        }), 200
+    return jsonify({
+        "message": "Codice generato con successo.",
+        "generated_code": result["generated_code"]
+    }), 200
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante la generazione del codice: {str(e)}"}), 500
 
 ########################## UTILS ##########################
 
@@ -1542,49 +1434,37 @@ def generate_booking_code_without_saving():
 @api.route('/booking/<int:booking_id>/toggle-pickup', methods=['PATCH'])
 @jwt_required()
 def toggle_pickup(booking_id):
-    try:
-        user_id = get_jwt_identity()
-        result = Booking.toggle_pickup(booking_id, user_id)
-
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 404
+    user_id = get_jwt_identity()
+    result = Booking.toggle_pickup(booking_id, user_id)
 
-        return jsonify(result), 200
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il toggle del campo pickup: {str(e)}"}), 500
+    return jsonify(result), 200
 
 
 @api.route('/booking/<int:booking_id>/toggle-return', methods=['PATCH'])
 @jwt_required()
 def toggle_return(booking_id):
-    try:
-        user_id = get_jwt_identity()
-        result = Booking.toggle_return(booking_id, user_id)
+    user_id = get_jwt_identity()
+    result = Booking.toggle_return(booking_id, user_id)
 
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 404
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
 
-        return jsonify(result), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il toggle del campo return: {str(e)}"}), 500
+    return jsonify(result), 200
 
 
 @api.route('/booking/<int:booking_id>/toggle-payment', methods=['PATCH'])
 @jwt_required()
 def toggle_payment_status(booking_id):
-    try:
-        user_id = get_jwt_identity()
-        result = Booking.toggle_payment_status(booking_id, user_id)
-
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 404
+    user_id = get_jwt_identity()
+    result = Booking.toggle_payment_status(booking_id, user_id)
 
-        return jsonify(result), 200
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 404
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante il toggle del campo payment_status: {str(e)}"}), 500
+    return jsonify(result), 200
 
 
 @api.route('/protected', methods=['GET'])
@@ -1599,65 +1479,112 @@ def protected_route():
 
 @api.route('/booking/add-code', methods=['POST'])
 @jwt_required()
-def api_add_booking_code():
-    try:
-        user_id = get_jwt_identity()  # Recupera l'utente autenticato
-        data = request.get_json()
+@validate(body=schemas.AddCodeBody)
+def api_add_booking_code(body):
+    # ➕ Usa il metodo della classe per aggiungere il codice
+    result = BookingCode.add_booking_code(body.booking_id, body.generated_code)
 
-        # 🔍 Controllo dei dati richiesti
-        required_fields = ["booking_id", "generated_code"]
-        if not all(field in data for field in required_fields):
-            return jsonify({"error": "Dati richiesti mancanti."}), 400
+    # 🚫 Restituisci un errore se qualcosa è andato storto
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 400
 
-        booking_id = data["booking_id"]
-        generated_code = data["generated_code"]
+    # ✅ Codice aggiunto con successo
+    return jsonify({
+        "message": "Codice di prenotazione aggiunto con successo.",
+        "generated_code": result["generated_code"]
+    }), 200
 
-        # ➕ Usa il metodo della classe per aggiungere il codice
-        result = BookingCode.add_booking_code(booking_id, generated_code)
 
-        # 🚫 Restituisci un errore se qualcosa è andato storto
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 400
+@api.route('/user/<int:user_id>/send-email', methods=['POST'])
+@jwt_required()
+@validate(body=schemas.EmailBody)
+def send_email_to_user(user_id, body):
+    # 🔍 Recupera l'utente
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "Utente non trovato."}), 404
 
-        # ✅ Codice aggiunto con successo
-        return jsonify({
-            "message": "Codice di prenotazione aggiunto con successo.",
-            "generated_code": result["generated_code"]
-        }), 200
+    # 📧 Invia l'email usando il metodo della classe User
+    result = user.send_email(body.subject, body.body)
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'aggiunta del codice: {str(e)}"}), 500
+    # Gestione degli errori
+    if "error" in result:
+        return jsonify({"error": result["error"]}), 500
 
+    return jsonify(result), 200
 
-@api.route('/user/<int:user_id>/send-email', methods=['POST'])
+
+@api.route('/admin/sql-profile', methods=['GET'])
 @jwt_required()
-def send_email_to_user(user_id):
-    try:
-        # 🔍 Recupera l'utente
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({"error": "Utente non trovato."}), 404
+@admin_required
+@validate(query=schemas.SqlProfileQuery)
+def get_sql_profile(query):
+    """
+    🔍 Ultimi report del profiler SQL (solo per amministratori)
+    """
+    if not profiler.enabled:
+        return jsonify({"error": "Il profiler SQL non è attivo. Imposta SQL_PROFILER_ENABLED=true."}), 404
 
-        # 📥 Ricevi i dati della mail dal JSON
-        if not request.is_json:
-            return jsonify({"error": "Il corpo della richiesta deve essere in formato JSON."}), 400
+    return jsonify({
+        "message": "Report del profiler recuperati con successo.",
+        "reports": profiler.recent_reports(query.limit)
+    }), 200
 
-        data = request.get_json()
-        subject = data.get("subject")
-        body = data.get("body")
 
-        # 🔍 Controlla se i dati sono validi
-        if not subject or not body:
-            return jsonify({"error": "Subject e body sono obbligatori."}), 400
+######################### ANALYTICS #########################
 
-        # 📧 Invia l'email usando il metodo della classe User
-        result = user.send_email(subject, body)
 
-        # Gestione degli errori
-        if "error" in result:
-            return jsonify({"error": result["error"]}), 500
+@api.route('/admin/analytics/utilization', methods=['GET'])
+@jwt_required()
+@admin_required
+@validate(query=schemas.DayRangeQuery)
+def get_fleet_utilization(query):
+    """
+    📊 Ore prenotate e tasso di utilizzo per veicolo in un intervallo di giorni (solo per amministratori)
+    """
+    return jsonify({
+        "message": "Utilizzo della flotta calcolato con successo.",
+        **analytics.utilization(query.start_date, query.end_date, query.vehicle_id)
+    }), 200
 
-        return jsonify(result), 200
 
-    except Exception as e:
-        return jsonify({"error": f"Errore durante l'invio dell'email: {str(e)}"}), 500
+@api.route('/admin/analytics/revenue', methods=['GET'])
+@jwt_required()
+@admin_required
+@validate(query=schemas.RevenueQuery)
+def get_revenue(query):
+    """
+    💶 Ricavi raggruppati per giorno, mese o veicolo (solo per amministratori)
+    """
+    return jsonify({
+        "message": "Ricavi calcolati con successo.",
+        **analytics.revenue(query.start_date, query.end_date, query.group, query.vehicle_id)
+    }), 200
+
+
+@api.route('/admin/analytics/top-vehicles', methods=['GET'])
+@jwt_required()
+@admin_required
+@validate(query=schemas.TopVehiclesQuery)
+def get_top_vehicles(query):
+    """
+    🏆 Veicoli con più ricavi o più ore prenotate (solo per amministratori)
+    """
+    limit = min(max(query.limit, 1), 100)
+
+    return jsonify({
+        "message": "Classifica dei veicoli calcolata con successo.",
+        "vehicles": analytics.top_vehicles(query.start_date, query.end_date, query.by, limit)
+    }), 200
+
+
+@api.route('/admin/analytics/rebuild', methods=['POST'])
+@jwt_required()
+@admin_required
+def rebuild_analytics():
+    """
+    🧮 Ricostruisce da zero gli aggregati di utilizzo (backfill, solo per amministratori)
+    """
+    rows = analytics.rebuild_stats()
+    return jsonify({"message": "Aggregati ricostruiti con successo.", "rows": rows}), 200
+
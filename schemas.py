@@ -0,0 +1,642 @@
+"""
+Schemi dichiarativi per body JSON e query string delle route.
+
+Ogni schema elenca i propri campi come attributi di classe; alla definizione
+della classe i campi vengono compilati in una tupla di convertitori, così la
+validazione di una richiesta è un solo passaggio sul dizionario decodificato,
+senza reflection né controlli ripetuti nelle view:
+
+    class AvailabilityBody(Schema):
+        moto_id = Int(min=1)
+        start_date = DateTime()
+        end_date = DateTime()
+
+    @api.route('/check-moto-availability', methods=['POST'])
+    @validate(body=AvailabilityBody)
+    def check_moto_availability(body):
+        ...body.moto_id, body.start_date...
+
+Gli errori di tutti i campi vengono raccolti e restituiti insieme con un 400
+uniforme: {"error": "validation_error", "message": ..., "fields": {campo: motivo}}.
+
+📅 Fuso orario: le date/ore sono salvate naive nell'ora locale del noleggio
+(APP_TIMEZONE). Un valore con offset (es. "2025-02-27T08:00:00Z" inviato dal
+browser) viene convertito in quell'ora locale; un valore senza offset è già
+considerato ora locale.
+"""
+import math
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+from zoneinfo import ZoneInfo
+
+from flask import jsonify, make_response, request
+
+from config import Config
+
+_UNSET = object()
+
+local_timezone = ZoneInfo(Config.APP_TIMEZONE)
+
+TRUE_VALUES = {"true", "1", "yes"}
+FALSE_VALUES = {"false", "0", "no"}
+INTEGER_RE = re.compile(r"-?[0-9]+")
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+
+class ValidationError(Exception):
+    def __init__(self, fields):
+        self.fields = fields  # campo -> motivo
+        super().__init__("; ".join(f"{name}: {reason}" for name, reason in fields.items()))
+
+    def response(self):
+        return make_response(jsonify({
+            "error": "validation_error",
+            "message": f"Richiesta non valida. {self}",
+            "fields": self.fields
+        }), 400)
+
+
+########################## CAMPI ##########################
+
+
+class Field:
+    """
+    Campo di uno schema. convert(value, strings) restituisce il valore
+    convertito o solleva ValueError con il motivo; strings=True per i valori
+    della query string (sempre stringhe).
+    """
+
+    def __init__(self, required=True, default=None, nullable=False, key=None):
+        self.required = required and default is None
+        self.default = default
+        self.nullable = nullable
+        self.key = key
+
+    def convert(self, value, strings):
+        return value
+
+
+class Any(Field):
+    """
+    Valore JSON qualsiasi, senza conversione.
+    """
+
+
+class Str(Field):
+    def __init__(self, min_length=1, max_length=None, choices=None, strip=True, lower=False, **kwargs):
+        super().__init__(**kwargs)
+        self.min_length = min_length
+        self.max_length = max_length
+        self.choices = tuple(choices) if choices else None
+        self.strip = strip
+        self.lower = lower
+
+    def convert(self, value, strings):
+        if not isinstance(value, str):
+            raise ValueError("deve essere una stringa.")
+        if self.strip:
+            value = value.strip()
+        if self.lower:
+            value = value.lower()
+        if len(value) < self.min_length:
+            raise ValueError("campo obbligatorio." if not value else f"almeno {self.min_length} caratteri.")
+        if self.max_length is not None and len(value) > self.max_length:
+            raise ValueError(f"al massimo {self.max_length} caratteri.")
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"valori ammessi: {', '.join(self.choices)}.")
+        return value
+
+
+class Int(Field):
+    """
+    Intero con segno a 64 bit (il limite delle colonne del database) se min e max non lo restringono.
+    """
+
+    def __init__(self, min=None, max=None, **kwargs):
+        super().__init__(**kwargs)
+        self.min = min
+        self.max = max
+
+    def convert(self, value, strings):
+        if isinstance(value, bool):
+            raise ValueError("deve essere un numero intero.")
+        if isinstance(value, str):
+            # Id e codici arrivano spesso come stringhe anche nei body JSON
+            text = value.strip()
+            if not INTEGER_RE.fullmatch(text):
+                raise ValueError("deve essere un numero intero.")
+            if len(text.lstrip("-")) > 19:
+                raise ValueError("è fuori dall'intervallo consentito.")  # Prima di int(): niente stringhe enormi
+            value = int(text)
+        elif not isinstance(value, int):
+            raise ValueError("deve essere un numero intero.")
+        if not INT64_MIN <= value <= INT64_MAX:
+            raise ValueError("è fuori dall'intervallo consentito.")
+        if self.min is not None and value < self.min:
+            raise ValueError(f"deve essere almeno {self.min}.")
+        if self.max is not None and value > self.max:
+            raise ValueError(f"deve essere al massimo {self.max}.")
+        return value
+
+
+class Number(Field):
+    """
+    Numero (float, oppure Decimal con decimal=True). positive=True esclude lo zero.
+    """
+
+    def __init__(self, min=None, positive=False, decimal=False, **kwargs):
+        super().__init__(**kwargs)
+        self.min = min
+        self.positive = positive
+        self.decimal = decimal
+
+    def convert(self, value, strings):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError("deve essere un numero.")
+        try:
+            value = Decimal(str(value).strip()) if self.decimal else float(value)
+        except (ValueError, InvalidOperation):
+            raise ValueError("deve essere un numero.") from None
+        if not (value.is_finite() if self.decimal else math.isfinite(value)):
+            raise ValueError("deve essere un numero finito.")
+        if self.positive and value <= 0:
+            raise ValueError("deve essere positivo.")
+        if self.min is not None and value < self.min:
+            raise ValueError(f"deve essere almeno {self.min}.")
+        return value
+
+
+class Bool(Field):
+    def convert(self, value, strings):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            text = value.strip().lower()
+            if text in TRUE_VALUES:
+                return True
+            if text in FALSE_VALUES:
+                return False
+        raise ValueError("deve essere true o false.")
+
+
+class Date(Field):
+    """
+    Giorno nel formato YYYY-MM-DD.
+    """
+
+    def convert(self, value, strings):
+        if isinstance(value, str):
+            try:
+                return date.fromisoformat(value.strip())
+            except ValueError:
+                pass
+        raise ValueError("data non valida, usa il formato YYYY-MM-DD.")
+
+
+class DateTime(Field):
+    """
+    Data/ora ISO 8601 ("YYYY-MM-DDTHH:MM:SS" o "YYYY-MM-DD HH:MM:SS", offset
+    facoltativo), restituita naive nell'ora locale di APP_TIMEZONE.
+    """
+
+    def convert(self, value, strings):
+        if isinstance(value, str):
+            try:
+                parsed = datetime.fromisoformat(value.strip())
+            except ValueError:
+                pass
+            else:
+                if parsed.tzinfo is not None:
+                    parsed = parsed.astimezone(local_timezone).replace(tzinfo=None)
+                return parsed
+        raise ValueError("data/ora non valida, usa il formato ISO 8601 (YYYY-MM-DDTHH:MM:SS).")
+
+
+class List(Field):
+    """
+    Lista di valori di un campo o di oggetti di uno schema annidato.
+    Nella query string è una stringa separata da virgole.
+    """
+
+    def __init__(self, item, min_items=0, max_items=None, **kwargs):
+        super().__init__(**kwargs)
+        self.item = item
+        self.min_items = min_items
+        self.max_items = max_items
+
+    def convert(self, value, strings):
+        if strings and isinstance(value, str):
+            value = [part for part in value.split(",") if part.strip()]
+        if not isinstance(value, list):
+            raise ValueError("deve essere una lista.")
+        if len(value) < self.min_items:
+            raise ValueError("la lista non può essere vuota." if self.min_items == 1
+                             else f"almeno {self.min_items} elementi.")
+        if self.max_items is not None and len(value) > self.max_items:
+            raise ValueError(f"al massimo {self.max_items} elementi.")
+
+        item = self.item
+        nested = isinstance(item, type) and issubclass(item, Schema)
+        result = []
+        errors = {}
+        for index, element in enumerate(value):
+            try:
+                result.append(item.decode(element) if nested else item.convert(element, strings))
+            except ValidationError as e:
+                errors.update({f"[{index}].{name}": reason for name, reason in e.fields.items()})
+            except (ValueError, TypeError) as e:
+                errors[f"[{index}]"] = str(e)
+        if errors:
+            raise ValidationError(errors)
+        return result
+
+
+########################## SCHEMI ##########################
+
+
+class Schema:
+    """
+    Base degli schemi: i campi dichiarati (ereditati compresi) vengono
+    compilati una volta sola in _plan.
+    """
+    _fields = {}
+    _plan = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = dict(cls._fields)
+        for name, value in list(vars(cls).items()):
+            if isinstance(value, Field):
+                fields[name] = value
+                delattr(cls, name)
+        cls._fields = fields
+        cls._plan = tuple(
+            (name, field.key or name, field.convert, field.required, field.default, field.nullable)
+            for name, field in fields.items()
+        )
+
+    @classmethod
+    def decode(cls, data, strings=False):
+        """
+        Valida un dizionario JSON (o la query string con strings=True) e
+        restituisce un'istanza dello schema; solleva ValidationError.
+        """
+        if not hasattr(data, "get"):
+            raise ValidationError({"body": "deve essere un oggetto JSON."})
+        instance = cls.__new__(cls)
+        provided = set()
+        errors = {}
+        for name, key, convert, required, default, nullable in cls._plan:
+            value = data.get(key, _UNSET)
+            if value is None or value == "":
+                if nullable:
+                    setattr(instance, name, None)
+                    provided.add(name)
+                    continue
+                value = _UNSET  # null e stringa vuota valgono come campo assente
+            if value is _UNSET:
+                if required:
+                    errors[key] = "campo obbligatorio."
+                else:
+                    setattr(instance, name, default() if callable(default) else default)
+                continue
+            try:
+                setattr(instance, name, convert(value, strings))
+                provided.add(name)
+            except ValidationError as e:
+                errors.update({f"{key}{sub}": reason for sub, reason in e.fields.items()})
+            except (ValueError, TypeError) as e:
+                errors[key] = str(e)
+
+        if not errors:
+            instance._provided = provided
+            errors = instance.check() or {}
+        if errors:
+            raise ValidationError(errors)
+        return instance
+
+    def check(self):
+        """
+        Controlli tra più campi, dopo le conversioni: restituisce {campo: motivo} o None.
+        """
+        return None
+
+    def is_set(self, name):
+        return name in self._provided
+
+    def as_dict(self, exclude_unset=False):
+        return {
+            name: getattr(self, name)
+            for name in self._fields
+            if not exclude_unset or name in self._provided
+        }
+
+
+def validate(body=None, query=None):
+    """
+    Decoratore: valida il body JSON e/o la query string prima della view,
+    che li riceve negli argomenti 'body' e 'query'. Va messo dopo
+    jwt_required/admin_required, così l'autenticazione resta il primo controllo.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                if body is not None:
+                    data = request.get_json(silent=True)
+                    if not isinstance(data, dict):
+                        raise ValidationError({"body": "il corpo della richiesta deve essere un oggetto JSON."})
+                    kwargs["body"] = body.decode(data)
+                if query is not None:
+                    kwargs["query"] = query.decode(request.args, strings=True)
+            except ValidationError as e:
+                return e.response()
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _range_error(schema, inclusive=False):
+    if schema.start_date is None or schema.end_date is None:
+        return None
+    if schema.start_date > schema.end_date or (not inclusive and schema.start_date == schema.end_date):
+        return {"start_date": "la data di inizio deve essere antecedente alla data di fine."}
+    return None
+
+
+########################## USERS ##########################
+
+
+class RegisterBody(Schema):
+    name = Str(max_length=100)
+    surname = Str(max_length=100)
+    password = Str()
+    email = Str(max_length=120)
+    bday = Date()
+    place = Str(max_length=100)
+
+
+class LoginBody(Schema):
+    email = Str()
+    password = Str(strip=False)
+
+
+class ProfileUpdateBody(Schema):
+    name = Str(required=False, max_length=100)
+    surname = Str(required=False, max_length=100)
+    email = Str(required=False, max_length=120)
+    bday = Date(required=False)
+    place = Str(required=False, max_length=100)
+
+
+class AdminUserUpdateBody(Schema):
+    name = Str(required=False, max_length=100)
+    surname = Str(required=False, max_length=100)
+    bday = Date(required=False)
+    place = Str(required=False, max_length=100)
+    role = Str(required=False, choices=("admin", "user"))
+
+
+class ChangePasswordBody(Schema):
+    current_password = Str()
+    new_password = Str()
+
+
+class PasswordResetRequestBody(Schema):
+    email = Str()
+
+
+class PasswordResetBody(Schema):
+    new_password = Str(strip=False)
+
+
+######################### VEHICLES #########################
+
+
+class VehicleBody(Schema):
+    brand = Str(max_length=100)
+    model = Str(max_length=100)
+    year = Int(min=1900)
+    price_per_hour = Number(min=0)
+    license_plate = Str(max_length=20)
+    driving_license = Str(max_length=10)
+    power = Str(required=False, max_length=50, nullable=True)
+    engine_size = Number(required=False, min=0, nullable=True)
+    fuel_type = Str(required=False, max_length=50, nullable=True)
+    description = Str(required=False, min_length=0, nullable=True)
+    image_url = Str(required=False, max_length=255, nullable=True)
+    deposit = Number(min=0)
+    is_active = Bool(default=True)
+
+
+class VehicleUpdateBody(Schema):
+    vehicle_type = Str(required=False, max_length=50)
+    brand = Str(required=False, max_length=100)
+    model = Str(required=False, max_length=100)
+    year = Int(required=False, min=1900)
+    price_per_hour = Number(required=False, min=0)
+    license_plate = Str(required=False, max_length=20)
+    driving_license = Str(required=False, max_length=10)
+    power = Str(required=False, max_length=50, nullable=True)
+    engine_size = Number(required=False, min=0, nullable=True)
+    fuel_type = Str(required=False, max_length=50, nullable=True)
+    description = Str(required=False, min_length=0, nullable=True)
+    image_url = Str(required=False, max_length=255, nullable=True)
+    deposit = Number(required=False, min=0)
+    is_active = Bool(required=False)
+
+
+class DateRangeQuery(Schema):
+    start_date = DateTime()
+    end_date = DateTime()
+
+    def check(self):
+        return _range_error(self)
+
+
+class FleetQuotesQuery(DateRangeQuery):
+    accessories = List(Str(), default=list)
+
+
+class QuoteItem(Schema):
+    vehicle_id = Int(min=1)
+    start_date = DateTime()
+    end_date = DateTime()
+    accessories = List(Any(), default=list)
+
+
+class QuotesBody(Schema):
+    items = List(QuoteItem, min_items=1, max_items=Config.PRICING_MAX_BATCH)
+
+
+class RateRuleBody(Schema):
+    """
+    Campi di una regola tariffaria: null o "" azzerano un filtro.
+    """
+    name = Str(required=False, max_length=100)
+    vehicle_id = Int(required=False, min=1, nullable=True)
+    vehicle_type = Str(required=False, max_length=50, nullable=True)
+    start_date = Date(required=False, nullable=True)  # Primo giorno incluso
+    end_date = Date(required=False, nullable=True)    # Ultimo giorno incluso
+    weekdays = Any(required=False, nullable=True)     # "5,6" oppure [5, 6], lunedì = 0
+    hour_from = Int(required=False, min=0, max=24, nullable=True)
+    hour_to = Int(required=False, min=0, max=24, nullable=True)
+    multiplier = Number(required=False, positive=True, decimal=True)
+    is_active = Bool(required=False)
+
+    def check(self):
+        if self.is_set("weekdays") and self.weekdays is not None:
+            try:
+                parts = self.weekdays if isinstance(self.weekdays, list) else str(self.weekdays).split(",")
+                days = sorted({int(str(day).strip()) for day in parts if str(day).strip()})
+            except ValueError:
+                days = None
+            if days is None or any(day < 0 or day > 6 for day in days):
+                return {"weekdays": "i giorni della settimana vanno da 0 (lunedì) a 6 (domenica)."}
+            self.weekdays = ",".join(str(day) for day in days)
+        return _range_error(self, inclusive=True)
+
+
+class RateRuleCreateBody(RateRuleBody):
+    name = Str(max_length=100)
+    multiplier = Number(positive=True, decimal=True)
+
+
+######################## BOOKINGS #########################
+
+
+class AvailabilityBody(Schema):
+    moto_id = Int(min=1)
+    start_date = DateTime()
+    end_date = DateTime()
+
+    def check(self):
+        return _range_error(self)
+
+
+class CartItemBody(AvailabilityBody):
+    price = Number(min=0)
+    accessories = List(Any(), default=list)
+
+
+class BookingBody(Schema):
+    bike_id = Int(min=1)
+    start_date = DateTime()
+    end_date = DateTime()
+    total_price = Number(min=0)
+    accessories = List(Any(), default=list)
+    dl_type = Str(max_length=10)
+    dl_expiration = Date()
+    dl_number = Str(max_length=50)
+    helmet_size = Str(required=False, max_length=10, nullable=True)
+    gloves_size = Str(required=False, max_length=10, nullable=True)
+    pickup = Bool(default=False)
+    return_ = Bool(default=False)
+
+    def check(self):
+        return _range_error(self)
+
+
+class BookingUpdateBody(Schema):
+    """
+    Campi modificabili dal cliente: prezzo, stato, pagamento e ritiro hanno endpoint dedicati.
+    """
+    start_date = DateTime(required=False)
+    end_date = DateTime(required=False)
+    accessories = List(Any(), required=False)
+    dl_type = Str(required=False, max_length=10)
+    dl_expiration = Date(required=False)
+    dl_number = Str(required=False, max_length=50)
+    helmet_size = Str(required=False, max_length=10, nullable=True)
+    gloves_size = Str(required=False, max_length=10, nullable=True)
+
+    def check(self):
+        return _range_error(self)
+
+
+class CartSubmitBody(Schema):
+    dl_type = Str(default="A", max_length=10)
+    dl_expiration = Date(default=date.today)
+    dl_number = Str(default="DL000000", max_length=50)
+    helmet_size = Str(default="M", max_length=10)
+    gloves_size = Str(default="M", max_length=10)
+
+
+class ConflictCheckBody(Schema):
+    start_date = DateTime()
+    end_date = DateTime()
+
+    def check(self):
+        return _range_error(self)
+
+
+class BookingsByNameQuery(Schema):
+    first_name = Str()
+    last_name = Str()
+
+
+class GenerateCodeBody(Schema):
+    bike_id = Int(min=1)
+    booking_id = Int(min=1)
+    # Le date entrano nell'hash del codice così come inviate: restano stringhe
+    start_date = Str()
+    end_date = Str()
+
+
+class AddCodeBody(Schema):
+    booking_id = Int(min=1)
+    generated_code = Int(min=0)
+
+
+class EmailBody(Schema):
+    subject = Str(max_length=255)
+    body = Str()
+
+
+class ArchiveQuery(Schema):
+    include_archived = Bool(default=False)
+
+
+class BookingSearchQuery(Schema):
+    start_date = DateTime(required=False)
+    end_date = DateTime(required=False)
+    status = Str(required=False, lower=True, choices=("active", "cancelled"))
+    payment = Str(required=False, lower=True, choices=("paid", "unpaid"))
+    pickup = Bool(required=False)
+    returned = Bool(required=False)
+    vehicle_id = Int(required=False, min=1)
+    customer = Str(required=False)
+    code = Str(required=False)
+    sort = Str(default="start_date", choices=("start_date", "created_at", "id"))
+    order = Str(default="desc", lower=True, choices=("asc", "desc"))
+    page = Int(default=1, min=1)
+    per_page = Int(default=25, min=1)
+
+
+class SqlProfileQuery(Schema):
+    limit = Int(default=50, min=1)
+
+
+######################### ANALYTICS #########################
+
+
+class DayRangeQuery(Schema):
+    start_date = Date()
+    end_date = Date()
+    vehicle_id = Int(required=False, min=1)
+
+    def check(self):
+        return _range_error(self, inclusive=True)
+
+
+class RevenueQuery(DayRangeQuery):
+    group = Str(default="day", choices=("day", "month", "vehicle"))
+
+
+class TopVehiclesQuery(DayRangeQuery):
+    by = Str(default="revenue", choices=("revenue", "hours"))
+    limit = Int(default=10)
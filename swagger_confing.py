@@ -1,6 +1,124 @@
-from flask_swagger_ui import get_swaggerui_blueprint
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import yaml
+from flask import Response, request
+
+SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "swagger.yaml")
+HTTP_METHODS = {"get", "put", "post", "delete", "patch", "options", "head"}
+
+
+class SpecCache:
+    """
+    Carica swagger.yaml una sola volta (al primo uso), lo valida e tiene in
+    memoria le varianti YAML e JSON, già compresse con gzip e con ETag forte.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._variants = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def validate(spec):
+        if not isinstance(spec, dict):
+            raise ValueError("La specifica deve essere un oggetto YAML.")
+        if spec.get("swagger") != "2.0" and "openapi" not in spec:
+            raise ValueError("Versione della specifica mancante ('swagger: 2.0' o 'openapi').")
+        paths = spec.get("paths")
+        if not isinstance(paths, dict) or not paths:
+            raise ValueError("La specifica non contiene 'paths'.")
+        for path, operations in paths.items():
+            if not isinstance(operations, dict):
+                raise ValueError(f"Il path '{path}' non è valido.")
+            for method, operation in operations.items():
+                if method.lower() not in HTTP_METHODS:
+                    continue
+                if not isinstance(operation, dict) or "responses" not in operation:
+                    raise ValueError(f"{method.upper()} {path}: 'responses' mancante.")
+
+    @staticmethod
+    def _variant(body, mimetype):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        return {
+            "mimetype": mimetype,
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+            "etag": digest,
+        }
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            raw = f.read()
+
+        spec = yaml.safe_load(raw)
+        self.validate(spec)
+
+        as_json = json.dumps(spec, ensure_ascii=False, default=str).encode("utf-8")
+        return {
+            "yaml": self._variant(raw, "application/yaml"),
+            "json": self._variant(as_json, "application/json"),
+        }
+
+    def get(self, fmt):
+        if self._variants is None:
+            with self._lock:
+                if self._variants is None:
+                    self._variants = self._load()
+        return self._variants[fmt]
+
+    def response(self, fmt):
+        variant = self.get(fmt)
+
+        use_gzip = request.accept_encodings["gzip"] > 0
+        # 🏷️ ETag forte distinto per ogni rappresentazione (identity / gzip)
+        etag = f"{variant['etag']}-gz" if use_gzip else variant["etag"]
+
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(variant["gzip"] if use_gzip else variant["identity"], mimetype=variant["mimetype"])
+            if use_gzip:
+                response.headers["Content-Encoding"] = "gzip"
+
+        response.set_etag(etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "public, max-age=300"
+        return response
+
+
+spec_cache = SpecCache(SPEC_PATH)
+
+
+def init_spec(app):
+    """
+    Espone la specifica OpenAPI da memoria in formato YAML e JSON.
+    """
+    if app.config.get("SWAGGER_PRELOAD", False):
+        spec_cache.get("yaml")  # Errori di validazione all'avvio invece che alla prima richiesta
+
+    @app.route("/swagger.yaml")
+    def serve_swagger():
+        return spec_cache.response("yaml")
+
+    @app.route("/swagger.json")
+    def serve_swagger_json():
+        return spec_cache.response("json")
+
 
 def init_swagger(app):
+    """
+    Registra la Swagger UI solo se SWAGGER_UI_ENABLED è attivo: in produzione
+    il modulo flask_swagger_ui non viene nemmeno importato.
+    """
+    if not app.config.get("SWAGGER_UI_ENABLED", False):
+        return
+
+    from flask_swagger_ui import get_swaggerui_blueprint
+
     SWAGGER_URL = "/apidocs"
     API_URL = "/swagger.yaml"
 
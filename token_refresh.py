@@ -0,0 +1,99 @@
+import logging
+import time
+
+import jwt as pyjwt
+from flask import g, request
+from flask_jwt_extended import create_access_token, decode_token
+from werkzeug.datastructures import ImmutableMultiDict
+
+from models import TokenBlacklist
+
+logger = logging.getLogger(__name__)
+
+
+def _is_expired(token, leeway):
+    """
+    Legge solo il claim `exp` senza verificare la firma: la verifica completa
+    resta a @jwt_required. Un token illeggibile non viene considerato scaduto.
+    """
+    try:
+        claims = pyjwt.decode(token, options={"verify_signature": False})
+    except pyjwt.PyJWTError:
+        return False
+    exp = claims.get("exp")
+    return exp is not None and exp <= time.time() + leeway
+
+
+def _refresh_claims(refresh_token):
+    """
+    Verifica firma, scadenza, tipo e blacklist del refresh token.
+    Restituisce i claim oppure None se il token non è utilizzabile.
+    """
+    try:
+        claims = decode_token(refresh_token)
+    except Exception:
+        return None
+    if claims.get("type") != "refresh" or TokenBlacklist.is_token_blacklisted(claims["jti"]):
+        return None
+    return claims
+
+
+def init_token_refresh(app):
+    """
+    Rinnovo silenzioso dell'access token: se il cookie access_token è scaduto
+    ma il refresh_token è valido, viene emesso un nuovo access token, la
+    richiesta originale prosegue con quello e il cookie viene aggiornato nella
+    risposta. Il client non deve ripetere la richiesta.
+    """
+    if not app.config.get("JWT_SILENT_REFRESH", True):
+        return
+
+    access_cookie = app.config.get("JWT_ACCESS_COOKIE_NAME", "access_token")
+    refresh_cookie = app.config.get("JWT_REFRESH_COOKIE_NAME", "refresh_token")
+    leeway = app.config.get("JWT_SILENT_REFRESH_LEEWAY", 0)
+
+    @app.before_request
+    def _silent_refresh():
+        access_token = request.cookies.get(access_cookie)
+        refresh_token = request.cookies.get(refresh_cookie)
+        if not access_token or not refresh_token or not _is_expired(access_token, leeway):
+            return
+
+        claims = _refresh_claims(refresh_token)
+        if claims is None:
+            # Ci penserà expired_token_loader a rispondere 401
+            return
+
+        new_access_token = create_access_token(
+            identity=claims["sub"],
+            additional_claims={"role": claims.get("role")},
+            expires_delta=app.config["JWT_ACCESS_TOKEN_EXPIRES"]
+        )
+
+        # 🔁 La richiesta corrente prosegue con il nuovo token
+        cookies = request.cookies.to_dict(flat=False)
+        cookies[access_cookie] = [new_access_token]
+        request.cookies = ImmutableMultiDict(cookies)
+        g._refreshed_access_token = new_access_token
+
+        logger.info("Access token rinnovato", extra={"event": "auth.token_refreshed", "user_id": claims["sub"]})
+
+    @app.after_request
+    def _set_refreshed_cookie(response):
+        new_access_token = g.get("_refreshed_access_token")
+        if new_access_token is None:
+            return response
+
+        # La risposta imposta già il cookie (login, logout, /refresh): non sovrascriverlo
+        if any(header.startswith(f"{access_cookie}=") for header in response.headers.getlist("Set-Cookie")):
+            return response
+
+        response.set_cookie(
+            access_cookie,
+            new_access_token,
+            httponly=True,
+            secure=True,
+            samesite="None",
+            path="/"
+        )
+        return response